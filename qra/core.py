@@ -12,6 +12,26 @@ from email.mime.base import MIMEBase
 import markdown
 from bs4 import BeautifulSoup
 from .templates import TemplateManager
+from .walker import ParallelWalker
+
+
+def _find_files(directory, extensions, max_depth, verbose=False):
+    """Znajdź pliki o podanych rozszerzeniach do max_depth poziomów w głąb.
+
+    Katalogi są przeglądane równolegle (os.scandir), ukryte katalogi są
+    pomijane. Zwraca listę par (ścieżka, głębokość) posortowaną według
+    ścieżki, niezależnie od kolejności, w jakiej kończą się wątki.
+    """
+    def report(e):
+        if verbose:
+            if isinstance(e, PermissionError):
+                print(f"Brak uprawnień do: {e.filename}")
+            else:
+                print(f"Błąd przeszukiwania {e.filename}: {e}")
+
+    walker = ParallelWalker(extensions, max_depth=max_depth, skip_hidden=True,
+                            follow_symlinks=True, onerror=report)
+    return sorted((entry.path, depth) for entry, depth in walker.walk([directory]))
 
 
 class MHTMLProcessor:
@@ -466,38 +486,8 @@ class MHTMLProcessor:
             print(f"Rozpoczynanie wyszukiwania w: {search_path}")
             print(f"Maksymalna głębokość: {max_depth}")
 
-        def find_mhtml_files(directory, base_path, current_depth=0):
-            """Rekurencyjnie znajdź pliki MHTML/EML z ograniczeniem głębokości"""
-            found_files = []
-
-            if current_depth > max_depth:
-                return found_files
-
-            try:
-                for item in os.listdir(directory):
-                    item_path = os.path.join(directory, item)
-
-                    if os.path.isfile(item_path) and item.lower().endswith(('.mhtml', '.eml')):
-                        relative_depth = current_depth
-                        found_files.append((item_path, relative_depth))
-
-                    elif os.path.isdir(item_path) and current_depth < max_depth:
-                        # Rekurencyjnie przeszukaj podkatalogi
-                        if not item.startswith('.'):  # Pomiń ukryte katalogi
-                            found_files.extend(
-                                find_mhtml_files(item_path, base_path, current_depth + 1)
-                            )
-            except PermissionError:
-                if verbose:
-                    print(f"Brak uprawnień do: {directory}")
-            except Exception as e:
-                if verbose:
-                    print(f"Błąd przeszukiwania {directory}: {e}")
-
-            return found_files
-
         # Znajdź wszystkie pliki MHTML/EML w określonej głębokości
-        mhtml_files = find_mhtml_files(search_path, search_path, 0)
+        mhtml_files = _find_files(search_path, ('.mhtml', '.eml'), max_depth, verbose)
 
         if verbose:
             print(f"Znaleziono {len(mhtml_files)} plików MHTML/EML do przeszukania")
@@ -852,38 +842,8 @@ QRA Editor
             print(f"Rozpoczynanie wyszukiwania w: {search_path}")
             print(f"Maksymalna głębokość: {max_depth}")
 
-        def find_mhtml_files(directory, base_path, current_depth=0):
-            """Rekurencyjnie znajdź pliki MHTML z ograniczeniem głębokości"""
-            found_files = []
-
-            if current_depth > max_depth:
-                return found_files
-
-            try:
-                for item in os.listdir(directory):
-                    item_path = os.path.join(directory, item)
-
-                    if os.path.isfile(item_path) and item.lower().endswith('.mhtml'):
-                        relative_depth = current_depth
-                        found_files.append((item_path, relative_depth))
-
-                    elif os.path.isdir(item_path) and current_depth < max_depth:
-                        # Rekurencyjnie przeszukaj podkatalogi
-                        if not item.startswith('.'):  # Pomiń ukryte katalogi
-                            found_files.extend(
-                                find_mhtml_files(item_path, base_path, current_depth + 1)
-                            )
-            except PermissionError:
-                if verbose:
-                    print(f"Brak uprawnień do: {directory}")
-            except Exception as e:
-                if verbose:
-                    print(f"Błąd przeszukiwania {directory}: {e}")
-
-            return found_files
-
         # Znajdź wszystkie pliki MHTML w określonej głębokości
-        mhtml_files = find_mhtml_files(search_path, search_path, 0)
+        mhtml_files = _find_files(search_path, ('.mhtml',), max_depth, verbose)
 
         if verbose:
             print(f"Znaleziono {len(mhtml_files)} plików MHTML do przeszukania")
@@ -0,0 +1,347 @@
+"""Parallel directory walker shared by ``qra search`` and ``search.py``."""
+import os
+import queue
+import re
+import threading
+from collections import deque
+from typing import Callable, Dict, Generator, Iterable, List, Optional, Tuple
+
+
+class _Loop(Exception):
+    """A directory was reached again through one of its own descendants"""
+
+
+class ParallelWalker:
+    """Multi-threaded directory walker built on ``os.scandir``.
+
+    Every thread owns a deque of directories: it takes work from its own end
+    (depth-first, good locality) and steals from the other end of another
+    thread's deque when it runs dry. Entry types come from the cached
+    ``DirEntry`` data, so on most filesystems a directory costs one
+    ``scandir`` and no per-entry ``stat``. ``scandir`` releases the GIL,
+    so on high-latency storage (NFS, SMB) many directory reads overlap.
+
+    Matching files are yielded as ``(DirEntry, depth)`` pairs, where depth is
+    that of the directory holding the file (the roots are depth 0).
+
+    With ``dedupe`` each physical file is yielded once; further paths to it
+    (hardlinks, symlinks, bind mounts) are passed to
+    ``onalias(alias_path, first_path)`` instead. A symlink or bind mount
+    whose target is walked anyway is resolved by path; only hardlinked files
+    and link targets outside the walk are remembered by ``(st_dev, st_ino)``,
+    so memory does not grow with the number of files. A directory that is
+    its own ancestor (symlink or bind-mount loop) is not entered.
+
+    ``ondir(path, file_paths, subdirs)`` is called once per directory taken
+    off the queue, before its files are yielded, with the files it holds and
+    the subdirectories queued from it; a caller can track the walk frontier
+    from it to resume an interrupted walk.
+
+    An exception raised by one of the callbacks stops the walk and is
+    re-raised from ``walk``.
+    """
+
+    def __init__(
+        self,
+        extensions: Optional[Tuple[str, ...]] = None,
+        max_depth: Optional[int] = None,
+        skip_hidden: bool = False,
+        follow_symlinks: bool = False,
+        workers: Optional[int] = None,
+        queue_size: int = 1024,
+        onerror: Optional[Callable[[OSError], None]] = None,
+        dedupe: bool = False,
+        onalias: Optional[Callable[[str, str], None]] = None,
+        seen: Optional[Dict[Tuple[int, int], str]] = None,
+        ondir: Optional[Callable[[str, List[str], List[str]], None]] = None,
+    ):
+        # Lower-case file name suffixes to yield; None yields every file
+        self.extensions = (
+            tuple(ext.lower() for ext in extensions) if extensions else None
+        )
+        self.max_depth = max_depth
+        # Skip directories whose name starts with a dot
+        self.skip_hidden = skip_hidden
+        # Descend into symlinked directories
+        self.follow_symlinks = follow_symlinks
+        self.workers = workers or min(16, (os.cpu_count() or 4) * 2)
+        self.queue_size = queue_size
+        self.onerror = onerror
+        self.dedupe = dedupe
+        self.onalias = onalias
+        # (st_dev, st_ino) -> first path seen of hardlinked files and of link
+        # targets outside the walk; may be shared between walkers
+        self.seen = {} if seen is None else seen
+        self.ondir = ondir
+        self.loops = 0
+        self._lock = threading.Lock()
+        # Walked roots, and bind mount points with their sources, for resolving links
+        self._roots: List[Tuple[str, str]] = []
+        self._mounts: Dict[str, str] = {}
+
+    def walk(
+        self, roots: Iterable[str]
+    ) -> Generator[Tuple[os.DirEntry, int], None, None]:
+        """Walk roots in parallel, yielding matching files as they are found"""
+        roots = [os.fspath(root) for root in roots]
+        deques = [deque() for _ in range(self.workers)]
+        for i, root in enumerate(roots):
+            deques[i % self.workers].append((root, 0, (), None))
+        if self.dedupe:
+            self._roots = [(os.path.realpath(root), root) for root in roots]
+            self._mounts = _bind_mounts()
+
+        state = {"pending": sum(len(d) for d in deques)}
+        idle = threading.Condition()
+        stop = threading.Event()
+        results = queue.Queue(maxsize=self.queue_size)
+        done = object()
+        errors = []
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def take(index: int):
+            try:
+                return deques[index].pop()
+            except IndexError:
+                pass
+            for offset in range(1, self.workers):
+                try:
+                    return deques[(index + offset) % self.workers].popleft()
+                except IndexError:
+                    continue
+            return None
+
+        def run(index: int):
+            try:
+                while not stop.is_set():
+                    task = take(index)
+                    if task is None:
+                        with idle:
+                            if state["pending"] == 0:
+                                idle.notify_all()
+                                return
+                            idle.wait(0.05)
+                        continue
+                    try:
+                        if not visit(index, *task):
+                            return
+                    finally:
+                        # Counted done even if a callback raised, or the
+                        # other threads would wait for it forever
+                        with idle:
+                            state["pending"] -= 1
+                            if state["pending"] == 0:
+                                idle.notify_all()
+            except BaseException as e:
+                # Re-raised by the consumer; the remaining threads drain the other deques
+                errors.append(e)
+            finally:
+                put(done)
+
+        def visit(
+            index: int, path: str, depth: int, ancestors: Tuple, alias_of: Optional[str]
+        ) -> bool:
+            """List one directory and queue its contents.
+
+            alias_of is the path the directory is walked under elsewhere, when
+            path reaches it through a link; its files are then only reported
+            as aliases. Returns False once the walk is stopped.
+            """
+            try:
+                if self.dedupe or self.follow_symlinks:
+                    st = os.stat(path)
+                    identity = (st.st_dev, st.st_ino)
+                    if identity in ancestors:
+                        raise _Loop
+                    ancestors += (identity,)
+                    if self.dedupe and alias_of is None and depth:
+                        alias_of = self._linked_directory(path, identity)
+                files, subdirs = self._list_directory(path, depth)
+                if alias_of is not None:
+                    if self.onalias is not None:
+                        for entry in files:
+                            self.onalias(entry.path, os.path.join(alias_of, entry.name))
+                    files = []
+                elif self.dedupe:
+                    files = [entry for entry in files if self._first_sighting(entry)]
+            except _Loop:
+                files, subdirs = [], []
+                with self._lock:
+                    self.loops += 1
+            except OSError as e:
+                files, subdirs = [], []
+                if self.onerror is not None:
+                    self.onerror(e)
+
+            if self.max_depth is not None and depth >= self.max_depth:
+                subdirs = []
+            if self.ondir is not None:
+                self.ondir(path, [entry.path for entry in files], subdirs)
+            if subdirs:
+                deques[index].extend(
+                    (
+                        subdir,
+                        depth + 1,
+                        ancestors,
+                        alias_of and os.path.join(alias_of, os.path.basename(subdir)),
+                    )
+                    for subdir in subdirs
+                )
+                with idle:
+                    state["pending"] += len(subdirs)
+                    idle.notify_all()
+
+            for entry in files:
+                if not put((entry, depth)):
+                    return False
+            return True
+
+        threads = [
+            threading.Thread(target=run, args=(i,), name=f"walker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            running = len(threads)
+            while running:
+                item = results.get()
+                if errors:
+                    raise errors[0]
+                if item is done:
+                    running -= 1
+                    continue
+                yield item
+        finally:
+            stop.set()
+
+    def _list_directory(
+        self, path: str, depth: int
+    ) -> Tuple[List[os.DirEntry], List[str]]:
+        """Read one directory, returning (matching file entries, subdirectory paths)"""
+        files, subdirs = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                        if not (self.skip_hidden and entry.name.startswith(".")):
+                            subdirs.append(entry.path)
+                    elif self.matches(entry.name) and entry.is_file():
+                        files.append(entry)
+                except OSError:
+                    continue
+        return files, subdirs
+
+    def _first_sighting(self, entry: os.DirEntry) -> bool:
+        """Whether a file is yielded here, or reported as an alias of another path"""
+        try:
+            st = entry.stat()
+            if entry.is_symlink():
+                target = os.path.realpath(entry.path)
+                directory = self._walked_path(os.path.dirname(target))
+                if directory is not None and self.matches(os.path.basename(target)):
+                    name = os.path.basename(target)
+                    return self._alias(entry.path, os.path.join(directory, name))
+            elif st.st_nlink <= 1:
+                # The only path to it
+                return True
+        except OSError:
+            return True
+        with self._lock:
+            first = self.seen.setdefault((st.st_dev, st.st_ino), entry.path)
+        return first == entry.path or self._alias(entry.path, first)
+
+    def _alias(self, alias_path: str, first_path: str) -> bool:
+        if self.onalias is not None:
+            self.onalias(alias_path, first_path)
+        return False
+
+    def _linked_directory(self, path: str, identity: Tuple[int, int]) -> Optional[str]:
+        """Path a directory reached through a symlink or bind mount is walked under.
+
+        None when path is not such a link, or is the first path seen to a
+        target outside the walk.
+        """
+        if os.path.islink(path):
+            target = os.path.realpath(path)
+        elif path in self._mounts:
+            target = self._mounts[path]
+        else:
+            return None
+        walked = self._walked_path(target)
+        if walked is not None:
+            return walked
+        with self._lock:
+            first = self.seen.setdefault(identity, path)
+        return None if first == path else first
+
+    def _walked_path(self, directory: str) -> Optional[str]:
+        """Path a real directory is listed under by this walk, or None if it is not"""
+        for real_root, root in self._roots:
+            if directory != real_root and not directory.startswith(
+                real_root.rstrip(os.sep) + os.sep
+            ):
+                continue
+            relative = os.path.relpath(directory, real_root)
+            parts = [] if relative == os.curdir else relative.split(os.sep)
+            if self.max_depth is not None and len(parts) > self.max_depth:
+                continue
+            if self.skip_hidden and any(part.startswith(".") for part in parts):
+                continue
+            return os.path.join(root, *parts)
+        return None
+
+    def matches(self, name: str) -> bool:
+        return self.extensions is None or name.lower().endswith(self.extensions)
+
+
+def _bind_mounts(mountinfo: str = "/proc/self/mountinfo") -> Dict[str, str]:
+    """Bind mount points mapped to the directory they show, from mountinfo.
+
+    A mount whose root is a subdirectory of a filesystem shows the same
+    directory as another mount of that filesystem, under another path.
+    """
+    try:
+        with open(mountinfo, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return {}
+
+    def unescape(field: str) -> str:
+        # Spaces, tabs, newlines and backslashes are written as octal escapes
+        return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+    mounts = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 5:
+            mounts.append((fields[2], unescape(fields[3]), unescape(fields[4])))
+
+    sources = {}
+    for device, root, mount_point in mounts:
+        if root == "/":
+            continue
+        # The shortest enclosing root of another mount of the same filesystem
+        for other_device, other_root, other_point in sorted(
+            mounts, key=lambda mount: len(mount[1])
+        ):
+            if (
+                other_device == device
+                and other_point != mount_point
+                and (
+                    root == other_root or root.startswith(other_root.rstrip("/") + "/")
+                )
+            ):
+                source = os.path.join(other_point, os.path.relpath(root, other_root))
+                sources[mount_point] = os.path.normpath(source)
+                break
+    return sources
@@ -9,8 +9,10 @@ Usage:
     mhtml-search --scan /path/to/search --query "SELECT * FROM data WHERE name LIKE '%John%'"
     mhtml-search --index --path /data
     mhtml-search --sql "SELECT file_path, json_data FROM mhtml_index WHERE age > 25"
+    mhtml-search --where "age > 25"
 """
 
+import errno
 import os
 import sys
 import json
@@ -18,18 +20,41 @@ import email
 import sqlite3
 import argparse
 import threading
+import queue
+import hashlib
+import collections
+import heapq
+import zlib
+import functools
+import itertools
+import contextlib
+import textwrap
+import struct
+import signal
+import multiprocessing
 import mimetypes
-import subprocess
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
-from typing import List, Dict, Any, Generator, Optional
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Executor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Generator, Optional, Tuple, Iterable, Iterator, Callable, Union
 import tempfile
+import shutil
+import tarfile
+import io
 import re
 import time
 from datetime import datetime
 
+from qra.walker import ParallelWalker
+
 # Try to import optional dependencies
+try:
+    import fcntl
+
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
 try:
     import duckdb
 
@@ -51,212 +76,1582 @@ class SearchResult:
     json_data: List[Dict[str, Any]]
     file_size: int
     modified_time: float
+    # Pre-serialized JSON objects, filled instead of json_data by process workers
+    json_texts: List[str] = field(default_factory=list)
+
+    def iter_json_texts(self) -> Generator[str, None, None]:
+        """Yield each JSON object as serialized text"""
+        if self.json_texts:
+            yield from self.json_texts
+        else:
+            for json_obj in self.json_data:
+                yield dumps_json(json_obj)
+
+
+@dataclass
+class ParseLimits:
+    """Per-file limits applied while indexing; None disables a limit"""
+    max_bytes: Optional[int] = None
+    max_parts: Optional[int] = None
+    # CPU seconds spent parsing one file (enforced in isolated worker processes)
+    max_seconds: Optional[float] = None
+
+    def __bool__(self) -> bool:
+        return any(limit is not None for limit in (self.max_bytes, self.max_parts, self.max_seconds))
+
+
+class FileLimitExceeded(Exception):
+    """A file went over one of the per-file ParseLimits"""
+
+
+def dumps_json(json_obj: Any) -> str:
+    """Serialize a JSON object in the compact form stored in the index"""
+    return json.dumps(json_obj, ensure_ascii=False, separators=(',', ':'))
+
+
+# Object keys that can be written unquoted in a JSON path
+_PLAIN_KEY = re.compile(r'[A-Za-z_][A-Za-z0-9_]*\Z')
+# Longer strings are left to full-text search rather than the value table
+MAX_VALUE_TEXT = 1024
+
+
+def flatten_json(value: Any, path: str = '$') -> Generator[Tuple[str, Optional[str], Optional[float], Optional[int]], None, None]:
+    """Yield (json_path, value_text, value_num, value_bool) for each scalar leaf.
+
+    Paths use SQLite JSON path syntax ($.a.b, $."odd key"); array elements
+    are all stored under [*], so positions are not indexed. Nulls and
+    strings longer than MAX_VALUE_TEXT are skipped.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            key_path = f'{path}.{key}' if _PLAIN_KEY.match(key) else f'{path}.{json.dumps(key)}'
+            yield from flatten_json(item, key_path)
+    elif isinstance(value, list):
+        for item in value:
+            yield from flatten_json(item, path + '[*]')
+    elif isinstance(value, bool):
+        yield path, None, None, int(value)
+    elif isinstance(value, (int, float)):
+        yield path, None, float(value), None
+    elif isinstance(value, str) and len(value) <= MAX_VALUE_TEXT:
+        yield path, value, None, None
+
+
+# path op value, e.g.  age > 25  |  address.city = "Paris"  |  tags[*] ~ 'red%'
+_PREDICATE = re.compile(r'\s*(?P<path>.+?)\s*(?P<op>==|!=|<=|>=|=|<|>|~)\s*(?P<value>.+?)\s*\Z')
+
+
+def compile_predicate(predicate: str) -> Tuple[str, List[Any]]:
+    """Compile a 'path op value' predicate into a json_values lookup.
+
+    Returns SQL selecting matching record ids, and its parameters. Numbers
+    compare with value_num, true/false with value_bool and anything else
+    (quoted or bare) with value_text; '~' is a LIKE pattern match.
+    """
+    match = _PREDICATE.match(predicate)
+    if not match:
+        raise ValueError(f"Expected 'path op value', got: {predicate!r}")
+    path, op, raw = match.group('path', 'op', 'value')
+
+    if not path.startswith('$'):
+        path = '$' + path if path.startswith('[') else '$.' + path
+    if re.search(r'\[\d+\]', path):
+        raise ValueError(f"Array positions are not indexed, use [*]: {path}")
+
+    if raw[0] == raw[-1] == "'" and len(raw) > 1:
+        value = raw[1:-1]
+    else:
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+
+    op = '=' if op == '==' else op
+    if op == '~':
+        column, op, value = 'value_text', 'LIKE', str(value)
+    elif isinstance(value, bool):
+        if op not in ('=', '!='):
+            raise ValueError(f"Booleans only support = and !=: {predicate!r}")
+        column, value = 'value_bool', int(value)
+    elif isinstance(value, (int, float)):
+        column, value = 'value_num', float(value)
+    elif isinstance(value, str):
+        column = 'value_text'
+    else:
+        raise ValueError(f"Unsupported value in predicate: {predicate!r}")
+
+    return f"SELECT record_id FROM json_values WHERE json_path = ? AND {column} {op} ?", [path, value]
+
+
+# Statement terminator, optionally followed by comments, at the end of user SQL
+_TRAILING_SEMICOLON = re.compile(r';(?:[\s;]|--[^\n]*|/\*.*?\*/)*\Z', re.DOTALL)
+
+
+def _subquery(sql: str) -> str:
+    """Parenthesize user SQL for use in FROM, so a trailing ';' or '--' comment cannot break out"""
+    sql = _TRAILING_SEMICOLON.sub('', sql.strip())
+    return f"(\n{sql}\n)"
+
+
+def file_digest(file_path: str) -> str:
+    """Stable content hash of a file"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, 1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bytes_digest(data: bytes) -> str:
+    """Content hash of data already in memory, equal to file_digest of the same bytes"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+MHTML_EXTENSIONS = ('.mhtml', '.mht')
+
+# Filesystems whose directory mtimes may be cached, coarse or not updated
+UNRELIABLE_DIR_MTIME_FS = {
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'fuse', 'fuse.sshfs',
+    'fuse.rclone', 'vfat', 'msdos', 'exfat',
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _mount_table() -> List[Tuple[str, str, str]]:
+    """(mount point, filesystem type, device) entries, longest mount point first"""
+    mounts = []
+    try:
+        with open('/proc/self/mounts', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3:
+                    mount_point = fields[1].replace('\\040', ' ')
+                    mounts.append((mount_point, fields[2], fields[0]))
+    except OSError:
+        pass
+    return sorted(mounts, key=lambda m: len(m[0]), reverse=True)
+
+
+# Filesystems served over the network, where latency rather than seeks limits reads
+NETWORK_FS = {
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'fuse.sshfs', 'fuse.rclone',
+    'ceph', 'glusterfs', 'fuse.glusterfs', 'lustre', 'afs',
+}
+
+
+def _filesystem_type(path: str) -> Optional[str]:
+    """Filesystem type of the mount containing path, None if unknown"""
+    path = os.path.realpath(path)
+    for mount_point, fs_type, _ in _mount_table():
+        if path == mount_point or path.startswith(mount_point.rstrip(os.sep) + os.sep):
+            return fs_type
+    return None
+
+
+def _sysfs_rotational(device_dir: str) -> Optional[bool]:
+    """Whether a /sys/block device (or any device it is built on) is rotational"""
+    for candidate in (device_dir, os.path.dirname(device_dir)):  # partition -> whole disk
+        flag = os.path.join(candidate, 'queue', 'rotational')
+        if not os.path.exists(flag):
+            continue
+        # device-mapper and md devices report their members under slaves/
+        slaves = os.path.join(candidate, 'slaves')
+        members = os.listdir(slaves) if os.path.isdir(slaves) else []
+        if members:
+            return any(_sysfs_rotational(os.path.realpath(os.path.join(slaves, m))) for m in members)
+        with open(flag, encoding='ascii') as f:
+            return f.read().strip() == '1'
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _block_device_kind(st_dev: int) -> str:
+    """'ssd', 'hdd' or 'unknown' for the block device with the given st_dev"""
+    if not sys.platform.startswith('linux'):
+        return 'unknown'
+    device_dir = os.path.realpath(f'/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}')
+    try:
+        rotational = _sysfs_rotational(device_dir)
+    except OSError:
+        rotational = None
+    if rotational is None:
+        return 'unknown'
+    return 'hdd' if rotational else 'ssd'
+
+
+def storage_kind(path: str) -> str:
+    """Classify the storage holding path as 'ssd', 'hdd', 'network' or 'unknown'"""
+    if _filesystem_type(path) in NETWORK_FS:
+        return 'network'
+    try:
+        return _block_device_kind(os.stat(path).st_dev)
+    except OSError:
+        return 'unknown'
+
+
+# FIEMAP ioctl: map a file's logical extents to physical disk offsets (Linux)
+FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_HEADER = struct.Struct('=QQIIII')
+_FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+
+
+def _physical_offset(path: str) -> Optional[int]:
+    """Physical byte offset of a file's first extent, None if FIEMAP is unavailable"""
+    if not HAS_FCNTL:
+        return None
+    request = bytearray(_FIEMAP_HEADER.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(_FIEMAP_EXTENT.size))
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    if _FIEMAP_HEADER.unpack_from(request)[3] == 0:  # fm_mapped_extents
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP_HEADER.size)[1]  # fe_physical
+
+
+def _advise_willneed(path: str):
+    """Ask the kernel to start reading a file into the page cache"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class AdaptiveConcurrency:
+    """AIMD controller for the number of in-flight file reads.
+
+    Completions are grouped into windows. While a window's throughput keeps
+    up with the previous one the limit grows by one (additive increase);
+    when latency has climbed well above the best seen without a throughput
+    gain, the storage is saturated and the limit shrinks by a quarter
+    (multiplicative decrease).
+    """
+
+    WINDOW_SECONDS = 0.5
+    LATENCY_TOLERANCE = 2.0
+    DECREASE_FACTOR = 0.75
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(maximum or initial, self.minimum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._completed = 0
+        self._latency_total = 0.0
+        self._last_throughput = 0.0
+        self._best_latency = None
+
+    @classmethod
+    def fixed(cls, limit: int) -> 'AdaptiveConcurrency':
+        return cls(limit, limit, limit)
+
+    @classmethod
+    def for_paths(cls, paths: List[str]) -> Tuple['AdaptiveConcurrency', str]:
+        """Controller sized for the slowest kind of storage among paths"""
+        cpu_count = os.cpu_count() or 4
+        kinds = {storage_kind(path) for path in paths}
+        # initial, maximum
+        limits = {
+            'hdd': (min(8, cpu_count * 2), 32),
+            'ssd': (min(64, cpu_count * 8), 128),
+            'network': (min(64, cpu_count * 8), 256),
+            'unknown': (min(16, cpu_count * 4), 128),
+        }
+        kind = next((k for k in ('hdd', 'network', 'unknown', 'ssd') if k in kinds), 'unknown')
+        initial, maximum = limits[kind]
+        return cls(initial, 2, maximum), kind
+
+    def record(self, latency: float):
+        """Account one completed read that took latency seconds"""
+        with self.lock:
+            self._completed += 1
+            self._latency_total += latency
+            elapsed = time.monotonic() - self._window_start
+            if elapsed < self.WINDOW_SECONDS or self._completed < self.limit:
+                return
+
+            throughput = self._completed / elapsed
+            latency = self._latency_total / self._completed
+            if self._best_latency is None or latency < self._best_latency:
+                self._best_latency = latency
+
+            if (latency > self._best_latency * self.LATENCY_TOLERANCE
+                    and throughput <= self._last_throughput):
+                self.limit = max(self.minimum, int(self.limit * self.DECREASE_FACTOR))
+            elif throughput >= self._last_throughput * 0.95:
+                self.limit = min(self.maximum, self.limit + 1)
+
+            self._last_throughput = throughput
+            self._window_start = time.monotonic()
+            self._completed = 0
+            self._latency_total = 0.0
+
+
+class DirectoryJournal:
+    """Per-directory change journal persisted alongside the index.
+
+    For every directory it stores the directory mtime, a digest of the child
+    listing and the MHTML files and subdirectories it contained. When a
+    directory's mtime is unchanged the cached listing is reused instead of
+    reading the directory and stat-ing its files. Directory mtimes change
+    when entries are added, removed or renamed, not when a file is edited in
+    place, so this is meant for write-once archives; a scan without the
+    journal still catches in-place edits.
+
+    Updates are staged and only become visible to later scans after
+    commit(), so an interrupted indexing run is rescanned next time. The
+    journal lives in the index database: it reads through the index's
+    reader pool and writes through its writer thread, so a scan never
+    contends with the writer for the database lock.
+    """
+
+    # Directories modified this close to the scan may change again within
+    # the same mtime tick, so their listing is not trusted next time
+    RACY_WINDOW_NS = 2_000_000_000
+    STAGE_BATCH = 1000
+
+    def __init__(self, index: 'Union[SQLiteIndex, ShardedIndex]'):
+        # A sharded index keeps the journal in its first shard
+        self.index = index.shards[0] if isinstance(index, ShardedIndex) else index
+
+        def create(conn: sqlite3.Connection):
+            for table in ('dir_journal', 'dir_journal_staged'):
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        dir_path TEXT PRIMARY KEY,
+                        mtime_ns INTEGER,
+                        digest TEXT,
+                        files TEXT,
+                        subdirs TEXT
+                    )
+                """)
+            # Leftovers of an interrupted run
+            conn.execute("DELETE FROM dir_journal_staged")
+
+        self.index._submit(create)
+        self.index.flush()
+        self.lock = threading.Lock()
+        self.scan_start_ns = time.time_ns()
+        self._staged = []
+        self._distrusted = set()
+
+    def is_reliable(self, path: str) -> bool:
+        """Whether directory mtimes on the filesystem holding path can be trusted"""
+        return _filesystem_type(path) not in UNRELIABLE_DIR_MTIME_FS
+
+    def get(self, dir_path: str) -> Optional[Tuple[int, str, List[str], List[str]]]:
+        """Cached (mtime_ns, digest, files, subdirs) of a directory"""
+        with self.index._reader() as conn:
+            row = conn.execute(
+                "SELECT mtime_ns, digest, files, subdirs FROM dir_journal WHERE dir_path = ?",
+                (dir_path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2]), json.loads(row[3])
+
+    @staticmethod
+    def listing_digest(files: List[str], subdirs: List[str]) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        for name in sorted(files):
+            digest.update(b'f' + name.encode('utf-8', 'surrogateescape') + b'\0')
+        for name in sorted(subdirs):
+            digest.update(b'd' + name.encode('utf-8', 'surrogateescape') + b'\0')
+        return digest.hexdigest()
+
+    def record(self, dir_path: str, mtime_ns: int, digest: str, files: List[str], subdirs: List[str]):
+        """Stage the current state of a directory"""
+        if mtime_ns >= self.scan_start_ns - self.RACY_WINDOW_NS:
+            mtime_ns = 0
+        self._stage((dir_path, mtime_ns, digest, json.dumps(files), json.dumps(subdirs)))
+
+    def distrust(self, dir_path: str):
+        """Have the next scan list a directory again, e.g. after one of its files failed to index"""
+        with self.lock:
+            self._distrusted.add(dir_path)
+
+    def forget_subtree(self, dir_path: str) -> List[str]:
+        """Stage removal of a vanished directory tree, returning the files it held"""
+        with self.index._reader() as conn:
+            rows = conn.execute(
+                "SELECT dir_path, files FROM dir_journal WHERE dir_path = ? OR (dir_path >= ? AND dir_path < ?)",
+                _subtree_range(dir_path)
+            ).fetchall()
+        removed = []
+        for path, files in rows:
+            removed.extend(os.path.join(path, name) for name in json.loads(files))
+            # A NULL listing marks the entry for deletion on commit
+            self._stage((path, None, None, None, None))
+        return removed
+
+    def _stage(self, row: Tuple):
+        with self.lock:
+            self._staged.append(row)
+            if len(self._staged) >= self.STAGE_BATCH:
+                self._flush_staged()
+
+    def _flush_staged(self):
+        rows, self._staged = self._staged, []
+        if rows:
+            self.index._submit(lambda conn: conn.executemany(
+                "INSERT OR REPLACE INTO dir_journal_staged VALUES (?, ?, ?, ?, ?)", rows))
+
+    def commit(self):
+        """Publish the staged directory states for the next scan"""
+        with self.lock:
+            self._flush_staged()
+            distrusted, self._distrusted = list(self._distrusted), set()
+
+            def publish(conn: sqlite3.Connection):
+                conn.execute("""
+                    DELETE FROM dir_journal WHERE dir_path IN
+                        (SELECT dir_path FROM dir_journal_staged WHERE files IS NULL)
+                """)
+                conn.execute("""
+                    INSERT OR REPLACE INTO dir_journal
+                    SELECT * FROM dir_journal_staged WHERE files IS NOT NULL
+                """)
+                # Like a racy mtime, no mtime matches 0
+                conn.executemany("UPDATE dir_journal SET mtime_ns = 0 WHERE dir_path = ?",
+                                 [(path,) for path in distrusted])
+                conn.execute("DELETE FROM dir_journal_staged")
+
+            self.index._submit(publish)
+            self.index.flush()
+            self.scan_start_ns = time.time_ns()
+
+
+class IndexCheckpoint:
+    """Progress of an indexing run, saved periodically so it can be resumed.
+
+    The frontier holds directories not yet listed, outstanding holds files
+    discovered but not yet handed to the index writer, and removed holds
+    files the directory journal saw disappear. A snapshot is saved through
+    the writer queue after the rows of every file already finished, so a
+    saved checkpoint never skips work that was not committed.
+    """
+
+    def __init__(self, roots: List[str], frontier: Iterable[str] = None,
+                 outstanding: Iterable[str] = (), removed: Iterable[str] = (), interval: float = 30.0):
+        self.roots = roots
+        # A fresh run starts from the roots themselves
+        self.resumed = frontier is not None
+        self.frontier = set(roots if frontier is None else frontier)
+        self.outstanding = set(outstanding)
+        # Shared with the scanner's removed_files once the walk starts
+        self.removed = list(removed)
+        self.interval = interval
+        self._next_save = time.monotonic() + interval
+        self._lock = threading.Lock()
+
+    def listed(self, dir_path: str, file_paths: List[str], subdirs: List[str]):
+        """Walker callback: a directory was read"""
+        with self._lock:
+            self.frontier.discard(dir_path)
+            self.frontier.update(subdirs)
+            self.outstanding.update(file_paths)
+
+    def finished(self, file_paths: Iterable[str]):
+        """Files whose outcome (indexed, unchanged, failed) has been queued to the index"""
+        with self._lock:
+            self.outstanding.difference_update(file_paths)
+
+    def due(self) -> bool:
+        """Whether the save interval has elapsed; claims the save when it has"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_save:
+                return False
+            self._next_save = now + self.interval
+            return True
+
+    def snapshot(self) -> Tuple[List[str], List[str], List[str], List[str]]:
+        with self._lock:
+            return list(self.roots), list(self.frontier), list(self.outstanding), list(self.removed)
+
+
+def _under(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def _subtree_range(root: str) -> Tuple[str, str, str]:
+    """Parameters of 'path = ? OR (path >= ? AND path < ?)', matching root and every path under it"""
+    # A root such as / already ends in the separator
+    prefix = root if root.endswith(os.sep) else root + os.sep
+    return root, prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def _within_any(path: str, directories: set) -> bool:
+    """Whether path lies under one of directories"""
+    parent = os.path.dirname(path)
+    while parent not in directories:
+        up = os.path.dirname(parent)
+        if up == parent:
+            return False
+        parent = up
+    return True
 
 
 class PlatformFileScanner:
     """Cross-platform file scanner optimized for different filesystems"""
 
-    def __init__(self, max_workers: int = None):
-        if max_workers is None:
-            # Auto-detect optimal thread count based on storage type
-            max_workers = self._detect_optimal_threads()
+    def __init__(self, max_workers: int = None, follow_symlinks: bool = False):
+        # Descend into symlinked directories (loops are detected and skipped)
+        self.follow_symlinks = follow_symlinks
+        # Fixed worker count; None adapts it to the storage being scanned
         self.max_workers = max_workers
         self.stats = {
             'files_found': 0,
             'files_processed': 0,
+            'dirs_skipped': 0,
             'errors': 0,
             'start_time': None
         }
+        # Files the journal saw disappear, roots walked in full, and directories
+        # that could not be listed, during the last scan
+        self.removed_files = []
+        self.full_walk_roots = []
+        self.unlisted_dirs = []
+        # (alias_path, first_path) pairs for files reachable through several paths
+        self.aliases = []
+        # Directory-reading threads; scandir releases the GIL, so more helps on NFS
+        self.walk_workers = min(32, (os.cpu_count() or 4) * 4)
+
+    # Files sorted together, and files advised ahead of the one being handed out
+    SCHEDULE_BATCH = 256
+    READAHEAD = 8
+
+    def schedule_reads(self, files: Iterable[str], order: str = 'inode') -> Generator[str, None, None]:
+        """Reorder files to follow their layout on disk.
+
+        Discovered files are sorted in batches by inode number, or by the
+        physical offset of their first extent with order='extent' (falling
+        back to the inode where FIEMAP is unsupported). While a file is
+        handed out, the next READAHEAD files are advised with
+        posix_fadvise(WILLNEED) so the disk streams them in order.
+        """
+        readahead = self.READAHEAD if hasattr(os, 'posix_fadvise') else 0
 
-    def _detect_optimal_threads(self) -> int:
-        """Detect optimal thread count based on CPU and storage"""
-        cpu_count = os.cpu_count() or 4
-
-        # Check if we're on SSD (heuristic approach)
-        if sys.platform == "win32":
-            # Windows - try to detect SSD via PowerShell
+        def layout_key(file_path: str) -> Tuple[int, int, int]:
             try:
-                result = subprocess.run([
-                    "powershell", "-Command",
-                    "Get-PhysicalDisk | Select-Object MediaType"
-                ], capture_output=True, text=True, timeout=5)
-                if "SSD" in result.stdout:
-                    return min(64, cpu_count * 8)  # SSD can handle more threads
-            except:
-                pass
-        else:
-            # Linux/macOS - check for SSD indicators
-            try:
-                # Check if main storage is SSD
-                result = subprocess.run([
-                    "lsblk", "-d", "-o", "name,rota"
-                ], capture_output=True, text=True, timeout=5)
-                if "0" in result.stdout:  # rota=0 means SSD
-                    return min(64, cpu_count * 8)
-            except:
-                pass
-
-        # Default to conservative thread count for HDD
-        return min(8, cpu_count * 2)
-
-    def find_mhtml_files(self, search_paths: List[str]) -> Generator[str, None, None]:
-        """Find all MHTML files in given paths using platform-optimized methods"""
+                st = os.stat(file_path)
+            except OSError:
+                return (0, 1, 0)
+            offset = _physical_offset(file_path) if order == 'extent' else None
+            if offset is not None:
+                return (st.st_dev, 0, offset)
+            return (st.st_dev, 1, st.st_ino)
+
+        for batch in _batched(files, self.SCHEDULE_BATCH):
+            batch.sort(key=layout_key)
+            advised = 0
+            for i, file_path in enumerate(batch):
+                while advised < min(len(batch), i + 1 + readahead):
+                    _advise_willneed(batch[advised])
+                    advised += 1
+                yield file_path
+
+    def concurrency_for(self, search_paths: List[str]) -> Tuple[AdaptiveConcurrency, str]:
+        """In-flight read controller for the given paths, and the detected storage kind"""
+        if self.max_workers:
+            return AdaptiveConcurrency.fixed(self.max_workers), 'fixed'
+        return AdaptiveConcurrency.for_paths([str(Path(p).resolve()) for p in search_paths])
+
+    def find_mhtml_files(self, search_paths: List[str], journal: Optional[DirectoryJournal] = None,
+                         checkpoint: Optional[IndexCheckpoint] = None) -> Generator[str, None, None]:
+        """Find all MHTML files in given paths with a parallel directory walk.
+
+        With a journal, only files in directories that changed since the last
+        committed scan are yielded; files that disappeared are collected in
+        removed_files. Roots on filesystems without reliable directory mtimes
+        are walked in full and listed in full_walk_roots.
+
+        With a checkpoint the walk frontier is tracked in it; a resumed
+        checkpoint yields its outstanding files first and walks only its
+        frontier instead of the roots.
+        """
         self.stats['start_time'] = time.time()
+        self.removed_files = []
+        if checkpoint is not None:
+            # Removals found before an interruption are not found again by the resumed walk
+            self.removed_files.extend(checkpoint.removed)
+            checkpoint.removed = self.removed_files
+        self.full_walk_roots = []
+        self.unlisted_dirs = []
+        self.aliases = []
+
+        roots = [str(Path(search_path).resolve()) for search_path in search_paths]
+        journaled = [root for root in roots if journal is not None and journal.is_reliable(root)]
+        self.full_walk_roots = [root for root in roots if root not in journaled]
+
+        def report(e: OSError):
+            print(f"Error scanning {e.filename}: {e.strerror}")
+            if e.filename is not None and e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                # What it holds is unknown, not gone: it is left out of the purge
+                self.unlisted_dirs.append(os.fsdecode(e.filename))
+
+        # Each physical file is yielded once; other paths to it are recorded as aliases
+        options = dict(workers=self.walk_workers, follow_symlinks=self.follow_symlinks, onerror=report,
+                       dedupe=True, onalias=lambda alias, first: self.aliases.append((alias, first)),
+                       seen={}, ondir=checkpoint.listed if checkpoint is not None else None)
+
+        full_walk_start, journaled_start = self.full_walk_roots, journaled
+        if checkpoint is not None and checkpoint.resumed:
+            _, frontier, outstanding, _ = checkpoint.snapshot()
+            full_walk_start = [path for path in frontier
+                               if any(_under(path, root) for root in self.full_walk_roots)]
+            journaled_start = [path for path in frontier if path not in full_walk_start]
+            for file_path in outstanding:
+                self.stats['files_found'] += 1
+                yield file_path
+
+        walks = []
+        if full_walk_start:
+            walker = ParallelWalker(MHTML_EXTENSIONS, **options)
+            walks.append(walker.walk(full_walk_start))
+        if journaled_start:
+            walker = JournaledWalker(journal, self, **options)
+            walks.append(walker.walk(journaled_start))
+
+        for walk in walks:
+            for entry, _ in walk:
+                self.stats['files_found'] += 1
+                yield entry.path
+
+
+class JournaledWalker(ParallelWalker):
+    """Parallel walker that reuses journaled listings of unchanged directories"""
+
+    def __init__(self, journal: DirectoryJournal, scanner: PlatformFileScanner, **kwargs):
+        super().__init__(MHTML_EXTENSIONS, **kwargs)
+        self.journal = journal
+        self.scanner = scanner
+        self.lock = threading.Lock()
 
-        for search_path in search_paths:
-            search_path = Path(search_path).resolve()
-
-            if sys.platform == "win32":
-                yield from self._scan_windows(search_path)
-            else:
-                yield from self._scan_unix(search_path)
-
-    def _scan_windows(self, path: Path) -> Generator[str, None, None]:
-        """Windows-optimized file scanning"""
+    def _list_directory(self, path: str, depth: int) -> Tuple[List[os.DirEntry], List[str]]:
         try:
-            # Use dir command for fast scanning on Windows
-            cmd = f'dir /s /b "{path}\\*.mhtml" "{path}\\*.mht"'
-            result = subprocess.run(
-                cmd, shell=True, capture_output=True, text=True,
-                encoding='utf-8', errors='ignore'
-            )
-
-            for line in result.stdout.strip().split('\n'):
-                if line and os.path.isfile(line):
-                    self.stats['files_found'] += 1
-                    yield line
-
-        except Exception as e:
-            print(f"Error scanning Windows path {path}: {e}")
-            # Fallback to Python scanning
-            yield from self._scan_python(path)
-
-    def _scan_unix(self, path: Path) -> Generator[str, None, None]:
-        """Unix-optimized file scanning using find command"""
-        try:
-            # Use find command for fast scanning on Unix systems
-            cmd = [
-                'find', str(path), '-type', 'f',
-                '(', '-name', '*.mhtml', '-o', '-name', '*.mht', ')',
-                '2>/dev/null'
-            ]
-
-            process = subprocess.Popen(
-                cmd, stdout=subprocess.PIPE, text=True,
-                bufsize=8192
-            )
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            # Vanished since its parent was listed; the parent's diff covers it
+            return [], []
 
-            for line in process.stdout:
-                file_path = line.strip()
-                if file_path and os.path.isfile(file_path):
-                    self.stats['files_found'] += 1
-                    yield file_path
+        cached = self.journal.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            with self.lock:
+                self.scanner.stats['dirs_skipped'] += 1
+            return [], [os.path.join(path, name) for name in cached[3]]
+
+        files, subdirs = super()._list_directory(path, depth)
+        file_names = [entry.name for entry in files]
+        subdir_names = [os.path.basename(subdir) for subdir in subdirs]
+
+        digest = self.journal.listing_digest(file_names, subdir_names)
+        if cached is not None and cached[1] != digest:
+            removed = [os.path.join(path, name) for name in set(cached[2]) - set(file_names)]
+            for name in set(cached[3]) - set(subdir_names):
+                removed.extend(self.journal.forget_subtree(os.path.join(path, name)))
+            with self.lock:
+                self.scanner.removed_files.extend(removed)
+        self.journal.record(path, mtime_ns, digest, file_names, subdir_names)
 
-        except Exception as e:
-            print(f"Error scanning Unix path {path}: {e}")
-            # Fallback to Python scanning
-            yield from self._scan_python(path)
-
-    def _scan_python(self, path: Path) -> Generator[str, None, None]:
-        """Pure Python fallback scanner"""
-        try:
-            for root, dirs, files in os.walk(path):
-                for file in files:
-                    if file.lower().endswith(('.mhtml', '.mht')):
-                        full_path = os.path.join(root, file)
-                        self.stats['files_found'] += 1
-                        yield full_path
-        except Exception as e:
-            print(f"Error in Python scan: {e}")
+        # Names may be unchanged after an atomic replace, so files are still
+        # yielded for the per-file fingerprint check
+        return files, subdirs
 
 
 class MHTMLParser:
     """Fast MHTML parser with JSON extraction"""
 
+    # Candidate JSON object starts: '{' followed by a quoted key
+    _OBJECT_START = re.compile(r'\{\s*"')
+    # String literals of a valid JSON prefix; the last may be cut off
+    _JSON_STRING = re.compile(r'"(?:[^"\\]|\\.)*"?', re.DOTALL)
+    # <script type="application/json"> / "application/ld+json" blocks
+    _JSON_SCRIPT_PATTERN = re.compile(
+        r'<script\b[^>]*\btype\s*=\s*["\']?application/(?:ld\+)?json["\']?[^>]*>(.*?)</script\s*>',
+        re.DOTALL | re.IGNORECASE
+    )
+    _decoder = json.JSONDecoder()
+
     @staticmethod
     def extract_json_from_mhtml(file_path: str) -> List[Dict[str, Any]]:
         """Extract JSON data from MHTML file"""
-        json_objects = []
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except Exception as e:
+            print(f"Error parsing MHTML {file_path}: {e}")
+            return []
+        return MHTMLParser.extract_json_from_bytes(data, file_path)
+
+    @staticmethod
+    def extract_json_from_bytes(data: bytes, file_path: str = '<bytes>',
+                                max_parts: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Extract JSON data from the raw contents of an MHTML file.
+
+        Raises FileLimitExceeded when the message has more than max_parts parts.
+        """
+        return [json_obj for _, json_obj in MHTMLParser.iter_json_records(data, file_path, max_parts)]
+
+    @staticmethod
+    def iter_json_records(data: bytes, file_path: str = '<bytes>',
+                          max_parts: Optional[int] = None) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+        """Yield (raw_text, json_object) for each JSON object in an MHTML file as it is found.
 
+        raw_text is the object's span in the decoded part, so a caller can
+        filter on it without serializing the object again.
+        """
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                msg = email.message_from_file(f)
+            msg = email.message_from_bytes(data)
 
             # Process all parts of MHTML
-            for part in msg.walk():
-                if part.get_content_type() in ['text/html', 'text/plain', 'application/json']:
+            for count, part in enumerate(msg.walk(), 1):
+                if max_parts is not None and count > max_parts:
+                    raise FileLimitExceeded(f"more than {max_parts} MIME parts")
+                content_type = part.get_content_type()
+                if content_type in ['text/html', 'text/plain', 'application/json', 'application/ld+json']:
                     content = part.get_payload(decode=True)
                     if content:
                         try:
                             content_str = content.decode('utf-8', errors='ignore')
-                            json_objects.extend(MHTMLParser._extract_json_from_content(content_str))
+                            if content_type in ('application/json', 'application/ld+json'):
+                                yield from MHTMLParser._iter_document_records(content_str)
+                            else:
+                                yield from MHTMLParser._iter_content_records(content_str)
+                        except FileLimitExceeded:
+                            raise
                         except Exception:
                             continue
 
+        except FileLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error parsing MHTML {file_path}: {e}")
 
-        return json_objects
+    @staticmethod
+    def _extract_json_document(content: str) -> List[Dict[str, Any]]:
+        """Decode a whole JSON document, falling back to scanning on failure"""
+        return [json_obj for _, json_obj in MHTMLParser._iter_document_records(content)]
+
+    @staticmethod
+    def _iter_document_records(content: str) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+        try:
+            value = json.loads(content)
+        except ValueError:
+            yield from MHTMLParser._iter_text_records(content)
+            return
+        if isinstance(value, dict):
+            if value:
+                yield content.strip(), value
+        else:
+            # Array items have no span of their own to hand back
+            for item in MHTMLParser._json_dicts(value):
+                yield dumps_json(item), item
+
+    @staticmethod
+    def _json_dicts(value: Any) -> List[Dict[str, Any]]:
+        """Top-level non-empty objects of a decoded document"""
+        if isinstance(value, dict):
+            return [value] if value else []
+        if isinstance(value, list):
+            return [item for item in value if isinstance(item, dict) and item]
+        return []
 
     @staticmethod
     def _extract_json_from_content(content: str) -> List[Dict[str, Any]]:
-        """Extract JSON objects from content string"""
-        json_objects = []
-
-        # Pattern 1: Look for JSON in script tags
-        script_pattern = r'<script[^>]*>(.*?)</script>'
-        for match in re.finditer(script_pattern, content, re.DOTALL | re.IGNORECASE):
-            script_content = match.group(1)
-            json_objects.extend(MHTMLParser._find_json_in_text(script_content))
-
-        # Pattern 2: Look for data-* attributes
-        data_pattern = r'data-[^=]*="({.*?})"'
-        for match in re.finditer(data_pattern, content):
+        """Extract JSON objects from content string in a single pass.
+
+        JSON script blocks are decoded as whole documents; everything between
+        them (other scripts, data-* attributes, inline text) is scanned once.
+        """
+        return [json_obj for _, json_obj in MHTMLParser._iter_content_records(content)]
+
+    @staticmethod
+    def _iter_content_records(content: str) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+        pos = 0
+        for match in MHTMLParser._JSON_SCRIPT_PATTERN.finditer(content):
+            yield from MHTMLParser._iter_text_records(content, pos, match.start())
+            yield from MHTMLParser._iter_document_records(match.group(1))
+            pos = match.end()
+        yield from MHTMLParser._iter_text_records(content, pos)
+
+    @staticmethod
+    def iter_json_spans(text: str, pos: int = 0,
+                        endpos: Optional[int] = None) -> Generator[Tuple[int, int, Any], None, None]:
+        """Yield (start, end, value) for each JSON object found in text[pos:endpos].
+
+        Candidates are located with a regex and consumed with
+        ``JSONDecoder.raw_decode``, so objects of any depth are decoded and
+        the scan resumes after the consumed span instead of re-reading it.
+        When a candidate fails to decode, the text before the failure was
+        valid JSON, so an object nested in it either closes before that
+        point or fails there too: nested candidates are decoded within the
+        failed span only, which keeps unterminated input linear. Candidates
+        that sit inside a string literal of the failed span are not nested
+        objects and are decoded against the whole text.
+        """
+        if endpos is None:
+            endpos = len(text)
+        # raw_decode cannot be told where to stop
+        window = text if endpos == len(text) else text[:endpos]
+        search = MHTMLParser._OBJECT_START.search
+        raw_decode = MHTMLParser._decoder.raw_decode
+        # Failure points of the candidates the scan is nested in, innermost last,
+        # the failed span (starting at base) nested candidates are decoded in
+        # and the next string literal of that span
+        limits = []
+        region, base = window, 0
+        quoted = literal = None
+
+        while pos < endpos:
+            match = search(window, pos, endpos)
+            if not match:
+                return
+            start = match.start()
+            while limits and start >= limits[-1]:
+                limits.pop()
+            if not limits:
+                region, base = window, 0
+            else:
+                while literal is not None and base + literal.end() <= start:
+                    literal = next(quoted, None)
+                if literal is not None and base + literal.start() < start:
+                    # Inside a string, so not nested: decoded like any other candidate
+                    try:
+                        value, end = raw_decode(window, start)
+                    except (json.JSONDecodeError, RecursionError):
+                        pos = start + 1
+                        continue
+                    yield start, end, value
+                    pos = end
+                    continue
             try:
-                json_obj = json.loads(match.group(1))
-                json_objects.append(json_obj)
-            except:
+                value, end = raw_decode(region, start - base)
+            except json.JSONDecodeError as e:
+                failed_at = base + e.pos
+                if not limits:
+                    region, base = window[start:failed_at], start
+                    quoted = MHTMLParser._JSON_STRING.finditer(region)
+                    literal = next(quoted, None)
+                limits.append(failed_at)
+                # Nested objects may still decode
+                pos = start + 1
                 continue
+            except RecursionError:
+                pos = start + 1
+                continue
+            yield start, base + end, value
+            pos = base + end
 
-        # Pattern 3: Look for standalone JSON objects
-        json_objects.extend(MHTMLParser._find_json_in_text(content))
-
-        return json_objects
+    @staticmethod
+    def _find_json_in_text(text: str, pos: int = 0, endpos: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Find non-empty JSON objects in text"""
+        return [value for _, value in MHTMLParser._iter_text_records(text, pos, endpos)]
 
     @staticmethod
-    def _find_json_in_text(text: str) -> List[Dict[str, Any]]:
-        """Find JSON objects in text using regex"""
-        json_objects = []
+    def _iter_text_records(text: str, pos: int = 0,
+                           endpos: Optional[int] = None) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+        for start, end, value in MHTMLParser.iter_json_spans(text, pos, endpos):
+            if isinstance(value, dict) and value:
+                yield text[start:end], value
+
+
+def _parse_file(file_path: str, limits: Optional[ParseLimits] = None,
+                content_hash: bool = False) -> Tuple[List[str], Optional[str]]:
+    """Process worker: parse one file for indexing, within the size and part limits.
+
+    JSON objects are serialized in the worker so only compact text crosses
+    the process boundary.
+    """
+    limits = limits or ParseLimits()
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if limits.max_bytes is not None and size > limits.max_bytes:
+            raise FileLimitExceeded(f"{size} bytes, over the {limits.max_bytes} byte limit")
+        data = f.read()
+    json_objects = MHTMLParser.extract_json_from_bytes(data, file_path, limits.max_parts)
+    return [dumps_json(obj) for obj in json_objects], bytes_digest(data) if content_hash else None
+
+
+def _scan_files_batch(file_paths: List[str]) -> List[SearchResult]:
+    """Process-pool worker: parse a batch of files for quick scan"""
+    results = []
+    for file_path in file_paths:
+        try:
+            json_objects = MHTMLParser.extract_json_from_mhtml(file_path)
+            if json_objects:
+                stat = os.stat(file_path)
+                results.append(SearchResult(
+                    file_path=file_path,
+                    json_data=[],
+                    file_size=stat.st_size,
+                    modified_time=stat.st_mtime,
+                    json_texts=[dumps_json(obj) for obj in json_objects]
+                ))
+        except Exception:
+            continue
+    return results
+
+
+# Queries that cannot straddle the whitespace, escapes or number formatting
+# serializing changes: letters, with single spaces between words
+_PLAIN_QUERY = re.compile(r'[^\W\d_]+(?: [^\W\d_]+)*\Z')
+
 
-        # Look for JSON object patterns
-        json_pattern = r'({[^{}]*(?:{[^{}]*}[^{}]*)*})'
+def _scan_files_matching(file_paths: List[str], query: str) -> List[Dict[str, Any]]:
+    """Pool worker: quick-scan a batch of files, keeping only objects whose text contains query.
 
-        for match in re.finditer(json_pattern, text):
+    query must already be lower-case. An object matches when its compact
+    serialized text contains query, as in the index. For a plain query the
+    raw text as it appears in the file gives the same answer unless it
+    holds escapes, so it is tested instead and only matches are serialized.
+    """
+    # A lone 'e' can be the exponent of a number literal
+    plain = _PLAIN_QUERY.match(query) is not None and query != 'e'
+    matches = []
+    for file_path in file_paths:
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            for raw_text, json_obj in MHTMLParser.iter_json_records(data, file_path):
+                json_text = None
+                if not plain or '\\' in raw_text:
+                    json_text = dumps_json(json_obj)
+                    raw_text = json_text
+                if query in raw_text.lower():
+                    matches.append({
+                        'file_path': file_path,
+                        'json_data': json_text or dumps_json(json_obj),
+                        'file_size': len(data)
+                    })
+        except Exception:
+            continue
+    return matches
+
+
+def _batched(items: Iterable[Any], size: int) -> Generator[List[Any], None, None]:
+    """Group an iterable into consecutive batches of at most size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _prefetch(items: Iterable[Any], maxsize: int) -> Generator[Any, None, None]:
+    """Run a producer iterable in a background thread behind a bounded queue.
+
+    The producer blocks once maxsize items are waiting, so memory stays
+    constant however large the walk is, and consumers can start on the
+    first item while the producer is still running.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+    failure = []
+
+    def put(item) -> bool:
+        while not stop.is_set():
             try:
-                json_str = match.group(1)
-                # Basic validation - must contain at least one key-value pair
-                if ':' in json_str and ('"' in json_str or "'" in json_str):
-                    json_obj = json.loads(json_str)
-                    if isinstance(json_obj, dict) and json_obj:
-                        json_objects.append(json_obj)
-            except:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
                 continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except Exception as e:
+            failure.append(e)
+        finally:
+            put(done)
+
+    producer = threading.Thread(target=produce, name='mhtml-producer', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                break
+            yield item
+        if failure:
+            raise failure[0]
+    finally:
+        stop.set()
+
+
+def _fan_in(streams: List[Iterable[Any]], maxsize: int, key: Optional[Callable[[Any], Any]] = None,
+            reverse: bool = False) -> Generator[Any, None, None]:
+    """Consume several iterables at once, each on its own background thread.
+
+    Without key, items are yielded in arrival order. With key, every stream
+    must already be sorted by it and they are merged into one sorted stream.
+    Each queue holds at most maxsize items, so producers wait for the consumer.
+    """
+    done = object()
+    stop = threading.Event()
+    failure = []
+    shared = queue.Queue(maxsize=maxsize) if key is None else None
+    buffers = [shared if key is None else queue.Queue(maxsize=maxsize) for _ in streams]
+
+    def put(buffer: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(stream: Iterable[Any], buffer: queue.Queue):
+        try:
+            for item in stream:
+                if not put(buffer, item):
+                    return
+        except Exception as e:
+            failure.append(e)
+        finally:
+            put(buffer, done)
+
+    def drain(buffer: queue.Queue, producers: int) -> Generator[Any, None, None]:
+        while producers:
+            item = buffer.get()
+            if item is done:
+                producers -= 1
+                continue
+            yield item
+
+    for i, (stream, buffer) in enumerate(zip(streams, buffers)):
+        threading.Thread(target=produce, args=(stream, buffer), name=f'fan-in-{i}', daemon=True).start()
+    try:
+        if key is None:
+            yield from drain(shared, len(streams))
+        else:
+            yield from heapq.merge(*(drain(buffer, 1) for buffer in buffers), key=key, reverse=reverse)
+        if failure:
+            raise failure[0]
+    finally:
+        stop.set()
+
+
+def _bounded_map(executor: Executor, fn: Callable[[Any], Any], items: Iterable[Any],
+                 max_in_flight: Union[int, 'AdaptiveConcurrency'],
+                 ordered: bool = False) -> Generator[Tuple[Any, Future], None, None]:
+    """Submit fn(item) for each item keeping at most max_in_flight futures pending.
+
+    Yields (item, future) pairs as they complete, or in submission order
+    with ordered=True. Items are pulled from the iterable only when a slot
+    frees up, which back-pressures the producer. With an
+    AdaptiveConcurrency controller the bound follows its current limit,
+    and every completion's latency is fed back to it.
+    """
+    controller = max_in_flight if isinstance(max_in_flight, AdaptiveConcurrency) else None
+    pending = {}
+
+    def completed(done):
+        for future in done:
+            item, submitted = pending.pop(future)
+            if controller is not None:
+                controller.record(time.monotonic() - submitted)
+            yield item, future
+
+    def next_done():
+        if ordered:
+            # Dicts keep insertion order, so the first key is the oldest submission
+            oldest = next(iter(pending))
+            wait([oldest])
+            return [oldest]
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        return done
+
+    for item in items:
+        while len(pending) >= (controller.limit if controller else max_in_flight):
+            yield from completed(next_done())
+        pending[executor.submit(fn, item)] = (item, time.monotonic())
+
+    while pending:
+        yield from completed(next_done())
+
+
+def _cpu_limit_exceeded(signum, frame):
+    raise FileLimitExceeded("CPU time limit exceeded")
+
+
+def _isolated_worker(conn, cpu_seconds: Optional[float]):
+    """Worker process loop for IsolatedPool.
+
+    Receives (fn, items) batches and sends one (status, value) outcome per
+    item, where status is 'ok', 'limit' or 'error'. Each call runs under a
+    CPU-time interval timer when cpu_seconds is set.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    use_timer = bool(cpu_seconds) and hasattr(signal, 'setitimer')
+    if use_timer:
+        signal.signal(signal.SIGPROF, _cpu_limit_exceeded)
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        fn, items = task
+        for item in items:
+            try:
+                if use_timer:
+                    signal.setitimer(signal.ITIMER_PROF, cpu_seconds)
+                try:
+                    outcome = ('ok', fn(item))
+                finally:
+                    if use_timer:
+                        signal.setitimer(signal.ITIMER_PROF, 0)
+            except FileLimitExceeded as e:
+                outcome = ('limit', str(e))
+            except Exception as e:
+                outcome = ('error', f"{type(e).__name__}: {e}")
+            conn.send(outcome)
+
+
+class IsolatedPool:
+    """Pool of killable worker processes with a per-item time limit.
+
+    ``submit(fn, items)`` returns a Future whose result is a list of
+    ``(item, status, value)`` outcomes, one per item, so the pool can be
+    driven by ``_bounded_map`` like an executor. Each worker enforces the
+    CPU limit itself; a worker that gives no answer within the wall-clock
+    deadline (stuck in C code, or blocked) is killed and replaced, its
+    current item is reported as over the limit, and the rest of the batch
+    goes to the new worker. A worker that crashes is replaced the same way.
+    Leaving the pool on an exception (Ctrl+C) cancels the queued batches and
+    kills the workers instead of finishing them.
+    """
+
+    def __init__(self, processes: int, cpu_seconds: Optional[float] = None):
+        self.processes = processes
+        self.cpu_seconds = cpu_seconds
+        self.deadline = max(cpu_seconds * 4, cpu_seconds + 10) if cpu_seconds else None
+        self.killed = 0
+        # Workers start from a clean process, never a fork of this threaded one
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._tasks = queue.Queue()
+        # Live worker of each slot, killed by a cancelling shutdown
+        self._workers = {}
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._slots = [threading.Thread(target=self._run_slot, args=(i,), name=f'isolated-{i}', daemon=True)
+                       for i in range(processes)]
+        for slot in self._slots:
+            slot.start()
+
+    def __enter__(self) -> 'IsolatedPool':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(cancel=exc_type is not None)
+
+    def submit(self, fn: Callable[[Any], Any], items: Iterable[Any]) -> Future:
+        future = Future()
+        self._tasks.put((future, fn, list(items)))
+        return future
+
+    def shutdown(self, cancel: bool = False):
+        """Stop the workers once the queued batches are done, or at once with cancel"""
+        if cancel:
+            with self._lock:
+                self._cancelled = True
+                for process, _ in self._workers.values():
+                    process.kill()
+            while True:
+                try:
+                    task = self._tasks.get_nowait()
+                except queue.Empty:
+                    break
+                task[0].cancel()
+        for _ in self._slots:
+            self._tasks.put(None)
+        for slot in self._slots:
+            slot.join()
+
+    def _spawn(self, slot: int):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_isolated_worker, args=(child_conn, self.cpu_seconds),
+                                        name='mhtml-isolated', daemon=True)
+        process.start()
+        child_conn.close()
+        with self._lock:
+            self._workers[slot] = (process, parent_conn)
+            if self._cancelled:
+                process.kill()
+        return process, parent_conn
 
-        return json_objects
+    @staticmethod
+    def _retire(worker, kill: bool):
+        process, conn = worker
+        if kill:
+            process.kill()
+        else:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        process.join()
+        conn.close()
+
+    def _run_slot(self, slot: int):
+        worker = None
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    return
+                future, fn, items = task
+                if self._cancelled:
+                    future.cancel()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    outcomes = []
+                    while len(outcomes) < len(items):
+                        if worker is None:
+                            worker = self._spawn(slot)
+                        process, conn = worker
+                        remaining = items[len(outcomes):]
+                        try:
+                            conn.send((fn, remaining))
+                        except OSError:
+                            self._retire(worker, kill=True)
+                            worker = None
+                            if self._cancelled:
+                                raise RuntimeError("Batch cancelled by pool shutdown")
+                            continue
+
+                        for item in remaining:
+                            if not conn.poll(self.deadline):
+                                outcomes.append((item, 'limit', f"no result after {self.deadline:.0f}s, worker killed"))
+                            else:
+                                try:
+                                    status, value = conn.recv()
+                                    outcomes.append((item, status, value))
+                                    continue
+                                except (EOFError, OSError):
+                                    process.join()
+                                    outcomes.append((item, 'error', f"worker exited with code {process.exitcode}"))
+                            self._retire(worker, kill=True)
+                            worker = None
+                            if self._cancelled:
+                                raise RuntimeError("Batch cancelled by pool shutdown")
+                            self.killed += 1
+                            break
+                    future.set_result(outcomes)
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            if worker is not None:
+                self._retire(worker, kill=False)
+
+
+class ByteBudget:
+    """Bound on the bytes read ahead of the parsers.
+
+    Readers reserve a file's size before reading it and parsers release it
+    once the contents are parsed. A reservation larger than the whole budget
+    is granted when nothing else is held, so oversized files still pass.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.used = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int) -> float:
+        """Reserve nbytes, blocking until they fit; returns the seconds spent waiting"""
+        start = time.perf_counter()
+        with self._cond:
+            while not self.closed and self.used and self.used + nbytes > self.capacity:
+                self._cond.wait()
+            if not self.closed:
+                self.used += nbytes
+        return time.perf_counter() - start
+
+    def release(self, nbytes: int):
+        with self._cond:
+            if not self.closed:
+                self.used -= nbytes
+            self._cond.notify_all()
+
+    def close(self):
+        """Drop every reservation, including ones whose contents were never
+        parsed, and stop blocking readers"""
+        with self._cond:
+            self.closed = True
+            self.used = 0
+            self._cond.notify_all()
+
+
+class PipelineStats:
+    """Time spent by the read and parse stages of the indexing pipeline.
+
+    Readers that wait for buffer space are held up by the parsers; parsers
+    that wait for contents are held up by the readers. Whichever stage the
+    other waits on longer is the bottleneck.
+    """
+
+    def __init__(self):
+        self.read_seconds = 0.0
+        self.read_bytes = 0
+        self.read_blocked = 0.0
+        self.parse_seconds = 0.0
+        self.parse_starved = 0.0
+        self._lock = threading.Lock()
+
+    def add_read(self, seconds: float, nbytes: int, blocked: float):
+        with self._lock:
+            self.read_seconds += seconds
+            self.read_bytes += nbytes
+            self.read_blocked += blocked
+
+    def add_parse(self, seconds: float):
+        with self._lock:
+            self.parse_seconds += seconds
+
+    def starved(self, items: Iterable[Any]) -> Generator[Any, None, None]:
+        """Pass items through, timing how long the parse stage waits for each"""
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.parse_starved += time.perf_counter() - start
+            yield item
+
+    @property
+    def bottleneck(self) -> str:
+        return 'parse' if self.read_blocked > self.parse_starved else 'read'
+
+
+class JSONCodec:
+    """Compact storage encoding for JSON records.
+
+    Records are stored as plain text, readable by any SQLite client, unless
+    compress is set and deflate makes them smaller. A compressed record is
+    a blob of a one-byte tag and its payload: tag 1 raw deflate, and any
+    higher tag raw deflate primed with the preset dictionary of that id.
+    Tag 0, UTF-8 text in a blob, is still read but no longer written.
+    Dictionaries are trained from sample records and never change once
+    stored, so every record stays decodable.
+    """
+
+    RAW = 0
+    DEFLATE = 1
+    LEVEL = 6
+    # Shorter records are stored as text
+    MIN_COMPRESS = 64
+    # The deflate window: dictionary bytes beyond it could never be referenced
+    DICTIONARY_SIZE = 32 * 1024
+    # Records sampled before the first dictionary is trained
+    TRAIN_RECORDS = 256
+    # Object keys and short strings with their punctuation, the fragments that recur between records
+    _FRAGMENT = re.compile(r'[{\[,]?"(?:[^"\\\n]|\\.){1,64}"[:,]?[\[{]?')
+
+    def __init__(self, dictionaries: Optional[Dict[int, bytes]] = None,
+                 loader: Optional[Callable[[], Dict[int, bytes]]] = None, compress: bool = True):
+        self.dictionaries = dict(dictionaries or {})
+        self.compress = compress
+        # Called for dictionaries stored by another connection since this codec was loaded
+        self._loader = loader
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[int]:
+        """Id of the dictionary new records are compressed with"""
+        return max(self.dictionaries) if self.dictionaries else None
+
+    def encode(self, text: str) -> Union[str, bytes]:
+        data = text.encode('utf-8')
+        if self.compress and len(data) >= self.MIN_COMPRESS:
+            tag = self.current
+            if tag is None:
+                tag, compressor = self.DEFLATE, zlib.compressobj(self.LEVEL, zlib.DEFLATED, -15)
+            else:
+                compressor = zlib.compressobj(self.LEVEL, zlib.DEFLATED, -15, zdict=self.dictionaries[tag])
+            packed = compressor.compress(data) + compressor.flush()
+            if len(packed) < len(data):
+                return bytes((tag,)) + packed
+        return text
+
+    def decode(self, blob: Union[str, bytes]) -> str:
+        if isinstance(blob, str):
+            return blob
+        tag = blob[0]
+        if tag == self.RAW:
+            data = blob[1:]
+        elif tag == self.DEFLATE:
+            data = zlib.decompress(blob[1:], -15)
+        else:
+            decompressor = zlib.decompressobj(-15, zdict=self.dictionary(tag))
+            data = decompressor.decompress(blob[1:]) + decompressor.flush()
+        return data.decode('utf-8')
+
+    def dictionary(self, dictionary_id: int) -> bytes:
+        if dictionary_id not in self.dictionaries and self._loader is not None:
+            with self._lock:
+                self.dictionaries.update(self._loader())
+        try:
+            return self.dictionaries[dictionary_id]
+        except KeyError:
+            raise ValueError(f"Unknown compression dictionary {dictionary_id}")
+
+    @classmethod
+    def train(cls, texts: Iterable[str]) -> bytes:
+        """Build a preset dictionary from the fragments that recur across sample records.
+
+        Fragments are scored by the bytes they would save (records they
+        appear in beyond the first, times their length). Deflate codes
+        nearer matches more cheaply, so the best fragments go last.
+        """
+        counts = collections.Counter()
+        for text in texts:
+            counts.update(set(cls._FRAGMENT.findall(text)))
+
+        ranked = sorted(((count - 1) * len(fragment.encode('utf-8')), fragment)
+                        for fragment, count in counts.items() if count > 1)
+        chosen, size = [], 0
+        for _, fragment in reversed(ranked):
+            encoded = fragment.encode('utf-8')
+            if size + len(encoded) <= cls.DICTIONARY_SIZE:
+                chosen.append(encoded)
+                size += len(encoded)
+        return b''.join(reversed(chosen))
 
 
 class SQLiteIndex:
-    """SQLite-based index for fast searching"""
+    """SQLite-based index for fast searching.
+
+    Writes are queued to a dedicated writer thread that owns its own
+    connection and commits in large transactions, so indexing workers never
+    wait on the database or on per-file fsyncs.
+
+    Records are stored once per distinct content in json_blobs, keyed by a
+    digest of their text; json_refs ties them to files. They are plain text
+    unless the index was created with compress, when JSONCodec deflates
+    them. The json_data view hands them to queries and the full-text index
+    as text. In a compressed index it decodes them with the json_unpack
+    function this class registers, so only this tool can read such an
+    index; an uncompressed one can be queried by any SQLite client.
+    """
+
+    # Stored as PRAGMA user_version; bumped when the layout of stored data changes
+    SCHEMA_VERSION = 2
+
+    # Applied to every connection; WAL lets readers run alongside the writer
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA cache_size=-65536",     # 64 MiB page cache
+        "PRAGMA mmap_size=268435456",   # 256 MiB memory-mapped I/O
+        "PRAGMA temp_store=MEMORY",
+    )
 
-    def __init__(self, db_path: str = None):
+    # Applied to pooled read-only connections
+    READER_PRAGMAS = (
+        "PRAGMA query_only=ON",
+        "PRAGMA cache_size=-16384",     # 16 MiB page cache per reader
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA temp_store=MEMORY",
+    )
+    # Prepared statements kept per reader connection
+    READER_STATEMENT_CACHE = 256
+
+    def __init__(self, db_path: str = None, batch_size: int = 500, commit_interval: float = 1.0,
+                 max_readers: int = None, compress: bool = False):
         if db_path is None:
             db_path = os.path.join(tempfile.gettempdir(), 'mhtml_search.db')
 
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        # Files per write transaction and max seconds a write may stay uncommitted
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        # Whether records are compressed is fixed when the index is created; see _initialize_db
+        self.codec = JSONCodec(loader=self._reload_dictionaries, compress=compress)
+        # Records kept by the writer to train the first compression dictionary
+        self._training_samples = []
+        self.conn = self._connect()
         self.lock = threading.Lock()
         self._initialize_db()
 
+        # Read-only WAL readers: queries run concurrently with each other and with the writer
+        self.max_readers = max_readers or min(32, os.cpu_count() or 4)
+        self._idle_readers = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(self.max_readers)
+
+        self._write_queue = queue.Queue(maxsize=batch_size * 4)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._scanning = False
+        # Highest seen_files rowid already copied to scan_seen by a checkpoint
+        self._seen_saved = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the index with the tuned pragmas applied"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        self._register_functions(conn)
+        return conn
+
+    def _connect_reader(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(Path(self.db_path).resolve().as_uri() + '?mode=ro', uri=True,
+                               check_same_thread=False, cached_statements=self.READER_STATEMENT_CACHE)
+        for pragma in self.READER_PRAGMAS:
+            conn.execute(pragma)
+        self._register_functions(conn)
+        return conn
+
+    def _register_functions(self, conn: sqlite3.Connection):
+        """SQL functions the json_data view and full-text triggers rely on"""
+        conn.create_function('json_unpack', 1, self.codec.decode, deterministic=True)
+        conn.create_function('json_pack', 1, self.codec.encode)
+
+    @contextlib.contextmanager
+    def _reader(self) -> Generator[sqlite3.Connection, None, None]:
+        """Borrow a read-only connection from the pool, opening one if none is idle"""
+        with self._reader_slots:
+            try:
+                conn = self._idle_readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect_reader()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle_readers.put(conn)
+
     def _initialize_db(self):
         """Initialize database schema"""
         with self.lock:
@@ -267,96 +1662,1217 @@ class SQLiteIndex:
                     file_size INTEGER,
                     modified_time REAL,
                     indexed_time REAL,
-                    json_count INTEGER
+                    json_count INTEGER,
+                    content_hash TEXT
+                );
+
+                -- Each distinct JSON record once, encoded by JSONCodec and keyed by its content hash
+                CREATE TABLE IF NOT EXISTS json_blobs (
+                    hash TEXT PRIMARY KEY,
+                    data BLOB NOT NULL
                 );
 
-                CREATE TABLE IF NOT EXISTS json_data (
+                -- The records of each file, as references to their blobs
+                CREATE TABLE IF NOT EXISTS json_refs (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     file_id INTEGER,
-                    json_text TEXT,
-                    json_hash TEXT,
+                    json_hash TEXT NOT NULL,
                     FOREIGN KEY (file_id) REFERENCES mhtml_files (id)
                 );
 
+                -- Preset deflate dictionaries, referenced by id from the first byte of a blob
+                CREATE TABLE IF NOT EXISTS json_dictionaries (
+                    id INTEGER PRIMARY KEY,
+                    dictionary BLOB NOT NULL
+                );
+
+                -- Other paths (hardlinks, symlinks, bind mounts) to an indexed file
+                CREATE TABLE IF NOT EXISTS file_aliases (
+                    alias_path TEXT PRIMARY KEY,
+                    file_id INTEGER,
+                    FOREIGN KEY (file_id) REFERENCES mhtml_files (id)
+                );
+
+                -- Scalar leaves of every JSON record, for indexed path/value queries
+                CREATE TABLE IF NOT EXISTS json_values (
+                    record_id INTEGER NOT NULL,
+                    json_path TEXT NOT NULL,
+                    value_text TEXT,
+                    value_num REAL,
+                    value_bool INTEGER
+                );
+
+                -- Index-wide values; 'generation' counts committed changes queries can see,
+                -- 'identity' tells this index apart from others created at the same path,
+                -- 'values_flattened' marks json_values as holding every record,
+                -- 'compression' is 'deflate' when records are stored compressed, else 'none'
+                CREATE TABLE IF NOT EXISTS index_meta (
+                    key TEXT PRIMARY KEY,
+                    value
+                );
+
+                -- Files left out of the index for going over a per-file limit
+                CREATE TABLE IF NOT EXISTS quarantine (
+                    file_path TEXT PRIMARY KEY,
+                    file_size INTEGER,
+                    modified_time REAL,
+                    quarantined_time REAL,
+                    reason TEXT
+                );
+
+                -- Saved progress of an interrupted indexing run:
+                -- 'root' paths, 'dir' frontier and 'file' outstanding files
+                CREATE TABLE IF NOT EXISTS index_checkpoint (
+                    kind TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    PRIMARY KEY (kind, path)
+                );
+
                 CREATE INDEX IF NOT EXISTS idx_file_path ON mhtml_files(file_path);
-                CREATE INDEX IF NOT EXISTS idx_json_hash ON json_data(json_hash);
-                CREATE INDEX IF NOT EXISTS idx_file_id ON json_data(file_id);
+                CREATE INDEX IF NOT EXISTS idx_alias_file_id ON file_aliases(file_id);
+                CREATE INDEX IF NOT EXISTS idx_refs_hash ON json_refs(json_hash);
+                CREATE INDEX IF NOT EXISTS idx_refs_file_id ON json_refs(file_id);
+                CREATE INDEX IF NOT EXISTS idx_values_record ON json_values(record_id);
+            """)
+
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(mhtml_files)")}
+            if 'content_hash' not in columns:
+                self.conn.execute("ALTER TABLE mhtml_files ADD COLUMN content_hash TEXT")
+
+            # Fixed when the index is created; reopening keeps the stored setting
+            self.conn.execute("INSERT OR IGNORE INTO index_meta (key, value) VALUES ('compression', ?)",
+                              ('deflate' if self.codec.compress else 'none',))
+            self.codec.compress = self.conn.execute(
+                "SELECT value FROM index_meta WHERE key = 'compression'").fetchone()[0] == 'deflate'
+
+            self.codec.dictionaries.update(self._load_dictionaries(self.conn))
+            # Version 1 indexes stored every record as text in a json_data table
+            legacy = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'json_data'").fetchone()
+            if legacy is not None:
+                self._migrate_records(self.conn)
+
+            self.conn.executescript(f"""
+                -- Decoded records, the shape queries and the full-text index read
+                CREATE VIEW IF NOT EXISTS json_data AS
+                    SELECT r.id, r.file_id, {self._record_text('b.data')} AS json_text, r.json_hash
+                    FROM json_refs r JOIN json_blobs b ON b.hash = r.json_hash;
+
+                CREATE TRIGGER IF NOT EXISTS json_refs_values_delete AFTER DELETE ON json_refs BEGIN
+                    DELETE FROM json_values WHERE record_id = old.id;
+                END;
+            """)
+
+            # Indexes created before json_values existed: flatten their records once
+            flattened = self.conn.execute(
+                "SELECT 1 FROM index_meta WHERE key = 'values_flattened'").fetchone() is not None
+            if not flattened:
+                if self.conn.execute("SELECT 1 FROM json_values LIMIT 1").fetchone() is None:
+                    self._insert_values(self.conn, self.conn.execute("SELECT id, json_text FROM json_data"))
+                self.conn.execute("INSERT INTO index_meta (key, value) VALUES ('values_flattened', 1)")
+            self._create_value_indexes(self.conn)
+
+            # Older indexes declared json_fts over columns json_data never had
+            row = self.conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'json_fts'").fetchone()
+            stale_fts = row is not None and 'json_content' in row[0]
+            if stale_fts:
+                self.conn.execute("DROP TABLE json_fts")
+
+            # Missing triggers mean a bulk load was interrupted before its rebuild
+            stale_fts = stale_fts or self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'json_refs_fts_insert'"
+            ).fetchone() is None
 
-                -- Virtual table for full-text search
+            self.conn.executescript("""
+                -- Virtual table for full-text search, kept in sync by triggers
                 CREATE VIRTUAL TABLE IF NOT EXISTS json_fts USING fts5(
-                    json_content, file_path, content='json_data', content_rowid='id'
+                    json_text, content='json_data', content_rowid='id'
                 );
             """)
+            self._create_fts_triggers(self.conn)
+            if stale_fts:
+                self._rebuild_fts(self.conn)
+            self.conn.execute("INSERT OR IGNORE INTO index_meta (key, value) VALUES ('identity', ?)",
+                              (os.urandom(16).hex(),))
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
             self.conn.commit()
 
+    def _migrate_records(self, conn: sqlite3.Connection):
+        """Move the text records of a version 1 index into deduplicated blobs"""
+        print("🗜️  Upgrading index: deduplicating stored JSON records...", file=sys.stderr)
+        conn.commit()
+        if self.codec.compress:
+            samples = [text for (text,) in conn.execute(
+                "SELECT json_text FROM json_data ORDER BY random() LIMIT ?", (JSONCodec.TRAIN_RECORDS,))]
+            self._train_dictionary(conn, samples)
+
+        rows = conn.execute("SELECT id, file_id, json_text FROM json_data ORDER BY id")
+        while True:
+            chunk = rows.fetchmany(self.FETCH_SIZE)
+            if not chunk:
+                break
+            refs = [(record_id, file_id, bytes_digest(json_text.encode('utf-8')))
+                    for record_id, file_id, json_text in chunk]
+            self._store_blobs(conn, {ref[2]: row[2] for ref, row in zip(refs, chunk)})
+            conn.executemany("INSERT INTO json_refs (id, file_id, json_hash) VALUES (?, ?, ?)", refs)
+
+        # Keep the id sequence, so ids of deleted records are not handed out again
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = 'json_refs'")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) "
+                     "SELECT 'json_refs', seq FROM sqlite_sequence WHERE name = 'json_data'")
+        conn.execute("DROP TABLE json_data")
+        conn.commit()
+        conn.execute("VACUUM")
+
+    def _store_blobs(self, conn: sqlite3.Connection, texts: Dict[str, str]):
+        """Encode and insert the records of texts ({hash: text}) not stored yet"""
+        new = [(json_hash, json_text) for json_hash, json_text in texts.items()
+               if conn.execute("SELECT 1 FROM json_blobs WHERE hash = ?", (json_hash,)).fetchone() is None]
+        conn.executemany("INSERT INTO json_blobs (hash, data) VALUES (?, ?)",
+                         [(json_hash, self.codec.encode(json_text)) for json_hash, json_text in new])
+
+    @staticmethod
+    def _release_blobs(conn: sqlite3.Connection, hashes: Optional[Iterable[str]] = None):
+        """Delete blobs no record refers to any more, among hashes or all of them"""
+        if hashes is None:
+            conn.execute("DELETE FROM json_blobs WHERE NOT EXISTS "
+                         "(SELECT 1 FROM json_refs WHERE json_hash = json_blobs.hash)")
+        else:
+            conn.executemany("DELETE FROM json_blobs WHERE hash = ? AND NOT EXISTS "
+                             "(SELECT 1 FROM json_refs WHERE json_hash = ?)",
+                             [(json_hash, json_hash) for json_hash in hashes])
+
+    def _train_dictionary(self, conn: sqlite3.Connection, samples: List[str]):
+        """Train and store a compression dictionary from samples; it takes effect once committed"""
+        dictionary = JSONCodec.train(samples)
+        if len(dictionary) < 64:
+            return
+        with conn:
+            dictionary_id = conn.execute(
+                "SELECT MAX(2, COALESCE(MAX(id) + 1, 2)) FROM json_dictionaries").fetchone()[0]
+            if dictionary_id > 255:
+                return
+            conn.execute("INSERT INTO json_dictionaries (id, dictionary) VALUES (?, ?)",
+                         (dictionary_id, dictionary))
+        self.codec.dictionaries[dictionary_id] = dictionary
+
+    @staticmethod
+    def _load_dictionaries(conn: sqlite3.Connection) -> Dict[int, bytes]:
+        return dict(conn.execute("SELECT id, dictionary FROM json_dictionaries"))
+
+    def _reload_dictionaries(self) -> Dict[int, bytes]:
+        """Dictionaries committed by other connections or processes"""
+        # Not from the reader pool: this may run inside a query holding the last reader
+        conn = self._connect_reader()
+        try:
+            return self._load_dictionaries(conn)
+        finally:
+            conn.close()
+
+    def _record_text(self, data: str) -> str:
+        """SQL for the text of the stored record in column data"""
+        # Plain SQL where records are stored as text, so other clients can read them
+        return f"json_unpack({data})" if self.codec.compress else data
+
+    def _create_fts_triggers(self, conn: sqlite3.Connection):
+        """Keep json_fts in sync with json_refs row by row.
+
+        The text is read from the referenced blob, so blobs are released
+        only after the records referring to them are deleted.
+        """
+        text = self._record_text('data')
+        conn.executescript(f"""
+            CREATE TRIGGER IF NOT EXISTS json_refs_fts_insert AFTER INSERT ON json_refs BEGIN
+                INSERT INTO json_fts(rowid, json_text)
+                VALUES (new.id, (SELECT {text} FROM json_blobs WHERE hash = new.json_hash));
+            END;
+            CREATE TRIGGER IF NOT EXISTS json_refs_fts_delete AFTER DELETE ON json_refs BEGIN
+                INSERT INTO json_fts(json_fts, rowid, json_text)
+                VALUES ('delete', old.id, (SELECT {text} FROM json_blobs WHERE hash = old.json_hash));
+            END;
+            CREATE TRIGGER IF NOT EXISTS json_refs_fts_update AFTER UPDATE ON json_refs BEGIN
+                INSERT INTO json_fts(json_fts, rowid, json_text)
+                VALUES ('delete', old.id, (SELECT {text} FROM json_blobs WHERE hash = old.json_hash));
+                INSERT INTO json_fts(rowid, json_text)
+                VALUES (new.id, (SELECT {text} FROM json_blobs WHERE hash = new.json_hash));
+            END;
+        """)
+
+    @staticmethod
+    def _create_value_indexes(conn: sqlite3.Connection):
+        """Composite (path, value) indexes, one per value type"""
+        conn.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_values_num ON json_values(json_path, value_num)
+                WHERE value_num IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS idx_values_text ON json_values(json_path, value_text)
+                WHERE value_text IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS idx_values_bool ON json_values(json_path, value_bool)
+                WHERE value_bool IS NOT NULL;
+        """)
+
+    @staticmethod
+    def _drop_value_indexes(conn: sqlite3.Connection):
+        conn.executescript("""
+            DROP INDEX IF EXISTS idx_values_num;
+            DROP INDEX IF EXISTS idx_values_text;
+            DROP INDEX IF EXISTS idx_values_bool;
+        """)
+
+    @staticmethod
+    def _insert_values(conn: sqlite3.Connection, records: Iterable[Tuple[int, str]]):
+        """Flatten (record_id, json_text) pairs into json_values"""
+        def rows():
+            for record_id, json_text in records:
+                try:
+                    leaves = list(flatten_json(json.loads(json_text)))
+                except (ValueError, RecursionError):
+                    continue
+                for leaf in leaves:
+                    yield (record_id,) + leaf
+
+        conn.executemany("INSERT INTO json_values VALUES (?, ?, ?, ?, ?)", rows())
+
+    @staticmethod
+    def _drop_fts_triggers(conn: sqlite3.Connection):
+        conn.executescript("""
+            DROP TRIGGER IF EXISTS json_refs_fts_insert;
+            DROP TRIGGER IF EXISTS json_refs_fts_delete;
+            DROP TRIGGER IF EXISTS json_refs_fts_update;
+        """)
+
+    @staticmethod
+    def _rebuild_fts(conn: sqlite3.Connection):
+        """Rebuild the full-text index from json_data in one pass"""
+        conn.execute("INSERT INTO json_fts(json_fts) VALUES ('rebuild')")
+
+    def is_empty(self) -> bool:
+        with self._reader() as conn:
+            return conn.execute("SELECT 1 FROM json_refs LIMIT 1").fetchone() is None
+
+    def begin_bulk_load(self):
+        """Suspend per-row FTS and value index maintenance for a large load.
+
+        Much cheaper than updating json_fts row by row; end_bulk_load()
+        rebuilds the full-text index once, restores the triggers and builds
+        the value indexes.
+        """
+        def start(conn: sqlite3.Connection):
+            self._drop_fts_triggers(conn)
+            self._drop_value_indexes(conn)
+
+        self._submit(start)
+
+    def end_bulk_load(self):
+        def finish(conn: sqlite3.Connection):
+            self._rebuild_fts(conn)
+            self._create_fts_triggers(conn)
+            self._create_value_indexes(conn)
+
+        self._submit(finish)
+        self.flush()
+
     def add_file(self, file_path: str, json_objects: List[Dict[str, Any]]):
         """Add file and its JSON data to index"""
+        self.add_serialized(file_path, [dumps_json(json_obj) for json_obj in json_objects])
+
+    def add_serialized(self, file_path: str, json_texts: List[str], content_hash: Optional[str] = None):
+        """Queue a file and its already serialized JSON objects for indexing"""
         try:
             stat = os.stat(file_path)
-            file_size = stat.st_size
-            modified_time = stat.st_mtime
-            indexed_time = time.time()
+        except OSError as e:
+            print(f"Error indexing file {file_path}: {e}")
+            return
 
-            with self.lock:
-                # Insert or update file record
-                cursor = self.conn.execute("""
-                    INSERT OR REPLACE INTO mhtml_files 
-                    (file_path, file_size, modified_time, indexed_time, json_count)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (file_path, file_size, modified_time, indexed_time, len(json_objects)))
+        self._ensure_writer()
+        self._write_queue.put((file_path, stat.st_size, stat.st_mtime, time.time(), json_texts, content_hash))
 
-                file_id = cursor.lastrowid
+    def get_fingerprint(self, file_path: str) -> Optional[Tuple[int, float, Optional[str]]]:
+        """Stored (file_size, modified_time, content_hash) of an indexed file"""
+        with self._reader() as conn:
+            return conn.execute(
+                "SELECT file_size, modified_time, content_hash FROM mhtml_files WHERE file_path = ?",
+                (file_path,)
+            ).fetchone()
 
-                # Clear old JSON data
-                self.conn.execute("DELETE FROM json_data WHERE file_id = ?", (file_id,))
+    def begin_scan(self, resume: bool = False):
+        """Start recording which indexed files are still present on disk.
 
-                # Insert JSON objects
-                for json_obj in json_objects:
-                    json_text = json.dumps(json_obj, ensure_ascii=False)
-                    json_hash = str(hash(json_text))
+        They are recorded in a temporary table; save_checkpoint() copies them
+        to scan_seen, so with resume the files an interrupted run saw are
+        known again.
+        """
+        def start(conn: sqlite3.Connection):
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen_files (file_path TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.seen_files")
+            if resume:
+                conn.execute("CREATE TABLE IF NOT EXISTS main.scan_seen (file_path TEXT PRIMARY KEY)")
+                conn.execute("INSERT INTO temp.seen_files SELECT file_path FROM main.scan_seen")
+            else:
+                conn.execute("DROP TABLE IF EXISTS main.scan_seen")
+            self._seen_saved = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM temp.seen_files").fetchone()[0]
+            self._scanning = True
 
-                    self.conn.execute("""
-                        INSERT INTO json_data (file_id, json_text, json_hash)
-                        VALUES (?, ?, ?)
-                    """, (file_id, json_text, json_hash))
+        self._submit(start)
 
-                self.conn.commit()
+    def mark_unchanged(self, file_paths: List[str], touched: List[Tuple[float, str]] = ()):
+        """Record files found unchanged during a scan.
 
-        except Exception as e:
-            print(f"Error indexing file {file_path}: {e}")
+        touched holds (modified_time, file_path) for files whose mtime moved
+        but whose content hash did not, so they are not re-hashed next time.
+        """
+        def mark(conn: sqlite3.Connection):
+            conn.executemany("INSERT OR IGNORE INTO temp.seen_files VALUES (?)",
+                             [(file_path,) for file_path in file_paths])
+            if touched:
+                conn.executemany("UPDATE mhtml_files SET modified_time = ? WHERE file_path = ?", touched)
+                self._bump_generation(conn)
+
+        self._submit(mark)
 
-    def search(self, query: str) -> List[Dict[str, Any]]:
-        """Execute search query"""
+    def end_scan(self, roots: List[str], unlisted: Iterable[str] = ()) -> int:
+        """Purge files under roots that were not seen since begin_scan().
+
+        Quarantine records of files under roots that no longer exist are
+        dropped too. Files under unlisted, directories the walk failed to read, are kept:
+        not seeing them says nothing about whether they still exist.
+        """
+        removed = []
+        unlisted = set(unlisted)
+
+        def purge(conn: sqlite3.Connection):
+            missing = """
+                SELECT id, file_path FROM mhtml_files
+                WHERE (file_path = ? OR (file_path >= ? AND file_path < ?))
+                  AND file_path NOT IN (SELECT file_path FROM temp.seen_files)
+            """
+            for root in roots:
+                # Range over root + separator, so /data does not match /data2
+                file_ids = [(file_id,) for file_id, file_path in conn.execute(missing, _subtree_range(root))
+                            if not _within_any(file_path, unlisted)]
+                conn.executemany("DELETE FROM json_refs WHERE file_id = ?", file_ids)
+                conn.executemany("DELETE FROM file_aliases WHERE file_id = ?", file_ids)
+                conn.executemany("DELETE FROM mhtml_files WHERE id = ?", file_ids)
+                removed.append(len(file_ids))
+            if any(removed):
+                self._release_blobs(conn)
+            # Files indexed this run are no longer quarantined, and neither are deleted ones
+            released = conn.execute(
+                "DELETE FROM quarantine WHERE file_path IN (SELECT file_path FROM temp.seen_files)").rowcount
+            held = "SELECT file_path FROM quarantine WHERE file_path = ? OR (file_path >= ? AND file_path < ?)"
+            for root in roots:
+                gone = [(file_path,) for file_path, in conn.execute(held, _subtree_range(root)).fetchall()
+                        if not os.path.lexists(file_path)]
+                released += conn.executemany("DELETE FROM quarantine WHERE file_path = ?", gone).rowcount
+            if any(removed) or released:
+                self._bump_generation(conn)
+            conn.execute("DELETE FROM temp.seen_files")
+            # The run is complete, so there is nothing left to resume
+            conn.execute("DELETE FROM index_checkpoint")
+            conn.execute("DROP TABLE IF EXISTS main.scan_seen")
+            self._scanning = False
+
+        self._submit(purge)
+        self.flush()
+        return sum(removed)
+
+    def save_checkpoint(self, checkpoint: IndexCheckpoint):
+        """Queue a snapshot of the run's progress, committed after every write queued so far"""
+        roots, frontier, outstanding, removed = checkpoint.snapshot()
+
+        def save(conn: sqlite3.Connection):
+            conn.execute("DELETE FROM index_checkpoint")
+            for kind, paths in (('root', roots), ('dir', frontier), ('file', outstanding), ('removed', removed)):
+                conn.executemany("INSERT OR IGNORE INTO index_checkpoint VALUES (?, ?)",
+                                 [(kind, path) for path in paths])
+            self._save_seen(conn)
+
+        self._submit(save)
+
+    def _save_seen(self, conn: sqlite3.Connection):
+        """Copy files seen since the last checkpoint to scan_seen, which outlives the connection"""
+        if not self._scanning:
+            return
+        saved = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM temp.seen_files").fetchone()[0]
+        conn.execute("CREATE TABLE IF NOT EXISTS main.scan_seen (file_path TEXT PRIMARY KEY)")
+        conn.execute("INSERT OR IGNORE INTO main.scan_seen SELECT file_path FROM temp.seen_files WHERE rowid > ?",
+                     (self._seen_saved,))
+        self._seen_saved = saved
+
+    def save_seen(self):
+        """Queue the checkpoint copy of seen files without saving a checkpoint"""
+        self._submit(self._save_seen)
+
+    def load_checkpoint(self) -> Optional[Tuple[List[str], List[str], List[str], List[str]]]:
+        """(roots, frontier, outstanding, removed) saved by an interrupted run, or None"""
+        with self._reader() as conn:
+            rows = conn.execute("SELECT kind, path FROM index_checkpoint").fetchall()
+        saved = {'root': [], 'dir': [], 'file': [], 'removed': []}
+        for kind, path in rows:
+            saved[kind].append(path)
+        if not saved['root']:
+            return None
+        return saved['root'], saved['dir'], saved['file'], saved['removed']
+
+    def quarantine(self, file_path: str, reason: str):
+        """Record a file that was left out of the index, and why"""
         try:
-            with self.lock:
-                if query.upper().startswith('SELECT'):
-                    # Direct SQL query
-                    cursor = self.conn.execute(query)
-                else:
-                    # Full-text search
-                    cursor = self.conn.execute("""
-                        SELECT f.file_path, j.json_text
-                        FROM json_fts 
-                        JOIN json_data j ON json_fts.rowid = j.id
-                        JOIN mhtml_files f ON j.file_id = f.id
-                        WHERE json_fts MATCH ?
-                    """, (query,))
-
-                results = []
-                for row in cursor.fetchall():
-                    if len(row) >= 2:
-                        results.append({
-                            'file_path': row[0],
-                            'json_data': row[1] if isinstance(row[1], str) else str(row[1])
-                        })
+            stat = os.stat(file_path)
+            fingerprint = (stat.st_size, stat.st_mtime)
+        except OSError:
+            fingerprint = (None, None)
+
+        def store(conn: sqlite3.Connection):
+            conn.execute("INSERT OR REPLACE INTO quarantine VALUES (?, ?, ?, ?, ?)",
+                         (file_path, *fingerprint, time.time(), reason))
+            self._bump_generation(conn)
+
+        self._submit(store)
+
+    def get_quarantined(self, file_path: str) -> Optional[Tuple[int, float, str]]:
+        """(file_size, modified_time, reason) of a quarantined file, or None"""
+        with self._reader() as conn:
+            return conn.execute(
+                "SELECT file_size, modified_time, reason FROM quarantine WHERE file_path = ?",
+                (file_path,)).fetchone()
+
+    def record_aliases(self, pairs: List[Tuple[str, str]], replace_roots: List[str] = ()):
+        """Store alias paths of indexed files.
+
+        Each pair names two paths to the same physical file; whichever one
+        is indexed owns the row and the other becomes its alias. Aliases
+        under replace_roots that are not in pairs are dropped, since those
+        roots were walked in full.
+        """
+        def store(conn: sqlite3.Connection):
+            changes = conn.total_changes
+            for root in replace_roots:
+                conn.execute(
+                    "DELETE FROM file_aliases WHERE alias_path = ? OR (alias_path >= ? AND alias_path < ?)",
+                    _subtree_range(root))
+
+            rows = []
+            for first, second in pairs:
+                for alias, owner in ((first, second), (second, first)):
+                    row = conn.execute("SELECT id FROM mhtml_files WHERE file_path = ?", (owner,)).fetchone()
+                    if row is not None:
+                        rows.append((alias, row[0]))
+                        break
+            conn.executemany("INSERT OR REPLACE INTO file_aliases (alias_path, file_id) VALUES (?, ?)", rows)
+            if conn.total_changes != changes:
+                self._bump_generation(conn)
+
+        if pairs or replace_roots:
+            self._submit(store)
+            self.flush()
+
+    def alias_owner(self, alias_path: str) -> Optional[str]:
+        """Indexed path of the file alias_path is an alias of"""
+        with self._reader() as conn:
+            row = conn.execute("""
+                SELECT f.file_path FROM file_aliases a JOIN mhtml_files f ON f.id = a.file_id
+                WHERE a.alias_path = ?
+            """, (alias_path,)).fetchone()
+        return row[0] if row else None
+
+    def remove_files(self, file_paths: List[str]) -> int:
+        """Delete files, their JSON data and any quarantine record from the index"""
+        removed = []
+
+        def delete(conn: sqlite3.Connection):
+            file_ids = []
+            for file_path in file_paths:
+                row = conn.execute("SELECT id FROM mhtml_files WHERE file_path = ?", (file_path,)).fetchone()
+                if row is not None:
+                    file_ids.append(row)
+            conn.executemany("DELETE FROM json_refs WHERE file_id = ?", file_ids)
+            conn.executemany("DELETE FROM file_aliases WHERE file_id = ?", file_ids)
+            conn.executemany("DELETE FROM mhtml_files WHERE id = ?", file_ids)
+            conn.executemany("DELETE FROM file_aliases WHERE alias_path = ?", [(path,) for path in file_paths])
+            released = conn.executemany("DELETE FROM quarantine WHERE file_path = ?",
+                                        [(path,) for path in file_paths]).rowcount
+            removed.append(len(file_ids))
+            if file_ids:
+                self._release_blobs(conn)
+            if file_ids or released:
+                self._bump_generation(conn)
+
+        if not file_paths:
+            return 0
+        self._submit(delete)
+        self.flush()
+        return sum(removed)
+
+    @staticmethod
+    def _bump_generation(conn: sqlite3.Connection):
+        conn.execute("""
+            INSERT INTO index_meta (key, value) VALUES ('generation', 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1
+        """)
+
+    def generation(self) -> int:
+        """Counter bumped by every committed change to indexed files, records, aliases or quarantine"""
+        with self._reader() as conn:
+            row = conn.execute("SELECT value FROM index_meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def identity(self) -> str:
+        """Random id given to the index when it was created"""
+        with self._reader() as conn:
+            return conn.execute("SELECT value FROM index_meta WHERE key = 'identity'").fetchone()[0]
+
+    def shard_paths(self) -> List[str]:
+        """Database files holding the index"""
+        return [self.db_path]
+
+    def merge(self, partial_paths: List[str], accept: Optional[Callable[[str], bool]] = None) -> int:
+        """Merge partial indexes (built with --part) into this one, returning the files merged.
+
+        Each partial is attached and copied table by table with INSERT ...
+        SELECT, its ids shifted past those already used here; a file already
+        indexed here is replaced by the partial's copy. Only files for which
+        accept(file_path) holds are taken. Into a compressed index, blobs are
+        copied as they are when both sides share the partial's compression
+        dictionaries, and re-encoded otherwise; into an uncompressed one they
+        are stored as text. The full-text and value indexes are rebuilt
+        once after all partials are in. A partial that fails to copy is
+        rolled back and its error raised once the others are done.
+        """
+        for partial_path in partial_paths:
+            self.upgrade(partial_path)
+        merged = []
+        failures = []
+
+        def copy_from(partial_path: str):
+            def copy(conn: sqlite3.Connection):
+                conn.create_function('merge_accept', 1, lambda file_path: bool(accept is None or accept(file_path)))
+                conn.execute("ATTACH DATABASE ? AS part", (partial_path,))
+                adopted = {}
+                try:
+                    part_dictionaries = dict(conn.execute("SELECT id, dictionary FROM part.json_dictionaries"))
+                    conn.create_function('part_unpack', 1, JSONCodec(part_dictionaries).decode)
+                    if not self.codec.compress:
+                        # Stored here as text, however the partial stored them
+                        data = "part_unpack(b.data)"
                     else:
-                        results.append(dict(zip([desc[0] for desc in cursor.description], row)))
+                        if not self.codec.dictionaries and part_dictionaries:
+                            # Nothing encoded here with a dictionary yet: take the partial's
+                            adopted = part_dictionaries
+                            conn.executemany("INSERT INTO main.json_dictionaries (id, dictionary) VALUES (?, ?)",
+                                             adopted.items())
+                        shared = {**self.codec.dictionaries, **adopted}
+                        if all(shared.get(i) == dictionary for i, dictionary in part_dictionaries.items()):
+                            data = "b.data"
+                        else:
+                            data = "json_pack(part_unpack(b.data))"
+
+                    file_shift = self._next_id(conn, 'mhtml_files')
+                    record_shift = self._next_id(conn, 'json_refs')
+                    chosen = "SELECT id FROM part.mhtml_files WHERE merge_accept(file_path)"
+                    replaced = f"""
+                        SELECT m.id FROM main.mhtml_files m JOIN part.mhtml_files p USING (file_path)
+                        WHERE p.id IN ({chosen})
+                    """
+                    conn.execute(f"DELETE FROM main.json_refs WHERE file_id IN ({replaced})")
+                    conn.execute(f"DELETE FROM main.file_aliases WHERE file_id IN ({replaced})")
+                    conn.execute(f"DELETE FROM main.mhtml_files WHERE id IN ({replaced})")
+
+                    cursor = conn.execute(f"""
+                        INSERT INTO main.mhtml_files
+                        (id, file_path, file_size, modified_time, indexed_time, json_count, content_hash)
+                        SELECT id + ?, file_path, file_size, modified_time, indexed_time, json_count, content_hash
+                        FROM part.mhtml_files WHERE id IN ({chosen})
+                    """, (file_shift,))
+                    merged.append(cursor.rowcount)
+                    conn.execute(f"""
+                        INSERT INTO main.json_blobs (hash, data)
+                        SELECT b.hash, {data} FROM part.json_blobs b
+                        WHERE b.hash IN (SELECT json_hash FROM part.json_refs WHERE file_id IN ({chosen}))
+                          AND NOT EXISTS (SELECT 1 FROM main.json_blobs m WHERE m.hash = b.hash)
+                    """)
+                    conn.execute(f"""
+                        INSERT INTO main.json_refs (id, file_id, json_hash)
+                        SELECT id + ?, file_id + ?, json_hash
+                        FROM part.json_refs WHERE file_id IN ({chosen})
+                    """, (record_shift, file_shift))
+                    conn.execute(f"""
+                        INSERT INTO main.json_values
+                        SELECT v.record_id + ?, v.json_path, v.value_text, v.value_num, v.value_bool
+                        FROM part.json_values v JOIN part.json_refs j ON j.id = v.record_id
+                        WHERE j.file_id IN ({chosen})
+                    """, (record_shift,))
+                    conn.execute(f"""
+                        INSERT OR REPLACE INTO main.file_aliases (alias_path, file_id)
+                        SELECT alias_path, file_id + ? FROM part.file_aliases WHERE file_id IN ({chosen})
+                    """, (file_shift,))
+                    conn.execute("""
+                        INSERT OR REPLACE INTO main.quarantine
+                        SELECT * FROM part.quarantine WHERE merge_accept(file_path)
+                    """)
+                    self._release_blobs(conn)
+                    self._bump_generation(conn)
+                    # A database cannot be detached inside the transaction that used it
+                    conn.commit()
+                    self.codec.dictionaries.update(adopted)
+                finally:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    conn.execute("DETACH DATABASE part")
+
+            def guarded(conn: sqlite3.Connection):
+                # The writer loop only logs errors; keep it for the caller
+                try:
+                    copy(conn)
+                except Exception as e:
+                    failures.append(e)
+
+            return guarded
+
+        self.begin_bulk_load()
+        for partial_path in partial_paths:
+            self._submit(copy_from(partial_path))
+        self.end_bulk_load()
+        if failures:
+            raise failures[0]
+        return sum(merged)
+
+    @classmethod
+    def upgrade(cls, db_path: str):
+        """Bring an index written by an older version to the current schema.
+
+        Raises FileNotFoundError for a missing file and ValueError for a
+        database that is not an index of this or an earlier version, rather
+        than creating an empty index in it.
+        """
+        if not os.path.isfile(db_path):
+            raise FileNotFoundError(f"Index not found: {db_path}")
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            conn.close()
+        # Version 1 kept records in json_data; later versions in json_refs and json_blobs
+        records = {'json_refs', 'json_blobs'} if version >= 2 else {'json_data'}
+        if version > cls.SCHEMA_VERSION or not {'mhtml_files'} | records <= tables:
+            raise ValueError(f"Not an MHTML index this version can read: {db_path}")
+        if version < cls.SCHEMA_VERSION:
+            cls(db_path).close()
 
-                return results
+    @staticmethod
+    def _next_id(conn: sqlite3.Connection, table: str) -> int:
+        """Highest id ever used in an AUTOINCREMENT table of the main database"""
+        row = conn.execute("SELECT seq FROM main.sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        used = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM main.{table}").fetchone()[0]
+        return max(used, row[0] if row else 0)
+
+    def _submit(self, operation: Callable[[sqlite3.Connection], None]):
+        """Run operation(conn) on the writer thread, in order with queued files"""
+        self._ensure_writer()
+        self._write_queue.put(operation)
+
+    def flush(self):
+        """Block until every queued write has been committed"""
+        if self._writer is None:
+            return
+        committed = threading.Event()
+        self._write_queue.put(committed)
+        committed.wait()
+
+    def close(self):
+        """Commit pending writes, stop the writer thread and close the index"""
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join()
+            self._writer = None
+        while True:
+            try:
+                self._idle_readers.get_nowait().close()
+            except queue.Empty:
+                break
+        self.conn.close()
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._writer_loop, name='sqlite-writer', daemon=True)
+                    self._writer.start()
+
+    def _writer_loop(self):
+        """Drain the write queue, committing every batch_size files or commit_interval seconds"""
+        conn = self._connect()
+        batch = []
+        waiters = []
+        deadline = None
+        running = True
+
+        while running:
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                item = self._write_queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+
+            if item is None:
+                running = False
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif callable(item):
+                if batch:
+                    self._write_batch(conn, batch)
+                    batch = []
+                    deadline = None
+                try:
+                    with conn:
+                        item(conn)
+                except Exception as e:
+                    print(f"Index maintenance error: {e}")
+            elif item:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.time() + self.commit_interval
+
+            if batch and (len(batch) >= self.batch_size or not running or waiters
+                          or time.time() >= deadline):
+                self._write_batch(conn, batch)
+                batch = []
+                deadline = None
+
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+
+        conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Tuple[str, int, float, float, List[str], Optional[str]]]):
+        """Write a batch of files in a single transaction"""
+        # The first dictionary is trained in its own transaction, before any record uses it
+        if (self.codec.compress and self.codec.current is None
+                and len(self._training_samples) < JSONCodec.TRAIN_RECORDS):
+            for item in batch:
+                self._training_samples.extend(item[4][:JSONCodec.TRAIN_RECORDS - len(self._training_samples)])
+            if len(self._training_samples) >= JSONCodec.TRAIN_RECORDS:
+                try:
+                    self._train_dictionary(conn, self._training_samples)
+                except sqlite3.Error as e:
+                    print(f"Could not store compression dictionary: {e}")
+
+        try:
+            with conn:
+                json_rows = []
+                file_ids = []
+                for file_path, file_size, modified_time, indexed_time, json_texts, content_hash in batch:
+                    # Insert or update file record in place, keeping its id
+                    conn.execute("""
+                        INSERT INTO mhtml_files
+                        (file_path, file_size, modified_time, indexed_time, json_count, content_hash)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(file_path) DO UPDATE SET
+                            file_size = excluded.file_size,
+                            modified_time = excluded.modified_time,
+                            indexed_time = excluded.indexed_time,
+                            json_count = excluded.json_count,
+                            content_hash = excluded.content_hash
+                    """, (file_path, file_size, modified_time, indexed_time, len(json_texts), content_hash))
+
+                    file_id = conn.execute(
+                        "SELECT id FROM mhtml_files WHERE file_path = ?", (file_path,)).fetchone()[0]
+                    file_ids.append((file_id,))
+                    json_rows.extend((file_id, bytes_digest(json_text.encode('utf-8')), json_text)
+                                     for json_text in json_texts)
+
+                if self._scanning:
+                    conn.executemany("INSERT OR IGNORE INTO temp.seen_files VALUES (?)",
+                                     [(item[0],) for item in batch])
+
+                # Clear old JSON data, keeping its blobs until the new records are in
+                replaced = set()
+                for (file_id,) in file_ids:
+                    replaced.update(json_hash for (json_hash,) in conn.execute(
+                        "SELECT json_hash FROM json_refs WHERE file_id = ?", (file_id,)))
+                conn.executemany("DELETE FROM json_refs WHERE file_id = ?", file_ids)
+
+                # Identical records share one blob
+                self._store_blobs(conn, {json_hash: json_text for _, json_hash, json_text in json_rows})
+
+                # Insert JSON objects; AUTOINCREMENT ids follow insertion order
+                last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM json_refs").fetchone()[0]
+                conn.executemany("INSERT INTO json_refs (file_id, json_hash) VALUES (?, ?)",
+                                 [row[:2] for row in json_rows])
+                record_ids = conn.execute("SELECT id FROM json_refs WHERE id > ? ORDER BY id", (last_id,))
+                self._insert_values(conn, ((record_id, row[2]) for (record_id,), row in zip(record_ids, json_rows)))
+                self._release_blobs(conn, replaced.difference(row[1] for row in json_rows))
+                self._bump_generation(conn)
 
         except Exception as e:
-            print(f"Search error: {e}")
-            return []
+            print(f"Error indexing batch of {len(batch)} files: {e}")
+
+    # Rows fetched from a cursor at a time while streaming
+    FETCH_SIZE = 1000
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Execute search query: SQL if it starts with SELECT, else full-text"""
+        return list(self.iter_search(query, limit))
+
+    def iter_search(self, query: str, limit: Optional[int] = None,
+                    offset: int = 0) -> Generator[Dict[str, Any], None, None]:
+        """Stream search results: SQL if the query starts with SELECT, else full-text.
+
+        limit and offset are applied in SQL, and rows are fetched from the
+        cursor as they are consumed, so memory use does not depend on the
+        size of the result set. A failing query raises sqlite3.Error, also
+        when it fails partway through the rows.
+        """
+        if not query.upper().startswith('SELECT'):
+            yield from self.iter_search_fts(query, limit, offset)
+            return
+
+        sql = f"SELECT * FROM {_subquery(query)} LIMIT ? OFFSET ?"
+        with self._reader() as conn:
+            # Direct SQL query
+            cursor = conn.execute(sql, (-1 if limit is None else limit, offset))
+            columns = [desc[0] for desc in cursor.description]
+            for row in self._stream(cursor):
+                if len(row) >= 2:
+                    yield {
+                        'file_path': row[0],
+                        'json_data': row[1] if isinstance(row[1], str) else str(row[1])
+                    }
+                else:
+                    yield dict(zip(columns, row))
+
+    def _stream(self, cursor: sqlite3.Cursor) -> Generator[Tuple, None, None]:
+        while True:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                return
+            yield from rows
+
+    def where(self, predicates: List[str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Records matching every 'path op value' predicate, via the json_values indexes"""
+        return list(self.iter_where(predicates, limit))
+
+    def iter_where(self, predicates: List[str], limit: Optional[int] = None,
+                   offset: int = 0) -> Generator[Dict[str, Any], None, None]:
+        """Stream records matching every 'path op value' predicate.
+
+        Each predicate becomes an index range or equality lookup on
+        (json_path, value); their record ids are intersected, so all
+        predicates must hold within the same JSON object.
+        """
+        if not predicates:
+            raise ValueError("At least one predicate is required")
+        lookups, params = [], []
+        for predicate in predicates:
+            sql, predicate_params = compile_predicate(predicate)
+            lookups.append(sql)
+            params.extend(predicate_params)
+
+        sql = f"""
+            SELECT f.file_path, j.json_text AS json_data
+            FROM json_data j
+            JOIN mhtml_files f ON j.file_id = f.id
+            WHERE j.id IN ({' INTERSECT '.join(lookups)})
+            LIMIT ? OFFSET ?
+        """
+        params += [-1 if limit is None else limit, offset]
+
+        with self._reader() as conn:
+            cursor = conn.execute(sql, params)
+            columns = [desc[0] for desc in cursor.description]
+            for row in self._stream(cursor):
+                yield dict(zip(columns, row))
+
+    def search_fts(self, query: str, limit: Optional[int] = None,
+                   highlight: bool = False) -> List[Dict[str, Any]]:
+        """Full-text search ranked by bm25, best matches first"""
+        return list(self.iter_search_fts(query, limit, highlight=highlight))
+
+    def iter_search_fts(self, query: str, limit: Optional[int] = None, offset: int = 0,
+                        highlight: bool = False) -> Generator[Dict[str, Any], None, None]:
+        """Stream full-text matches ranked by bm25, best matches first.
+
+        Returns a snippet around the matched terms, or the whole record with
+        matches highlighted when highlight is True. The limit is applied in
+        SQL so only the top-k rows are ranked out of the FTS index.
+        """
+        marked = ("highlight(json_fts, 0, '[', ']')" if highlight
+                  else "snippet(json_fts, 0, '[', ']', '…', 16)")
+        sql = f"""
+            SELECT f.file_path, j.json_text AS json_data,
+                   bm25(json_fts) AS score, {marked} AS {'highlight' if highlight else 'snippet'}
+            FROM json_fts
+            JOIN json_data j ON json_fts.rowid = j.id
+            JOIN mhtml_files f ON j.file_id = f.id
+            WHERE json_fts MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        """
+        params = (query, -1 if limit is None else limit, offset)
+
+        with self._reader() as conn:
+            try:
+                cursor = conn.execute(sql, params)
+            except sqlite3.OperationalError:
+                # Not valid FTS5 query syntax: search for it as a phrase
+                phrase = '"' + query.replace('"', '""') + '"'
+                cursor = conn.execute(sql, (phrase,) + params[1:])
+
+            columns = [desc[0] for desc in cursor.description]
+            for row in self._stream(cursor):
+                yield dict(zip(columns, row))
+
+
+class ShardedIndex:
+    """Index split across several SQLite files, each with its own writer.
+
+    Files are routed to a shard by a stable hash of their path ('hash') or
+    of their directory ('prefix', which keeps a directory's files
+    together). Every shard commits on its own writer thread, so indexing
+    writes to all shards in parallel, and queries fan out to all shards at
+    once and merge their rows. The shard count and routing are stored next
+    to db_path, so a sharded index is reopened with the same layout.
+
+    Queries run per shard: aggregates (COUNT, GROUP BY) come back as one
+    row per shard, and bm25 scores are ranked by each shard's statistics.
+    """
+
+    FETCH_SIZE = SQLiteIndex.FETCH_SIZE
+    ROUTES = ('hash', 'prefix')
+
+    def __init__(self, db_path: str = None, shards: Optional[int] = None, by: Optional[str] = None,
+                 batch_size: int = 500, commit_interval: float = 1.0, max_readers: int = None,
+                 compress: bool = False):
+        if db_path is None:
+            db_path = os.path.join(tempfile.gettempdir(), 'mhtml_search.db')
+        self.db_path = db_path
+
+        layout = self.read_layout(db_path)
+        if layout is not None:
+            if shards not in (None, layout['shards']) or by not in (None, layout['by']):
+                raise ValueError(f"{db_path} is sharded {layout['shards']} ways by {layout['by']}")
+            shards, by = layout['shards'], layout['by']
+        by = by or 'hash'
+        if by not in self.ROUTES:
+            raise ValueError(f"Unknown shard routing: {by}")
+        if not shards or shards < 1:
+            raise ValueError("Shard count must be at least 1")
+        self.by = by
+
+        root, ext = os.path.splitext(db_path)
+        self.shards = [SQLiteIndex(f"{root}.{i:03d}-of-{shards:03d}{ext or '.db'}", batch_size,
+                                   commit_interval, max_readers, compress)
+                       for i in range(shards)]
+        if layout is None:
+            with open(self.layout_path(db_path), 'w', encoding='utf-8') as f:
+                json.dump({'shards': shards, 'by': by}, f)
+
+    @staticmethod
+    def layout_path(db_path: str) -> str:
+        return db_path + '.shards.json'
+
+    @classmethod
+    def read_layout(cls, db_path: str) -> Optional[Dict[str, Any]]:
+        """Stored {'shards': N, 'by': routing} of a sharded index, or None"""
+        try:
+            with open(cls.layout_path(db_path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def shard_for(self, file_path: str) -> SQLiteIndex:
+        key = os.path.dirname(file_path) if self.by == 'prefix' else file_path
+        # crc32 rather than hash(): routing must not change between runs
+        return self.shards[zlib.crc32(os.fsencode(key)) % len(self.shards)]
+
+    def _group(self, file_paths: Iterable[str]) -> Dict[SQLiteIndex, List[str]]:
+        groups = {}
+        for file_path in file_paths:
+            groups.setdefault(self.shard_for(file_path), []).append(file_path)
+        return groups
+
+    def shard_paths(self) -> List[str]:
+        return [shard.db_path for shard in self.shards]
+
+    # Writes: routed by path, or applied to every shard
+
+    def is_empty(self) -> bool:
+        return all(shard.is_empty() for shard in self.shards)
+
+    def begin_bulk_load(self):
+        for shard in self.shards:
+            shard.begin_bulk_load()
+
+    def end_bulk_load(self):
+        for shard in self.shards:
+            shard.end_bulk_load()
+
+    def add_file(self, file_path: str, json_objects: List[Dict[str, Any]]):
+        self.shard_for(file_path).add_file(file_path, json_objects)
+
+    def add_serialized(self, file_path: str, json_texts: List[str], content_hash: Optional[str] = None):
+        self.shard_for(file_path).add_serialized(file_path, json_texts, content_hash)
+
+    def get_fingerprint(self, file_path: str) -> Optional[Tuple[int, float, Optional[str]]]:
+        return self.shard_for(file_path).get_fingerprint(file_path)
+
+    def begin_scan(self, resume: bool = False):
+        for shard in self.shards:
+            shard.begin_scan(resume)
+
+    def mark_unchanged(self, file_paths: List[str], touched: List[Tuple[float, str]] = ()):
+        touched_by_shard = {}
+        for modified_time, file_path in touched:
+            touched_by_shard.setdefault(self.shard_for(file_path), []).append((modified_time, file_path))
+        for shard, paths in self._group(file_paths).items():
+            shard.mark_unchanged(paths, touched_by_shard.pop(shard, ()))
+        for shard, shard_touched in touched_by_shard.items():
+            shard.mark_unchanged([], shard_touched)
+
+    def end_scan(self, roots: List[str], unlisted: Iterable[str] = ()) -> int:
+        unlisted = list(unlisted)
+        return sum(shard.end_scan(roots, unlisted) for shard in self.shards)
+
+    def save_checkpoint(self, checkpoint: IndexCheckpoint):
+        """Save progress in the first shard once every other shard has committed its queued files"""
+        for shard in self.shards[1:]:
+            shard.save_seen()
+            shard.flush()
+        self.shards[0].save_checkpoint(checkpoint)
+
+    def load_checkpoint(self) -> Optional[Tuple[List[str], List[str], List[str], List[str]]]:
+        return self.shards[0].load_checkpoint()
+
+    def quarantine(self, file_path: str, reason: str):
+        self.shard_for(file_path).quarantine(file_path, reason)
+
+    def get_quarantined(self, file_path: str) -> Optional[Tuple[int, float, str]]:
+        return self.shard_for(file_path).get_quarantined(file_path)
+
+    def record_aliases(self, pairs: List[Tuple[str, str]], replace_roots: List[str] = ()):
+        """Store alias pairs in the shards of both paths; the one holding the indexed file keeps it"""
+        pairs_by_shard = {shard: [] for shard in self.shards}
+        for pair in pairs:
+            for shard in {self.shard_for(pair[0]), self.shard_for(pair[1])}:
+                pairs_by_shard[shard].append(pair)
+        for shard, shard_pairs in pairs_by_shard.items():
+            shard.record_aliases(shard_pairs, replace_roots)
+
+    def alias_owner(self, alias_path: str) -> Optional[str]:
+        for shard in self.shards:
+            owner = shard.alias_owner(alias_path)
+            if owner is not None:
+                return owner
+        return None
+
+    def remove_files(self, file_paths: List[str]) -> int:
+        return sum(shard.remove_files(paths) for shard, paths in self._group(file_paths).items())
+
+    def generation(self) -> int:
+        # Every shard's counter only grows, so their sum changes whenever any shard does
+        return sum(shard.generation() for shard in self.shards)
+
+    def identity(self) -> str:
+        return self.shards[0].identity()
+
+    def flush(self):
+        for shard in self.shards:
+            shard.flush()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def merge(self, partial_paths: List[str], accept: Optional[Callable[[str], bool]] = None) -> int:
+        """Merge partial indexes into every shard at once, each taking the files routed to it"""
+        for partial_path in partial_paths:
+            # Upgraded once here rather than by every shard at the same time
+            SQLiteIndex.upgrade(partial_path)
+
+        def merge_shard(shard: SQLiteIndex) -> int:
+            return shard.merge(partial_paths, lambda file_path: self.shard_for(file_path) is shard
+                               and (accept is None or accept(file_path)))
+
+        with ThreadPoolExecutor(max_workers=len(self.shards)) as executor:
+            return sum(executor.map(merge_shard, self.shards))
+
+    # Queries: fanned out to every shard and merged
+
+    def _fan_out(self, query: Callable[[SQLiteIndex, Optional[int]], Iterable[Dict[str, Any]]],
+                 limit: Optional[int], offset: int, order_by: Optional[str] = None,
+                 descending: bool = False) -> Generator[Dict[str, Any], None, None]:
+        """Run query(shard, shard_limit) on all shards at once and apply limit and offset to the merge.
+
+        Each shard returns at most offset + limit rows, the most the merged
+        page can take from it. With order_by, every shard's rows must be
+        sorted on that column and are merged in order.
+        """
+        shard_limit = None if limit is None else offset + limit
+        streams = [query(shard, shard_limit) for shard in self.shards]
+        key = (lambda row: row[order_by]) if order_by else None
+        merged = _fan_in(streams, self.FETCH_SIZE, key, descending)
+        try:
+            yield from itertools.islice(merged, offset, shard_limit)
+        finally:
+            merged.close()
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return list(self.iter_search(query, limit))
+
+    # SQL whose result is not the union of its per-shard results
+    _SHARD_LOCAL_SQL = re.compile(
+        r"\b(?:ORDER\s+BY|LIMIT|OFFSET|GROUP\s+BY|HAVING|DISTINCT|OVER)\b"
+        r"|\b(?:COUNT|SUM|AVG|MIN|MAX|TOTAL|GROUP_CONCAT|JSON_GROUP_ARRAY|JSON_GROUP_OBJECT)\s*\(",
+        re.IGNORECASE)
+
+    def iter_search(self, query: str, limit: Optional[int] = None, offset: int = 0,
+                    order_by: Optional[str] = None, descending: bool = False) -> Generator[Dict[str, Any], None, None]:
+        """Stream search results from all shards.
+
+        Full-text results are merged by score, keeping the top-k overall.
+        SQL rows arrive as shards produce them, or merged on the order_by
+        column when the query sorts by it. Other SQL that sorts, limits or
+        aggregates would be applied per shard, not to the whole index, so
+        it is refused with ValueError.
+        """
+        if not query.upper().startswith('SELECT'):
+            return self.iter_search_fts(query, limit, offset)
+        if order_by is None:
+            # String literals and quoted names are not SQL clauses
+            bare = re.sub(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"", "''", query)
+            clause = self._SHARD_LOCAL_SQL.search(bare)
+            if clause is not None:
+                raise ValueError(f"{clause.group(0).strip().upper()} would apply to each of the "
+                                 f"{len(self.shards)} shards separately; not supported on a sharded index")
+        return self._fan_out(lambda shard, shard_limit: shard.iter_search(query, shard_limit),
+                             limit, offset, order_by, descending)
+
+    def where(self, predicates: List[str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return list(self.iter_where(predicates, limit))
+
+    def iter_where(self, predicates: List[str], limit: Optional[int] = None,
+                   offset: int = 0) -> Generator[Dict[str, Any], None, None]:
+        if not predicates:
+            raise ValueError("At least one predicate is required")
+        return self._fan_out(lambda shard, shard_limit: shard.iter_where(predicates, shard_limit),
+                             limit, offset)
+
+    def search_fts(self, query: str, limit: Optional[int] = None,
+                   highlight: bool = False) -> List[Dict[str, Any]]:
+        return list(self.iter_search_fts(query, limit, highlight=highlight))
+
+    def iter_search_fts(self, query: str, limit: Optional[int] = None, offset: int = 0,
+                        highlight: bool = False) -> Generator[Dict[str, Any], None, None]:
+        """Full-text matches of all shards, merged best first by bm25 score (lower is better)"""
+        return self._fan_out(
+            lambda shard, shard_limit: shard.iter_search_fts(query, shard_limit, highlight=highlight),
+            limit, offset, order_by='score')
+
+
+def _sql_string(text: str) -> str:
+    """Quote text as a SQL string literal, for paths DuckDB only takes inline"""
+    return "'" + text.replace("'", "''") + "'"
 
 
 class DuckDBQueryEngine:
@@ -374,46 +2890,609 @@ class DuckDBQueryEngine:
         except:
             pass
 
-    def create_temp_table(self, search_results: List[SearchResult], table_name: str = 'mhtml_data'):
+    def create_temp_table(self, search_results: Iterable[SearchResult], table_name: str = 'mhtml_data'):
         """Create temporary table from search results"""
-        # Prepare data for DuckDB
-        rows = []
-        for result in search_results:
-            for json_obj in result.json_data:
-                rows.append({
-                    'file_path': result.file_path,
-                    'file_size': result.file_size,
-                    'modified_time': result.modified_time,
-                    'json_data': json.dumps(json_obj)
-                })
+        with self.bulk_loader(table_name) as loader:
+            for result in search_results:
+                loader.append(result)
 
-        if rows:
-            # Create table from Python data
-            self.conn.execute(f"""
-                CREATE OR REPLACE TABLE {table_name} AS 
-                SELECT * FROM (VALUES {','.join(['(?,?,?,?)'] * len(rows))})
-                AS t(file_path, file_size, modified_time, json_data)
-            """, [item for row in rows for item in
-                  [row['file_path'], row['file_size'], row['modified_time'], row['json_data']]])
+    def bulk_loader(self, table_name: str = 'mhtml_data') -> 'DuckDBBulkLoader':
+        """Start an empty table that search results can be appended to while scanning"""
+        return DuckDBBulkLoader(self.conn, table_name)
+
+    def attach_snapshot(self, snapshot_path: str):
+        """Expose a Parquet snapshot as views: files, records, json_values and mhtml_data.
+
+        The views read the Parquet files directly, so filters and projections
+        are pushed down into the scans instead of loading the index first.
+        """
+        files = os.path.join(snapshot_path, 'files.parquet')
+        records = os.path.join(snapshot_path, 'records', '*', '*.parquet')
+        values = os.path.join(snapshot_path, 'values', '*', '*.parquet')
+        self.conn.execute(f"CREATE OR REPLACE VIEW files AS SELECT * FROM read_parquet({_sql_string(files)})")
+        self.conn.execute(f"""
+            CREATE OR REPLACE VIEW records AS
+            SELECT * FROM read_parquet({_sql_string(records)}, hive_partitioning = true)
+        """)
+        self.conn.execute(f"""
+            CREATE OR REPLACE VIEW json_values AS
+            SELECT * FROM read_parquet({_sql_string(values)}, hive_partitioning = true)
+        """)
+        # Same shape as the table create_temp_table builds
+        self.conn.execute("""
+            CREATE OR REPLACE VIEW mhtml_data AS
+            SELECT f.file_path, f.file_size, f.modified_time, r.json_text AS json_data
+            FROM records r JOIN files f ON f.id = r.file_id
+        """)
 
     def query(self, sql: str) -> List[Dict[str, Any]]:
         """Execute SQL query and return results"""
+        return list(self.iter_query(sql))
+
+    def iter_query(self, sql: str, limit: Optional[int] = None,
+                   offset: int = 0) -> Generator[Dict[str, Any], None, None]:
+        """Stream query results in chunks, with limit and offset pushed into the query"""
+        if limit is not None or offset:
+            clauses = (f" LIMIT {int(limit)}" if limit is not None else "") + \
+                      (f" OFFSET {int(offset)}" if offset else "")
+            sql = f"SELECT * FROM {_subquery(sql)}{clauses}"
+        cursor = self.conn.execute(sql)
+        columns = [desc[0] for desc in cursor.description]
+        while True:
+            rows = cursor.fetchmany(SQLiteIndex.FETCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(zip(columns, row))
+
+
+class DuckDBBulkLoader:
+    """Append search results to a DuckDB table in bulk NDJSON chunks.
+
+    Rows are written to a temporary NDJSON file and inserted with one
+    read_json scan every CHUNK_ROWS rows, so loading runs alongside the scan
+    with no per-value parameters. Serialized JSON is embedded as-is and
+    read into a native JSON column, so queries can use json_data->>'$.name'
+    and friends with real types.
+    """
+
+    CHUNK_ROWS = 50_000
+    COLUMNS = "{'file_path': 'VARCHAR', 'file_size': 'BIGINT', 'modified_time': 'DOUBLE', 'json_data': 'JSON'}"
+
+    def __init__(self, conn, table_name: str = 'mhtml_data'):
+        self.conn = conn
+        self.table_name = table_name
+        self.rows = 0
+        self._pending = 0
+        conn.execute(f"""
+            CREATE OR REPLACE TABLE {table_name} (
+                file_path VARCHAR, file_size BIGINT, modified_time DOUBLE, json_data JSON
+            )
+        """)
+        fd, self.path = tempfile.mkstemp(prefix='mhtml-load-', suffix='.ndjson')
+        os.close(fd)
+        self._file = self._open()
+
+    def _open(self):
+        # Lone surrogates become JSON \u escapes rather than invalid UTF-8
+        return open(self.path, 'w', encoding='utf-8', errors='backslashreplace')
+
+    def __enter__(self) -> 'DuckDBBulkLoader':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, result: SearchResult):
+        prefix = (f'{{"file_path":{json.dumps(result.file_path)},"file_size":{int(result.file_size)},'
+                  f'"modified_time":{float(result.modified_time)!r},"json_data":')
+        for json_text in result.iter_json_texts():
+            self._file.write(prefix)
+            self._file.write(json_text)
+            self._file.write('}\n')
+            self._pending += 1
+        if self._pending >= self.CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Insert the staged rows into the table"""
+        if not self._pending:
+            return
+        self._file.close()
+        self.conn.execute(f"""
+            INSERT INTO {self.table_name}
+            SELECT * FROM read_json({_sql_string(self.path)}, format = 'newline_delimited', columns = {self.COLUMNS})
+        """)
+        self.rows += self._pending
+        self._pending = 0
+        self._file = self._open()
+
+    def close(self):
         try:
-            result = self.conn.execute(sql).fetchall()
-            columns = [desc[0] for desc in self.conn.description]
-            return [dict(zip(columns, row)) for row in result]
-        except Exception as e:
-            print(f"DuckDB query error: {e}")
-            return []
+            self.flush()
+        finally:
+            self._file.close()
+            os.remove(self.path)
+
+
+class ParquetSnapshot:
+    """Columnar Parquet copy of the index for DuckDB, re-exported only when the index changed.
+
+    Layout under directory:
+
+        manifest.json                     {"generation": N, "snapshot": "gen-N"}
+        gen-N/files.parquet               one row per indexed file
+        gen-N/records/part=K/*.parquet    JSON records, K = file_id // PARTITION_FILES
+        gen-N/values/part=K/*.parquet     flattened json_values leaves with their file_id
+
+    Records are sorted by id and values by (json_path, value), so Parquet
+    row-group statistics let DuckDB skip row groups for predicates on them.
+    The generation in the manifest is the index generation the export
+    started from; a newer index generation makes the snapshot stale.
+    """
+
+    PARTITION_FILES = 50_000
+    # Rows per NDJSON chunk staged for DuckDB
+    CHUNK_ROWS = 100_000
+
+    TABLES = {
+        'files': ("SELECT id, file_path, file_size, modified_time, indexed_time, json_count, content_hash "
+                  "FROM mhtml_files",
+                  {'id': 'BIGINT', 'file_path': 'VARCHAR', 'file_size': 'BIGINT', 'modified_time': 'DOUBLE',
+                   'indexed_time': 'DOUBLE', 'json_count': 'INTEGER', 'content_hash': 'VARCHAR'}),
+        'records': ("SELECT id, file_id, json_text FROM json_data",
+                    {'id': 'BIGINT', 'file_id': 'BIGINT', 'json_text': 'VARCHAR'}),
+        'values': ("SELECT v.record_id, j.file_id, v.json_path, v.value_text, v.value_num, v.value_bool "
+                   "FROM json_values v JOIN json_refs j ON j.id = v.record_id",
+                   {'record_id': 'BIGINT', 'file_id': 'BIGINT', 'json_path': 'VARCHAR', 'value_text': 'VARCHAR',
+                    'value_num': 'DOUBLE', 'value_bool': 'INTEGER'}),
+    }
+    ORDER = {
+        'files': 'id',
+        'records': 'id',
+        'values': 'json_path, value_num, value_text',
+    }
+
+    def __init__(self, index: Union[SQLiteIndex, ShardedIndex], directory: Optional[str] = None):
+        if not HAS_DUCKDB:
+            raise ImportError("DuckDB not available. Install with: pip install duckdb")
+        self.index = index
+        self.directory = directory or index.db_path + '.parquet'
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, 'manifest.json')
+
+    def _manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def current(self) -> Optional[str]:
+        """Path of the snapshot if it matches the index generation, else None"""
+        manifest = self._manifest()
+        if manifest is None or manifest.get('generation') != self.index.generation():
+            return None
+        path = os.path.join(self.directory, manifest['snapshot'])
+        return path if os.path.isdir(path) else None
+
+    def export(self, force: bool = False) -> str:
+        """Write a snapshot unless an up-to-date one exists; returns its path"""
+        if not force:
+            path = self.current()
+            if path is not None:
+                return path
+
+        os.makedirs(self.directory, exist_ok=True)
+        generation = self.index.generation()
+        name = f'gen-{generation}'
+        staging = tempfile.mkdtemp(prefix='.export-', dir=self.directory)
+        try:
+            self._write(staging, os.path.join(staging, name))
+            target = os.path.join(self.directory, name)
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(os.path.join(staging, name), target)
+
+            manifest_tmp = os.path.join(staging, 'manifest.json')
+            with open(manifest_tmp, 'w', encoding='utf-8') as f:
+                json.dump({'generation': generation, 'snapshot': name, 'exported': time.time()}, f)
+            os.replace(manifest_tmp, self.manifest_path)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        for entry in os.listdir(self.directory):
+            if entry.startswith('gen-') and entry != name:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+        return os.path.join(self.directory, name)
+
+    def _write(self, staging: str, snapshot_path: str):
+        """Stream the index through NDJSON chunks into Parquet with DuckDB"""
+        os.makedirs(snapshot_path)
+        shards = self.index.shards if isinstance(self.index, ShardedIndex) else [self.index]
+        stack = contextlib.ExitStack()
+        # Pooled readers have the functions that decode the json_data view registered
+        sources = [stack.enter_context(shard._reader()) for shard in shards]
+        engine = duckdb.connect(':memory:')
+        try:
+            # One read transaction per shard, so all tables come from the same index state
+            for source in sources:
+                source.execute("BEGIN")
+            for table, (sql, columns) in self.TABLES.items():
+                rows = itertools.chain.from_iterable(
+                    self._global_ids(source.execute(sql), list(columns), shard, len(sources))
+                    for shard, source in enumerate(sources))
+                pattern, count = self._stage_ndjson(rows, list(columns), staging, table)
+                spec = '{' + ', '.join(f"'{name}': '{kind}'" for name, kind in columns.items()) + '}'
+                scan = (f"SELECT * FROM read_json({_sql_string(pattern)}, format = 'newline_delimited', "
+                        f"columns = {spec})")
+                if table == 'files':
+                    target = _sql_string(os.path.join(snapshot_path, 'files.parquet'))
+                    engine.execute(f"COPY ({scan} ORDER BY {self.ORDER[table]}) TO {target} (FORMAT PARQUET)")
+                elif not count:
+                    # PARTITION_BY writes nothing for no rows; keep the glob readable
+                    target = os.path.join(snapshot_path, table, 'part=0')
+                    os.makedirs(target)
+                    target = _sql_string(os.path.join(target, 'data_0.parquet'))
+                    engine.execute(f"COPY ({scan}) TO {target} (FORMAT PARQUET)")
+                else:
+                    target = _sql_string(os.path.join(snapshot_path, table))
+                    engine.execute(f"""
+                        COPY (SELECT *, file_id // {self.PARTITION_FILES} AS part FROM ({scan})
+                              ORDER BY {self.ORDER[table]})
+                        TO {target} (FORMAT PARQUET, PARTITION_BY (part))
+                    """)
+        finally:
+            for source in sources:
+                source.rollback()
+            stack.close()
+            engine.close()
+
+    @staticmethod
+    def _global_ids(rows: Iterable[Tuple], columns: List[str], shard: int, shards: int) -> Iterable[Tuple]:
+        """Interleave the row ids of a sharded index so ids from different shards never collide"""
+        if shards == 1:
+            return rows
+        id_columns = [i for i, name in enumerate(columns) if name in ('id', 'file_id', 'record_id')]
+        return (tuple(value * shards + shard if i in id_columns else value for i, value in enumerate(row))
+                for row in rows)
+
+    def _stage_ndjson(self, rows: Iterable[Tuple], columns: List[str], staging: str,
+                      table: str) -> Tuple[str, int]:
+        """Write rows as NDJSON chunk files, returning their glob pattern and row count"""
+        count = 0
+        rows = iter(rows)
+        for chunk in itertools.count():
+            batch = list(itertools.islice(rows, self.CHUNK_ROWS))
+            if not batch and chunk:
+                break
+            # ASCII escapes keep undecodable file names intact in the staged text
+            with open(os.path.join(staging, f'{table}-{chunk:06d}.ndjson'), 'w', encoding='ascii') as f:
+                for row in batch:
+                    f.write(json.dumps(dict(zip(columns, row))))
+                    f.write('\n')
+            count += len(batch)
+            if not batch:
+                break
+        return os.path.join(staging, f'{table}-*.ndjson'), count
+
+
+class IndexSnapshot:
+    """Portable, compressed copy of an index for bootstrapping another machine.
+
+    The snapshot is a gzipped tar holding manifest.json and index.db. The
+    manifest records the format and schema versions, the roots the index
+    covers and a digest of the stored file fingerprints (path, size, mtime,
+    content hash). The fingerprints themselves travel in index.db, where a
+    reconcile run compares them against the files on disk. Machine-specific
+    state (scan progress, the directory journal) is left out.
+    """
+
+    FORMAT_VERSION = 1
+    COMPRESS_LEVEL = 6
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, index: SQLiteIndex, roots: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Write the snapshot from a consistent copy of index, returning its manifest"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        staging = tempfile.mkdtemp(prefix='.snapshot-', dir=directory)
+        try:
+            copy_path = os.path.join(staging, 'index.db')
+            index.flush()
+            source = sqlite3.connect(index.db_path)
+            target = sqlite3.connect(copy_path)
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+            try:
+                target.executescript("""
+                    DELETE FROM index_checkpoint;
+                    -- An imported copy is a new index, with an identity of its own
+                    DELETE FROM index_meta WHERE key = 'identity';
+                    DROP TABLE IF EXISTS scan_seen;
+                    DROP TABLE IF EXISTS dir_journal;
+                    DROP TABLE IF EXISTS dir_journal_staged;
+                """)
+                target.execute("PRAGMA journal_mode=DELETE")
+                target.execute("VACUUM")
+                manifest = self._describe(target, roots)
+            finally:
+                target.close()
+
+            manifest_bytes = json.dumps(manifest, indent=2).encode('utf-8')
+            archive = os.path.join(staging, 'snapshot.tar.gz')
+            with tarfile.open(archive, 'w:gz', compresslevel=self.COMPRESS_LEVEL) as tar:
+                info = tarfile.TarInfo('manifest.json')
+                info.size = len(manifest_bytes)
+                info.mtime = int(manifest['created'])
+                tar.addfile(info, io.BytesIO(manifest_bytes))
+                tar.add(copy_path, arcname='index.db')
+            os.replace(archive, self.path)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return manifest
+
+    def _describe(self, conn: sqlite3.Connection, roots: Optional[List[str]]) -> Dict[str, Any]:
+        if roots:
+            roots = [str(Path(root).resolve()) for root in roots]
+        else:
+            # The common directory of the lowest and highest paths is that of all of them
+            first, last = conn.execute("SELECT MIN(file_path), MAX(file_path) FROM mhtml_files").fetchone()
+            roots = [os.path.commonpath([os.path.dirname(first), os.path.dirname(last)])] if first else []
+
+        digest = hashlib.sha256()
+        files = 0
+        hashed = 0
+        for row in conn.execute("SELECT file_path, file_size, modified_time, content_hash "
+                                "FROM mhtml_files ORDER BY file_path"):
+            digest.update(json.dumps(row).encode('utf-8', 'backslashreplace'))
+            digest.update(b'\n')
+            files += 1
+            hashed += row[3] is not None
+        generation = conn.execute("SELECT value FROM index_meta WHERE key = 'generation'").fetchone()
+
+        return {
+            'format_version': self.FORMAT_VERSION,
+            'schema_version': conn.execute("PRAGMA user_version").fetchone()[0],
+            'created': time.time(),
+            'roots': roots,
+            'generation': generation[0] if generation else 0,
+            'fingerprints': {'files': files, 'content_hashed': hashed, 'sha256': digest.hexdigest()},
+        }
+
+    def manifest(self) -> Dict[str, Any]:
+        with tarfile.open(self.path, 'r:gz') as tar:
+            return self._read_manifest(tar)
+
+    def _read_manifest(self, tar: tarfile.TarFile) -> Dict[str, Any]:
+        manifest = json.load(tar.extractfile('manifest.json'))
+        if manifest.get('format_version') != self.FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {manifest.get('format_version')}")
+        if manifest.get('schema_version', 0) > SQLiteIndex.SCHEMA_VERSION:
+            raise ValueError(f"Snapshot schema {manifest['schema_version']} is newer than this tool supports "
+                             f"({SQLiteIndex.SCHEMA_VERSION})")
+        return manifest
+
+    def restore(self, db_path: str, roots: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Unpack the index to db_path, moving paths under the saved roots to roots if given"""
+        staging = db_path + '.restore'
+        with tarfile.open(self.path, 'r:gz') as tar:
+            manifest = self._read_manifest(tar)
+            # Copied out of the member rather than extracted, so no archive path is trusted
+            with tar.extractfile('index.db') as source, open(staging, 'wb') as target:
+                shutil.copyfileobj(source, target, 1 << 20)
+
+        try:
+            if roots:
+                roots = [str(Path(root).resolve()) for root in roots]
+                if len(roots) != len(manifest['roots']):
+                    raise ValueError(f"Snapshot covers {len(manifest['roots'])} roots, got {len(roots)}")
+                self._relocate(staging, zip(manifest['roots'], roots))
+                manifest['roots'] = roots
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+            os.replace(staging, db_path)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+        return manifest
+
+    @staticmethod
+    def _relocate(db_path: str, moves: Iterable[Tuple[str, str]]):
+        """Rewrite stored paths from each old root to its new root"""
+        conn = sqlite3.connect(db_path)
+        try:
+            with conn:
+                for old, new in moves:
+                    if old == new:
+                        continue
+                    root, prefix, upper = _subtree_range(old)
+                    new_prefix = new if new.endswith(os.sep) else new + os.sep
+                    for table, column in (('mhtml_files', 'file_path'), ('file_aliases', 'alias_path'),
+                                          ('quarantine', 'file_path')):
+                        conn.execute(f"""
+                            UPDATE {table}
+                            SET {column} = CASE WHEN {column} = ? THEN ? ELSE ? || substr({column}, ?) END
+                            WHERE {column} = ? OR ({column} >= ? AND {column} < ?)
+                        """, (root, new, new_prefix, len(prefix) + 1, root, prefix, upper))
+        finally:
+            conn.close()
+
+
+class QueryCache:
+    """Results of index queries kept between index updates, in a SQLite file beside the index.
+
+    Entries are keyed by a digest of the query kind, the normalised query,
+    its parameters and the index generation, and hold the result rows as
+    compressed JSON. Every committed change bumps the generation, so older
+    entries are never hit again; they are dropped when a newer one is
+    stored. The total size is bounded by max_bytes, evicting the least
+    recently used entries first. Queries whose result depends on more than
+    the index contents (random(), the current time) are never cached.
+    """
+
+    # A single result may take at most this share of the cache
+    MAX_ENTRY_SHARE = 4
+    # Rows collected from a result stream before it is given up as too large to cache
+    MAX_ROWS = 10_000
+    # Quoted literals, kept as written, and whitespace runs, collapsed to one space
+    _TOKENS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+")
+    # SQLite and DuckDB functions and keywords whose value changes between runs
+    _VOLATILE = re.compile(r"\b(?:random|randomblob|uuid|gen_random_uuid|now|get_current_time|changes|"
+                           r"total_changes|last_insert_rowid)\s*\(|\bcurrent_(?:timestamp|date|time)\b|'now'",
+                           re.IGNORECASE)
+
+    def __init__(self, path: str, max_bytes: int, identity: str):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    key TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    used REAL NOT NULL,
+                    rows BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    key TEXT PRIMARY KEY,
+                    value
+                );
+            """)
+            # Results of an earlier index at the same path are no answer for this one
+            row = self.conn.execute("SELECT value FROM cache_meta WHERE key = 'identity'").fetchone()
+            if row is None or row[0] != identity:
+                with self.conn:
+                    self.conn.execute("DELETE FROM query_cache")
+                    self.conn.execute("INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('identity', ?)",
+                                      (identity,))
+        except sqlite3.Error:
+            self.conn.close()
+            raise
+        self.lock = threading.Lock()
+
+    @classmethod
+    def normalise(cls, query: str) -> str:
+        """Query text with whitespace outside quoted literals collapsed, so reformatted queries share entries"""
+        return cls._TOKENS.sub(lambda m: m.group() if m.group()[0] in '\'"' else ' ', query).rstrip()
+
+    @classmethod
+    def cacheable(cls, query: str) -> bool:
+        """Whether the query's result is fixed by the index contents alone"""
+        return not cls._VOLATILE.search(query)
+
+    def key(self, kind: str, query: str, params: List[Any], generation: int) -> str:
+        text = json.dumps([kind, self.normalise(query), params, generation], ensure_ascii=False)
+        return bytes_digest(text.encode('utf-8'))
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached rows for key, or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT rows FROM query_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            try:
+                with self.conn:
+                    self.conn.execute("UPDATE query_cache SET used = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.OperationalError:
+                # Another process holds the cache; the hit is still good
+                pass
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, generation: int, rows: List[Dict[str, Any]]) -> bool:
+        """Store rows under key, evicting least recently used entries over max_bytes"""
+        try:
+            data = zlib.compress(json.dumps(rows, ensure_ascii=False).encode('utf-8'))
+        except (TypeError, ValueError):
+            # Values JSON cannot carry, such as BLOB columns
+            return False
+        if len(data) > self.max_bytes // self.MAX_ENTRY_SHARE:
+            return False
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("DELETE FROM query_cache WHERE generation < ?", (generation,))
+                self.conn.execute("INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?)",
+                                  (key, generation, len(data), time.time(), data))
+                self.conn.execute("""
+                    DELETE FROM query_cache WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY used DESC, key) AS kept FROM query_cache
+                        ) WHERE kept > ?
+                    )
+                """, (self.max_bytes,))
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def close(self):
+        self.conn.close()
 
 
 class MHTMLSearchTool:
     """Main search tool orchestrator"""
 
-    def __init__(self, index_path: str = None, max_workers: int = None):
-        self.scanner = PlatformFileScanner(max_workers)
+    # Files per task handed to a worker process
+    PROCESS_BATCH_SIZE = 32
+    # Discovered paths buffered between the scanner and the workers
+    QUEUE_SIZE = 1024
+
+    def __init__(self, index_path: str = None, max_workers: int = None, processes: int = None,
+                 batch_size: int = 500, commit_interval: float = 1.0, content_hash: bool = False,
+                 journal: bool = False, follow_symlinks: bool = False, io_order: str = 'auto',
+                 read_budget: int = 64 << 20, limits: Optional[ParseLimits] = None,
+                 retry_quarantined: bool = False, checkpoint_interval: float = 30.0,
+                 parquet_dir: Optional[str] = None, shards: Optional[int] = None,
+                 shard_by: Optional[str] = None, part: Optional[Tuple[int, int]] = None,
+                 cache_size: int = 0, compress: bool = False):
+        self.scanner = PlatformFileScanner(max_workers, follow_symlinks)
+        # Per-file limits; files over them are quarantined instead of indexed
+        self.limits = limits or ParseLimits()
+        # Parse quarantined files again even if they have not changed
+        self.retry_quarantined = retry_quarantined
+        # Seconds between saved checkpoints of an indexing run (0 disables them)
+        self.checkpoint_interval = checkpoint_interval
+        # Parquet snapshot directory for DuckDB queries (default: <index>.parquet)
+        self.parquet_dir = parquet_dir
+        # (i, N): index only the files whose path hashes to partition i of N
+        self.part = part
+        # Bytes of file contents read ahead of the parsers when indexing with threads
+        self.read_budget = read_budget
+        # Read scheduling for index_files: 'none', 'inode', 'extent' or 'auto' (extent on HDD)
+        self.io_order = io_order
+        # Hash file contents to skip files that were touched but not changed
+        self.content_hash = content_hash
+        # Parse in worker processes instead of threads (0 = one per CPU core)
+        self.processes = (processes or os.cpu_count() or 1) if processes is not None else None
+        if self.limits.max_seconds and not self.processes:
+            # A thread cannot be stopped mid-parse; time limits need killable processes
+            self.processes = os.cpu_count() or 1
+        # Parser threads without --processes; parsing holds the GIL, so more than
+        # one only runs in parallel on a free-threaded build
+        self.parsers = 1 if getattr(sys, '_is_gil_enabled', lambda: True)() else os.cpu_count() or 1
         self.parser = MHTMLParser()
-        self.index = SQLiteIndex(index_path)
+        # An index once created with shards keeps its layout when reopened
+        if shards and shards > 1 or index_path and ShardedIndex.read_layout(index_path):
+            self.index = ShardedIndex(index_path, shards, shard_by, batch_size, commit_interval,
+                                      compress=compress)
+        else:
+            self.index = SQLiteIndex(index_path, batch_size, commit_interval, compress=compress)
+        # Directory change journal used by index_files to skip unchanged directories
+        self.journal = DirectoryJournal(self.index) if journal else None
+        # Bytes of query results kept between index updates (0 disables the cache)
+        self.cache_size = cache_size
+        # Opened by the first query, in <index>.cache
+        self.cache = None
         self.duckdb = None
 
         if HAS_DUCKDB:
@@ -422,143 +3501,563 @@ class MHTMLSearchTool:
             except ImportError:
                 pass
 
-    def index_files(self, search_paths: List[str], show_progress: bool = True):
-        """Index MHTML files from given paths"""
-        print(f"🔍 Scanning for MHTML files in: {', '.join(search_paths)}")
+    def index_files(self, search_paths: List[str], show_progress: bool = True, resume: bool = False):
+        """Index MHTML files from given paths.
 
-        files = list(self.scanner.find_mhtml_files(search_paths))
+        Files are indexed while the scanner is still walking: discovered
+        paths flow through a bounded queue into a bounded set of in-flight
+        tasks, so memory use does not grow with the size of the tree.
 
-        if not files:
-            print("❌ No MHTML files found!")
-            return
+        Progress is checkpointed every checkpoint_interval seconds and when
+        interrupted; with resume, a checkpointed run continues from its
+        walk frontier and outstanding files instead of starting over.
+        """
+        checkpoint = None
+        if resume:
+            saved = self.index.load_checkpoint()
+            if saved is None:
+                print("ℹ️  No checkpoint to resume from, starting a full run")
+            else:
+                checkpoint = IndexCheckpoint(*saved, interval=self.checkpoint_interval)
+                search_paths = checkpoint.roots
+                print(f"⏯️  Resuming: {len(checkpoint.frontier)} directories to list, "
+                      f"{len(checkpoint.outstanding)} files outstanding")
+        if checkpoint is None and self.checkpoint_interval:
+            roots = [str(Path(search_path).resolve()) for search_path in search_paths]
+            checkpoint = IndexCheckpoint(roots, interval=self.checkpoint_interval)
+
+        print(f"🔍 Scanning for MHTML files in: {', '.join(search_paths)}")
+        concurrency, storage = self.scanner.concurrency_for(search_paths)
+        if self.processes:
+            print(f"🔧 Processing with {self.processes} processes...")
+        elif concurrency.minimum == concurrency.maximum:
+            print(f"🔧 Processing with {concurrency.limit} threads...")
+        else:
+            print(f"🔧 Processing with {concurrency.limit} threads "
+                  f"(storage: {storage}, adaptive up to {concurrency.maximum})...")
+
+        stats = self.scanner.stats
+        stats.setdefault('files_skipped', 0)
+        stats.setdefault('files_quarantined', 0)
+        files = self.scanner.find_mhtml_files(search_paths, self.journal, checkpoint)
+
+        def finished(file_paths: Iterable[str]):
+            if checkpoint is not None:
+                checkpoint.finished(file_paths)
+                if checkpoint.due():
+                    self.index.save_checkpoint(checkpoint)
+
+        if self.part is not None:
+            stats.setdefault('files_other_parts', 0)
+            files = self._in_part(files, finished)
+
+        # Loading into an empty index: build the full-text index once at the end,
+        # and there is nothing stored to compare discovered files against
+        bulk_load = self.index.is_empty()
+        if bulk_load:
+            self.index.begin_bulk_load()
+        else:
+            files = self._changed_files(files, finished)
+
+        io_order = self.io_order
+        if io_order == 'auto':
+            io_order = 'extent' if storage == 'hdd' else 'none'
 
-        print(f"📁 Found {len(files)} MHTML files")
-        print(f"🔧 Processing with {self.scanner.max_workers} threads...")
+        self.index.begin_scan(resume=checkpoint is not None and checkpoint.resumed)
+        files = _prefetch(files, self.QUEUE_SIZE)
+        if io_order != 'none':
+            # Sorted and advised as reads are submitted, not as the walk queues them
+            files = self.scanner.schedule_reads(files, io_order)
 
         # Progress bar setup
         progress = None
         if HAS_TQDM and show_progress:
-            progress = tqdm(total=len(files), desc="Indexing", unit="files")
+            progress = tqdm(desc="Indexing", unit="files")
+
+        def report(file_path: str, json_count: int):
+            stats['files_processed'] += 1
+            finished((file_path,))
+            if progress:
+                progress.total = stats['files_found'] - stats['files_skipped'] - stats.get('files_other_parts', 0)
+                progress.update(1)
+                progress.set_postfix({
+                    'Discovered': stats['files_found'],
+                    'JSON objects': json_count,
+                    'Current': os.path.basename(file_path)[:30]
+                })
 
-        def process_file(file_path: str) -> bool:
+        def retry_later(file_paths: Iterable[str]):
+            # Errors may be transient, so the journal must not skip these files next time
+            if self.journal is not None:
+                for file_path in file_paths:
+                    self.journal.distrust(os.path.dirname(file_path))
+
+        def failed(file_path: str, e: Union[Exception, str]):
+            if isinstance(e, FileLimitExceeded):
+                quarantined(file_path, str(e))
+                return
+            stats['errors'] += 1
+            # Keep the previously indexed version rather than purging it
+            self.index.mark_unchanged([file_path])
+            retry_later((file_path,))
+            finished((file_path,))
+            if not HAS_TQDM:
+                print(f"❌ Error processing {file_path}: {e}")
+
+        def quarantined(file_path: str, reason: str):
+            stats['files_quarantined'] += 1
+            self.index.quarantine(file_path, reason)
+            finished((file_path,))
+            if not HAS_TQDM:
+                print(f"⚠️  Quarantined {file_path}: {reason}")
+
+        # Read stage: file contents are prefetched up to the byte budget
+        budget = ByteBudget(self.read_budget)
+        pipeline = PipelineStats()
+
+        def read_file(file_path: str) -> Tuple[bytes, int]:
+            with open(file_path, 'rb') as f:
+                reserved = os.fstat(f.fileno()).st_size
+                if self.limits.max_bytes is not None and reserved > self.limits.max_bytes:
+                    raise FileLimitExceeded(f"{reserved} bytes, over the {self.limits.max_bytes} byte limit")
+                blocked = budget.acquire(reserved)
+                start = time.perf_counter()
+                try:
+                    data = f.read()
+                except BaseException:
+                    budget.release(reserved)
+                    raise
+            pipeline.add_read(time.perf_counter() - start, len(data), blocked)
+            return data, reserved
+
+        def read_stage() -> Generator[Tuple[str, bytes, int], None, None]:
+            with ThreadPoolExecutor(max_workers=concurrency.maximum,
+                                    thread_name_prefix='mhtml-reader') as readers:
+                # Scheduled reads are handed on in layout order, not completion order
+                for file_path, future in _bounded_map(readers, read_file, files, concurrency,
+                                                      ordered=io_order != 'none'):
+                    try:
+                        data, reserved = future.result()
+                    except Exception as e:
+                        failed(file_path, e)
+                        continue
+                    yield file_path, data, reserved
+
+        # Parse stage: contents are parsed from memory by the parser pool
+        def parse_file(loaded: Tuple[str, bytes, int]) -> Tuple[List[str], Optional[str]]:
+            file_path, data, reserved = loaded
             try:
-                json_objects = self.parser.extract_json_from_mhtml(file_path)
-                self.index.add_file(file_path, json_objects)
-                self.scanner.stats['files_processed'] += 1
+                start = time.perf_counter()
+                json_objects = self.parser.extract_json_from_bytes(data, file_path, self.limits.max_parts)
+                json_texts = [dumps_json(obj) for obj in json_objects]
+                content_hash = bytes_digest(data) if self.content_hash else None
+                pipeline.add_parse(time.perf_counter() - start)
+                return json_texts, content_hash
+            finally:
+                budget.release(reserved)
 
-                if progress:
-                    progress.update(1)
-                    progress.set_postfix({
-                        'JSON objects': len(json_objects),
-                        'Current': os.path.basename(file_path)[:30]
-                    })
-
-                return True
-
-            except Exception as e:
-                self.scanner.stats['errors'] += 1
-                if not HAS_TQDM:
-                    print(f"❌ Error processing {file_path}: {e}")
-                return False
-
-        # Process files in parallel
-        with ThreadPoolExecutor(max_workers=self.scanner.max_workers) as executor:
-            futures = [executor.submit(process_file, file_path) for file_path in files]
+        try:
+            if self.processes:
+                # Parse in killable worker processes; this thread is the single index writer
+                parse = functools.partial(_parse_file, limits=self.limits, content_hash=self.content_hash)
+                with IsolatedPool(self.processes, self.limits.max_seconds) as pool:
+                    batches = _batched(files, self.PROCESS_BATCH_SIZE)
+                    for batch, future in _bounded_map(pool, parse, batches, self.processes * 2):
+                        try:
+                            outcomes = future.result()
+                        except Exception as e:
+                            stats['errors'] += len(batch)
+                            self.index.mark_unchanged(batch)
+                            retry_later(batch)
+                            finished(batch)
+                            if not HAS_TQDM:
+                                print(f"❌ Error processing batch: {e}")
+                            continue
 
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    self.scanner.stats['errors'] += 1
+                        for file_path, status, value in outcomes:
+                            if status == 'ok':
+                                json_texts, content_hash = value
+                                self.index.add_serialized(file_path, json_texts, content_hash)
+                                report(file_path, len(json_texts))
+                            elif status == 'limit':
+                                quarantined(file_path, value)
+                            else:
+                                failed(file_path, value)
+            else:
+                # Readers run ahead of the parsers; the controller sets how many reads are in flight.
+                # Parsed files are written and reported from this thread.
+                loaded = pipeline.starved(_prefetch(read_stage(), self.QUEUE_SIZE))
+                with ThreadPoolExecutor(max_workers=self.parsers, thread_name_prefix='mhtml-parser') as parsers:
+                    for (file_path, _, _), future in _bounded_map(parsers, parse_file, loaded, self.parsers * 2):
+                        try:
+                            json_texts, content_hash = future.result()
+                            self.index.add_serialized(file_path, json_texts, content_hash)
+                        except Exception as e:
+                            failed(file_path, e)
+                            continue
+                        report(file_path, len(json_texts))
+        except KeyboardInterrupt:
+            if checkpoint is not None:
+                # Everything handed to the writer so far is kept; the rest is resumable
+                self.index.save_checkpoint(checkpoint)
+                self.index.flush()
+                print("\n💾 Progress saved, continue with --resume")
+            raise
+        finally:
+            # Reads queued for parsers that stopped early are never released one by one
+            budget.close()
+
+        if bulk_load:
+            self.index.end_bulk_load()
+        # The walk completed, so anything not seen under fully walked roots is gone
+        stats['files_removed'] = self.index.end_scan(self.scanner.full_walk_roots, self.scanner.unlisted_dirs)
+        if self.journal is not None:
+            stats['files_removed'] += self.index.remove_files(self.scanner.removed_files)
+        self.index.record_aliases(self.scanner.aliases, self.scanner.full_walk_roots)
+        if self.journal is not None:
+            self.journal.commit()
 
         if progress:
             progress.close()
 
+        if not stats['files_found'] and not stats['dirs_skipped']:
+            print("❌ No MHTML files found!")
+            return
+
         # Print statistics
-        elapsed = time.time() - self.scanner.stats['start_time']
+        elapsed = time.time() - stats['start_time']
         print(f"\n✅ Indexing complete!")
         print(f"📊 Statistics:")
-        print(f"   • Files processed: {self.scanner.stats['files_processed']}/{len(files)}")
-        print(f"   • Errors: {self.scanner.stats['errors']}")
+        print(f"   • Files discovered: {stats['files_found']}")
+        print(f"   • Files processed: {stats['files_processed']}/{stats['files_found']}")
+        print(f"   • Unchanged (skipped): {stats['files_skipped']}")
+        if self.part is not None:
+            print(f"   • Left to other partitions: {stats['files_other_parts']} (partition {self.part[0]}/{self.part[1]})")
+        print(f"   • Duplicate paths (recorded as aliases): {len(self.scanner.aliases)}")
+        if self.journal is not None:
+            print(f"   • Unchanged directories (not listed): {stats['dirs_skipped']}")
+        print(f"   • Quarantined (over per-file limits): {stats['files_quarantined']}")
+        print(f"   • Removed from index: {stats['files_removed']}")
+        print(f"   • Errors: {stats['errors']}")
+        if not self.processes:
+            print(f"   • Final read concurrency: {concurrency.limit} threads")
+            print(f"   • Read stage: {pipeline.read_bytes / 1e6:.1f} MB in {pipeline.read_seconds:.2f}s of reads, "
+                  f"{pipeline.read_blocked:.2f}s waiting for buffer space")
+            print(f"   • Parse stage: {pipeline.parse_seconds:.2f}s parsing, "
+                  f"{pipeline.parse_starved:.2f}s waiting for reads")
+            print(f"   • Bottleneck: {pipeline.bottleneck} stage")
         print(f"   • Time elapsed: {elapsed:.2f}s")
-        print(f"   • Processing rate: {self.scanner.stats['files_processed'] / elapsed:.1f} files/sec")
+        print(f"   • Processing rate: {stats['files_processed'] / elapsed:.1f} files/sec")
+
+    def _in_part(self, files: Iterable[str],
+                 finished: Callable[[Iterable[str]], None]) -> Generator[str, None, None]:
+        """Yield the files of this partition, chosen by a stable hash of the path"""
+        part, parts = self.part
+        stats = self.scanner.stats
+        for file_path in files:
+            if zlib.crc32(os.fsencode(file_path)) % parts == part:
+                yield file_path
+            else:
+                stats['files_other_parts'] += 1
+                finished((file_path,))
+
+    def export_snapshot(self, snapshot_path: str, roots: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Write a portable, compressed snapshot of the index for other machines to import"""
+        if isinstance(self.index, ShardedIndex):
+            raise ValueError("Snapshots are taken of an unsharded index; --merge the shards into one first")
+        print(f"📦 Exporting index snapshot to {snapshot_path}...")
+        manifest = IndexSnapshot(snapshot_path).export(self.index, roots)
+        size = os.path.getsize(snapshot_path)
+        print(f"✅ Snapshot of {manifest['fingerprints']['files']} files under {', '.join(manifest['roots'])} "
+              f"({size / 1e6:.1f} MB, schema {manifest['schema_version']})")
+        return manifest
+
+    def import_snapshot(self, snapshot_path: str, roots: Optional[List[str]] = None, reconcile: bool = True):
+        """Bootstrap an empty index from a snapshot, then index only the files that differ.
+
+        roots relocates the snapshot's roots when the corpus is mounted
+        somewhere else on this machine. The reconcile pass is an ordinary
+        incremental index run; when the snapshot carries content hashes,
+        files whose mtime differs are hashed and kept if the content matches.
+        """
+        if isinstance(self.index, ShardedIndex):
+            raise ValueError("Snapshots are imported into an unsharded index")
+        if not self.index.is_empty() or self.index.generation():
+            raise FileExistsError(f"{self.index.db_path} already holds an index; import into a new --index-db")
+
+        db_path = self.index.db_path
+        self.index.close()
+        print(f"📥 Importing index snapshot {snapshot_path}...")
+        manifest = IndexSnapshot(snapshot_path).restore(db_path, roots)
+        self.index = SQLiteIndex(db_path, self.index.batch_size, self.index.commit_interval)
+        if self.journal is not None:
+            self.journal = DirectoryJournal(self.index)
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        print(f"✅ Imported {manifest['fingerprints']['files']} files under {', '.join(manifest['roots'])}")
+
+        if reconcile:
+            if manifest['fingerprints']['content_hashed']:
+                self.content_hash = True
+            self.index_files(manifest['roots'])
+        return manifest
+
+    def merge_partials(self, partial_paths: List[str]) -> int:
+        """Combine partial indexes built with --part into this index"""
+        print(f"🔗 Merging {len(partial_paths)} partial indexes into {self.index.db_path}...")
+        start = time.time()
+        merged = self.index.merge(partial_paths)
+        print(f"✅ Merged {merged} files in {time.time() - start:.2f}s")
+        return merged
+
+    def _changed_files(self, files: Iterable[str],
+                       finished: Callable[[Iterable[str]], None] = None) -> Generator[str, None, None]:
+        """Yield only files that are new or differ from their indexed version.
+
+        A file is unchanged when size and mtime match the index. With content
+        hashing enabled, a file whose mtime moved but whose size did not is
+        hashed and skipped if the content is identical. Quarantined files are
+        skipped until they change, unless retry_quarantined is set.
+
+        finished is called with skipped files once they are queued to the index.
+        """
+        stats = self.scanner.stats
+        finished = finished or (lambda file_paths: None)
+        unchanged = []
+        touched = []
+        skipped = []
 
-    def search(self, query: str, use_duckdb: bool = False) -> List[Dict[str, Any]]:
+        for file_path in files:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                finished((file_path,))
+                continue
+
+            stored = self.index.get_fingerprint(file_path)
+            if stored is None:
+                if not self.retry_quarantined:
+                    held = self.index.get_quarantined(file_path)
+                    if held is not None and held[:2] == (stat.st_size, stat.st_mtime):
+                        stats['files_skipped'] += 1
+                        finished((file_path,))
+                        continue
+
+                # Walk order may pick a different path to a file indexed under another name
+                owner = self.index.alias_owner(file_path)
+                if owner is not None:
+                    owner_stored = self.index.get_fingerprint(owner)
+                    if owner_stored is not None and owner_stored[:2] == (stat.st_size, stat.st_mtime):
+                        stats['files_skipped'] += 1
+                        self.scanner.aliases.append((file_path, owner))
+                        unchanged.append(owner)
+                        skipped.append(file_path)
+                        continue
+            else:
+                file_size, modified_time, content_hash = stored
+                same = file_size == stat.st_size and modified_time == stat.st_mtime
+                if not same and self.content_hash and content_hash and file_size == stat.st_size:
+                    try:
+                        same = file_digest(file_path) == content_hash
+                    except OSError:
+                        same = False
+                    if same:
+                        touched.append((stat.st_mtime, file_path))
+
+                if same:
+                    stats['files_skipped'] += 1
+                    unchanged.append(file_path)
+                    skipped.append(file_path)
+                    if len(unchanged) >= 1000:
+                        self.index.mark_unchanged(unchanged, touched)
+                        finished(skipped)
+                        unchanged, touched, skipped = [], [], []
+                    continue
+
+            yield file_path
+
+        if unchanged:
+            self.index.mark_unchanged(unchanged, touched)
+        finished(skipped)
+
+    def search(self, query: str, use_duckdb: bool = False, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Search indexed data"""
-        if use_duckdb and self.duckdb:
-            # Advanced SQL with DuckDB
-            print("🦆 Using DuckDB for advanced SQL queries...")
-            # First get base data from SQLite
-            base_results = self.index.search(
-                "SELECT f.file_path, f.file_size, f.modified_time, j.json_text FROM mhtml_files f JOIN json_data j ON f.id = j.file_id")
-
-            # Convert to SearchResult objects
-            search_results = []
-            current_file = None
-            current_json = []
-
-            for row in base_results:
-                if current_file != row['file_path']:
-                    if current_file:
-                        stat = os.stat(current_file)
-                        search_results.append(SearchResult(
-                            file_path=current_file,
-                            json_data=current_json,
-                            file_size=stat.st_size,
-                            modified_time=stat.st_mtime
-                        ))
-                    current_file = row['file_path']
-                    current_json = []
+        return list(self.iter_search(query, use_duckdb, limit))
 
-                try:
-                    json_obj = json.loads(row['json_data']) if isinstance(row['json_data'], str) else row['json_data']
-                    current_json.append(json_obj)
-                except:
-                    pass
-
-            # Add last file
-            if current_file:
-                stat = os.stat(current_file)
-                search_results.append(SearchResult(
-                    file_path=current_file,
-                    json_data=current_json,
-                    file_size=stat.st_size,
-                    modified_time=stat.st_mtime
-                ))
+    def iter_search(self, query: str, use_duckdb: bool = False, limit: Optional[int] = None,
+                    offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """Stream search results with limit and offset applied in the query.
 
-            # Create DuckDB table and query
-            self.duckdb.create_temp_table(search_results)
-            return self.duckdb.query(query)
+        With the result cache enabled, a query repeated before the index
+        changes is answered from the cache.
+        """
+        if use_duckdb and self.duckdb:
+            # Advanced SQL with DuckDB over the Parquet snapshot, re-exported only if stale
+            print("🦆 Using DuckDB for advanced SQL queries...", file=sys.stderr)
+            self.duckdb.attach_snapshot(self.export_parquet())
+            return self._cached('duckdb', query, [limit, offset],
+                                lambda: self.duckdb.iter_query(query, limit, offset), limit)
         else:
             # Use SQLite
-            return self.index.search(query)
+            return self._cached('sqlite', query, [limit, offset],
+                                lambda: self.index.iter_search(query, limit, offset), limit)
+
+    def _cached(self, kind: str, query: str, params: List[Any], run: Callable[[], Iterable[Dict[str, Any]]],
+                limit: Optional[int]) -> Iterator[Dict[str, Any]]:
+        """Serve a query from the result cache, or run it and cache its rows as they stream out.
+
+        Rows are stored once limit of them were read or the stream ended,
+        and only if the index generation did not move meanwhile; a result
+        abandoned early, cut short by an error, empty or over MAX_ROWS is
+        not cached. A cache file that cannot be opened disables the cache.
+        """
+        if not self.cache_size or not QueryCache.cacheable(query):
+            return run()
+        if self.cache is None:
+            try:
+                self.cache = QueryCache(self.index.db_path + '.cache', self.cache_size, self.index.identity())
+            except sqlite3.Error as e:
+                print(f"⚠️  Query cache unavailable, running uncached: {e}", file=sys.stderr)
+                self.cache_size = 0
+                return run()
+        generation = self.index.generation()
+        key = self.cache.key(kind, query, params, generation)
+        rows = self.cache.get(key)
+        if rows is not None:
+            return iter(rows)
+        return self._filling_cache(key, generation, run(), limit)
+
+    def _filling_cache(self, key: str, generation: int, results: Iterable[Dict[str, Any]],
+                       limit: Optional[int]) -> Generator[Dict[str, Any], None, None]:
+        rows = []
+        try:
+            for count, row in enumerate(results, 1):
+                if rows is not None:
+                    rows.append(row)
+                    if count > QueryCache.MAX_ROWS:
+                        rows = None
+                if count == limit:
+                    # Nothing follows the last row asked for, and the consumer may stop at it:
+                    # hand the stream's read connection back, then store
+                    self._close_stream(results)
+                    self._store(key, generation, rows)
+                    yield row
+                    return
+                yield row
+            self._store(key, generation, rows)
+        finally:
+            self._close_stream(results)
+
+    def _store(self, key: str, generation: int, rows: Optional[List[Dict[str, Any]]]):
+        if rows and self.index.generation() == generation:
+            self.cache.put(key, generation, rows)
+
+    @staticmethod
+    def _close_stream(results: Iterable[Dict[str, Any]]):
+        if hasattr(results, 'close'):
+            results.close()
+
+    def export_parquet(self, force: bool = False) -> str:
+        """Write the Parquet snapshot of the index if it changed since the last export"""
+        snapshot = ParquetSnapshot(self.index, self.parquet_dir)
+        path = snapshot.current()
+        if path is None or force:
+            print(f"📦 Exporting index generation {self.index.generation()} to Parquet...", file=sys.stderr)
+            path = snapshot.export(force=True)
+        return path
+
+    def where(self, predicates: List[str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Indexed structured query: JSON records matching all 'path op value' predicates"""
+        return list(self.iter_where(predicates, limit))
+
+    def iter_where(self, predicates: List[str], limit: Optional[int] = None,
+                   offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """Stream structured query results with limit and offset applied in the query"""
+        return self._cached('where', '', [[QueryCache.normalise(p) for p in predicates], limit, offset],
+                            lambda: self.index.iter_where(predicates, limit, offset), limit)
+
+    def iter_quick_scan(self, search_paths: List[str], query: str, limit: Optional[int] = None,
+                        offset: int = 0) -> Generator[Dict[str, Any], None, None]:
+        """Quick scan without indexing, streaming matches as files are parsed.
+
+        Each file's objects are filtered as they are extracted, by a
+        case-insensitive substring test on their serialized text, so only
+        matches are kept. The first offset matches are skipped; once limit
+        matches have been yielded, queued files are cancelled and the walk
+        stops; a lookup for a single record returns as soon as it is found.
+        Matches arrive in the order files finish, which differs between
+        runs, so an offset does not page through a stable sequence.
+        """
+        print(f"🚀 Quick scan mode - searching: {', '.join(search_paths)}", file=sys.stderr)
+
+        stats = self.scanner.stats
+        files = _prefetch(self.scanner.find_mhtml_files(search_paths), self.QUEUE_SIZE)
+        scan = functools.partial(_scan_files_matching, query=query.lower())
+
+        if self.processes:
+            executor = ProcessPoolExecutor(max_workers=self.processes)
+            batches = _batched(files, self.PROCESS_BATCH_SIZE)
+            outcomes = _bounded_map(executor, scan, batches, self.processes * 2)
+        else:
+            concurrency, _ = self.scanner.concurrency_for(search_paths)
+            executor = ThreadPoolExecutor(max_workers=concurrency.maximum)
+            outcomes = _bounded_map(executor, lambda file_path: scan([file_path]), files, concurrency)
+
+        found = 0
+        try:
+            for _, future in outcomes:
+                try:
+                    matches = future.result()
+                except Exception:
+                    continue
+                for match in matches:
+                    found += 1
+                    if found <= offset:
+                        continue
+                    yield match
+                    if limit is not None and found >= offset + limit:
+                        return
+        finally:
+            outcomes.close()
+            files.close()
+            # Queued batches are dropped; running ones finish so the pool closes its pipes
+            executor.shutdown(wait=True, cancel_futures=True)
+            print(f"📁 {found} matches among {stats['files_found']} MHTML files discovered", file=sys.stderr)
 
     def quick_scan_and_search(self, search_paths: List[str], query: str) -> List[Dict[str, Any]]:
         """Quick scan and search without persistent indexing"""
-        print(f"🚀 Quick scan mode - searching: {', '.join(search_paths)}")
+        if not self.duckdb:
+            return list(self.iter_quick_scan(search_paths, query))
 
-        files = list(self.scanner.find_mhtml_files(search_paths))
+        print(f"🚀 Quick scan mode - searching: {', '.join(search_paths)}")
 
-        if not files:
-            print("❌ No MHTML files found!")
-            return []
+        stats = self.scanner.stats
+        files = _prefetch(self.scanner.find_mhtml_files(search_paths), self.QUEUE_SIZE)
 
-        print(f"📁 Found {len(files)} MHTML files")
+        # Results are bulk-loaded into DuckDB while the scan runs instead of collected
+        loader = self.duckdb.bulk_loader()
+        files_with_json = 0
 
-        results = []
+        def collect(result: SearchResult):
+            nonlocal files_with_json
+            files_with_json += 1
+            loader.append(result)
 
         # Progress bar setup
         progress = None
         if HAS_TQDM:
-            progress = tqdm(total=len(files), desc="Searching", unit="files")
+            progress = tqdm(desc="Searching", unit="files")
 
         def process_file(file_path: str) -> Optional[SearchResult]:
             try:
                 json_objects = self.parser.extract_json_from_mhtml(file_path)
 
                 if progress:
+                    progress.total = stats['files_found']
                     progress.update(1)
                     progress.set_postfix({
+                        'Discovered': stats['files_found'],
                         'JSON found': len(json_objects),
                         'Current': os.path.basename(file_path)[:30]
                     })
@@ -577,42 +4076,55 @@ class MHTMLSearchTool:
                 return None
 
         # Process files and collect results
-        with ThreadPoolExecutor(max_workers=self.scanner.max_workers) as executor:
-            futures = [executor.submit(process_file, file_path) for file_path in files]
-
-            for future in as_completed(futures):
-                try:
-                    result = future.result()
-                    if result:
-                        results.append(result)
-                except Exception:
-                    pass
-
+        if self.processes:
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                batches = _batched(files, self.PROCESS_BATCH_SIZE)
+                for batch, future in _bounded_map(executor, _scan_files_batch, batches, self.processes * 2):
+                    try:
+                        for result in future.result():
+                            collect(result)
+                    except Exception:
+                        pass
+                    if progress:
+                        progress.total = stats['files_found']
+                        progress.update(len(batch))
+        else:
+            concurrency, _ = self.scanner.concurrency_for(search_paths)
+            with ThreadPoolExecutor(max_workers=concurrency.maximum) as executor:
+                for _, future in _bounded_map(executor, process_file, files, concurrency):
+                    try:
+                        result = future.result()
+                        if result:
+                            collect(result)
+                    except Exception:
+                        pass
+
+        loader.close()
         if progress:
             progress.close()
 
-        print(f"📊 Found JSON data in {len(results)} files")
+        if not stats['files_found']:
+            print("❌ No MHTML files found!")
+            return []
 
-        # If we have DuckDB, use it for querying
-        if self.duckdb and results:
-            self.duckdb.create_temp_table(results)
-            return self.duckdb.query(query)
-        else:
-            # Simple filtering for quick mode
-            filtered_results = []
-            query_lower = query.lower()
+        print(f"📁 Found {stats['files_found']} MHTML files")
+
+        print(f"📊 Found JSON data in {files_with_json} files")
+
+        if not files_with_json:
+            return []
+        return self.duckdb.query(query)
 
-            for result in results:
-                for json_obj in result.json_data:
-                    json_str = json.dumps(json_obj).lower()
-                    if query_lower in json_str:
-                        filtered_results.append({
-                            'file_path': result.file_path,
-                            'json_data': json.dumps(json_obj),
-                            'file_size': result.file_size
-                        })
 
-            return filtered_results
+def _part_spec(value: str) -> Tuple[int, int]:
+    """Parse an 'I/N' partition spec"""
+    try:
+        part, parts = (int(number) for number in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {value!r}")
+    if not 0 <= part < parts:
+        raise argparse.ArgumentTypeError(f"partition {part} is not in 0..{parts - 1}")
+    return part, parts
 
 
 def main():
@@ -624,14 +4136,33 @@ Examples:
   # Index files in directory
   mhtml-search --index --path /data --path ~/documents
 
+  # Index into 4 database files written and queried in parallel
+  mhtml-search --index --path /data --index-db /data/index.db --shards 4
+
+  # Build partial indexes on several machines, then merge them
+  mhtml-search --index --path /share --index-db part0.db --part 0/2
+  mhtml-search --index --path /share --index-db part1.db --part 1/2
+  mhtml-search --index-db index.db --merge part0.db part1.db
+
+  # Bootstrap a new machine from a snapshot, then index only what changed
+  mhtml-search --export-snapshot corpus.snapshot.tar.gz --index-db index.db
+  mhtml-search --import-snapshot corpus.snapshot.tar.gz --index-db local.db --path /mnt/share
+
   # Quick search without indexing
   mhtml-search --scan /data --query "name"
 
   # SQL query on indexed data
   mhtml-search --sql "SELECT file_path, json_data FROM mhtml_files WHERE json_data LIKE '%John%'"
 
-  # Advanced DuckDB query
+  # Indexed structured query on JSON values
+  mhtml-search --where "age > 25" --where "address.city = 'Paris'"
+
+  # Repeated queries come from <index-db>.cache until the index changes; bypass it
+  mhtml-search --where "age > 25" --cache-size 0
+
+  # Advanced DuckDB query (over a Parquet snapshot, re-exported when the index changed)
   mhtml-search --sql "SELECT file_path, COUNT(*) as json_count FROM mhtml_data GROUP BY file_path" --duckdb
+  mhtml-search --sql "SELECT json_path, avg(value_num) FROM json_values GROUP BY json_path" --duckdb
         """
     )
 
@@ -642,6 +4173,19 @@ Examples:
                         help='Quick scan and search without indexing')
     parser.add_argument('--sql', metavar='QUERY',
                         help='Execute SQL query on indexed data')
+    parser.add_argument('--merge', nargs='+', metavar='PARTIAL',
+                        help='Merge partial indexes built with --part into --index-db')
+    parser.add_argument('--export-snapshot', metavar='FILE',
+                        help='Write a portable compressed snapshot of the index (roots from --path, '
+                             'or the common directory of indexed files)')
+    parser.add_argument('--import-snapshot', metavar='FILE',
+                        help='Bootstrap a new --index-db from a snapshot and index only files that differ '
+                             '(--path relocates the snapshot roots)')
+    parser.add_argument('--export-parquet', action='store_true',
+                        help='Write a Parquet snapshot of the index for DuckDB (skipped if unchanged)')
+    parser.add_argument('--where', metavar='PREDICATE', action='append',
+                        help="Indexed query on JSON values, e.g. \"age > 25\" or \"address.city = 'Paris'\" "
+                             "(repeat to AND predicates within one JSON object)")
 
     # Path arguments
     parser.add_argument('--path', action='append', dest='paths',
@@ -652,30 +4196,98 @@ Examples:
     # Options
     parser.add_argument('--index-db', metavar='PATH',
                         help='Path to index database file')
+    parser.add_argument('--part', type=_part_spec, metavar='I/N',
+                        help='Index only partition I of N (0-based, by path hash) into a partial index for --merge')
+    parser.add_argument('--shards', type=int, metavar='N',
+                        help='Split a new index into N database files written and queried in parallel '
+                             '(--sql on it cannot sort, limit or aggregate; use --duckdb for that)')
+    parser.add_argument('--shard-by', choices=ShardedIndex.ROUTES,
+                        help='Route files to shards by a hash of their path or of their directory (default: hash)')
     parser.add_argument('--threads', type=int,
-                        help='Number of worker threads (auto-detected by default)')
+                        help='Fixed number of worker threads (adapted to the storage during the run by default)')
+    parser.add_argument('--processes', type=int, metavar='N',
+                        help='Parse files in N worker processes (0 = one per CPU core); without it '
+                             'files are parsed by threads while others read ahead, one per core only '
+                             'on a free-threaded Python')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='Files written per index transaction (default: 500)')
+    parser.add_argument('--commit-interval', type=float, default=1.0,
+                        help='Max seconds between index commits while indexing (default: 1.0)')
+    parser.add_argument('--hash', action='store_true', dest='content_hash',
+                        help='Compare content hashes to skip files touched but not changed when reindexing')
+    parser.add_argument('--journal', action='store_true',
+                        help='Skip listing directories unchanged since the last index run '
+                             '(for archives where files are added or replaced, not edited in place)')
+    parser.add_argument('--follow-symlinks', action='store_true',
+                        help='Descend into symlinked directories (loops are detected and skipped)')
+    parser.add_argument('--io-order', choices=['auto', 'none', 'inode', 'extent'], default='auto',
+                        help='Order file reads by inode or physical extent when indexing '
+                             '(default: auto, extent order on rotational disks)')
+    parser.add_argument('--read-buffer', type=int, default=64, metavar='MB',
+                        help='File contents read ahead of the parsers when indexing (default: 64 MB)')
+    parser.add_argument('--max-file-size', type=int, metavar='MB',
+                        help='Quarantine files larger than this instead of indexing them')
+    parser.add_argument('--max-parts', type=int, metavar='N',
+                        help='Quarantine files with more than N MIME parts')
+    parser.add_argument('--max-seconds', type=float, metavar='S',
+                        help='Quarantine files taking more than S CPU seconds to parse '
+                             '(parses in killable worker processes)')
+    parser.add_argument('--retry-quarantined', action='store_true',
+                        help='Parse quarantined files again even if unchanged')
+    parser.add_argument('--checkpoint-interval', type=float, default=30.0, metavar='S',
+                        help='Seconds between saved indexing checkpoints (default: 30, 0 disables)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted --index run from its last checkpoint')
+    parser.add_argument('--parquet-dir', metavar='PATH',
+                        help='Directory of the Parquet snapshot (default: <index-db>.parquet)')
+    parser.add_argument('--compress', action='store_true',
+                        help='Store JSON records deflate-compressed in a new index: smaller, but '
+                             'readable only through this tool rather than any SQLite client')
+    parser.add_argument('--cache-size', type=int, default=0, metavar='MB',
+                        help='Keep up to MB of query results in <index-db>.cache until the index '
+                             'changes (default: 0, no cache); rows of ties under ORDER BY ... LIMIT '
+                             'are replayed as first returned')
     parser.add_argument('--duckdb', action='store_true',
                         help='Use DuckDB for advanced SQL queries')
-    parser.add_argument('--output', choices=['json', 'table', 'csv'],
-                        default='table', help='Output format')
+    parser.add_argument('--output', choices=['json', 'ndjson', 'table', 'csv'],
+                        default='table', help='Output format (ndjson: one JSON object per line)')
     parser.add_argument('--limit', type=int, default=100,
                         help='Limit number of results (default: 100)')
+    parser.add_argument('--offset', type=int, default=0,
+                        help='Skip this many results first (default: 0; not with --scan)')
 
     args = parser.parse_args()
 
     # Validate arguments
-    if not any([args.index, args.scan, args.sql]):
-        parser.error("Must specify one of --index, --scan, or --sql")
+    if not any([args.index, args.scan, args.sql, args.where, args.merge, args.export_snapshot,
+                args.import_snapshot, args.export_parquet]):
+        parser.error("Must specify one of --index, --scan, --sql, --where, --merge, --export-snapshot, "
+                     "--import-snapshot or --export-parquet")
 
-    if args.index and not args.paths:
+    if args.index and not args.paths and not args.resume:
         parser.error("--index requires --path")
 
     if args.scan and not args.query:
         parser.error("--scan requires --query")
 
+    if args.scan and args.offset:
+        # Matches arrive in the order files are discovered and parsed, which changes between runs
+        parser.error("--offset is not supported with --scan")
+
+    limits = ParseLimits(
+        max_bytes=args.max_file_size << 20 if args.max_file_size is not None else None,
+        max_parts=args.max_parts,
+        max_seconds=args.max_seconds,
+    )
+
     # Initialize tool
     try:
-        tool = MHTMLSearchTool(args.index_db, args.threads)
+        tool = MHTMLSearchTool(args.index_db, args.threads, args.processes,
+                               args.batch_size, args.commit_interval, args.content_hash,
+                               args.journal, args.follow_symlinks, args.io_order,
+                               args.read_buffer << 20, limits, args.retry_quarantined,
+                               args.checkpoint_interval, args.parquet_dir, args.shards, args.shard_by,
+                               args.part, args.cache_size << 20, args.compress)
     except Exception as e:
         print(f"❌ Failed to initialize tool: {e}")
         sys.exit(1)
@@ -683,73 +4295,119 @@ Examples:
     # Execute action
     try:
         if args.index:
-            tool.index_files(args.paths)
+            tool.index_files(args.paths or [], resume=args.resume)
+
+        # One row past the limit is fetched to tell whether more results exist
+        elif args.scan and not tool.duckdb:
+            # Matches stream out and the scan stops once the page is filled
+            results = tool.iter_quick_scan([args.scan], args.query, args.limit + 1, args.offset)
+            print_results(results, args.output, args.limit)
 
         elif args.scan:
             results = tool.quick_scan_and_search([args.scan], args.query)
-            print_results(results, args.output, args.limit)
+            print_results(results[args.offset:], args.output, args.limit)
 
         elif args.sql:
-            results = tool.search(args.sql, args.duckdb)
+            results = tool.iter_search(args.sql, args.duckdb, args.limit + 1, args.offset)
+            print_results(results, args.output, args.limit)
+
+        elif args.where:
+            results = tool.iter_where(args.where, args.limit + 1, args.offset)
             print_results(results, args.output, args.limit)
 
+        elif args.merge:
+            tool.merge_partials(args.merge)
+
+        elif args.export_snapshot:
+            tool.export_snapshot(args.export_snapshot, args.paths)
+
+        elif args.import_snapshot:
+            tool.import_snapshot(args.import_snapshot, args.paths)
+
+        elif args.export_parquet:
+            if not HAS_DUCKDB:
+                print("❌ DuckDB not available. Install with: pip install duckdb")
+                sys.exit(1)
+            print(f"✅ Parquet snapshot: {tool.export_parquet()}")
+
     except KeyboardInterrupt:
         print("\n⏹️  Interrupted by user")
         sys.exit(1)
     except Exception as e:
-        print(f"❌ Error: {e}")
+        # Results stream to stdout; the error must not read as one of them
+        print(f"❌ Error: {e}", file=sys.stderr)
         sys.exit(1)
 
 
-def print_results(results: List[Dict[str, Any]], output_format: str, limit: int):
-    """Print search results in specified format"""
-    if not results:
+def print_results(results: Iterable[Dict[str, Any]], output_format: str, limit: int):
+    """Print search results in specified format as they arrive.
+
+    At most limit rows are printed; rows are written incrementally, so a
+    streamed result set is never held in memory. A list reports its full
+    size when truncated; a stream fetched with limit + 1 rows reports that
+    more results exist.
+    """
+    total = len(results) if isinstance(results, list) else None
+    rows = iter(results)
+    first = next(rows, None)
+    if first is None:
         print("🔍 No results found")
         return
+    rows = itertools.islice(itertools.chain([first], rows), limit)
 
-    # Limit results
-    if len(results) > limit:
-        results = results[:limit]
-        print(f"📊 Showing first {limit} of {len(results)} results")
+    if output_format == 'ndjson':
+        for row in rows:
+            sys.stdout.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
 
-    if output_format == 'json':
-        print(json.dumps(results, indent=2, ensure_ascii=False))
+    elif output_format == 'json':
+        sys.stdout.write('[')
+        for i, row in enumerate(rows):
+            sys.stdout.write((',\n' if i else '\n') + textwrap.indent(
+                json.dumps(row, indent=2, ensure_ascii=False, default=str), '  '))
+        sys.stdout.write('\n]\n')
 
     elif output_format == 'csv':
-        if results:
-            import csv
-            import io
+        import csv
 
-            output = io.StringIO()
-            writer = csv.DictWriter(output, fieldnames=results[0].keys())
-            writer.writeheader()
-            writer.writerows(results)
-            print(output.getvalue())
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(first.keys()))
+        writer.writeheader()
+        writer.writerows(rows)
 
     else:  # table format
-        if results:
-            # Simple table formatting
-            headers = list(results[0].keys())
-
-            # Calculate column widths
-            widths = {}
-            for header in headers:
-                widths[header] = max(len(header),
-                                     max(len(str(row.get(header, ''))) for row in results[:10]))
-                widths[header] = min(widths[header], 80)  # Max width
-
-            # Print header
-            header_line = " | ".join(h.ljust(widths[h]) for h in headers)
-            print(header_line)
-            print("-" * len(header_line))
-
-            # Print rows
-            for row in results:
-                row_line = " | ".join(
-                    str(row.get(h, ''))[:widths[h]].ljust(widths[h])
-                    for h in headers
-                )
-                print(row_line)
+        # Column widths come from the first rows; the rest are streamed
+        head = list(itertools.islice(rows, 10))
+        headers = list(first.keys())
+
+        # Calculate column widths
+        widths = {}
+        for header in headers:
+            widths[header] = max(len(header),
+                                 max(len(str(row.get(header, ''))) for row in head))
+            widths[header] = min(widths[header], 80)  # Max width
+
+        # Print header
+        header_line = " | ".join(h.ljust(widths[h]) for h in headers)
+        print(header_line)
+        print("-" * len(header_line))
+
+        # Print rows
+        for row in itertools.chain(head, rows):
+            row_line = " | ".join(
+                str(row.get(h, ''))[:widths[h]].ljust(widths[h])
+                for h in headers
+            )
+            print(row_line)
+
+    sys.stdout.flush()
+    if total is not None and total > limit:
+        print(f"📊 Showing first {limit} of {total} results", file=sys.stderr)
+    elif total is None:
+        more = next(iter(results), None) is not None
+        # Hand the stream's read connection back to the pool
+        if hasattr(results, 'close'):
+            results.close()
+        if more:
+            print(f"📊 Showing first {limit} results; more available with --offset", file=sys.stderr)
 
 
 if __name__ == "__main__":
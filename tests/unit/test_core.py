@@ -3,7 +3,7 @@ import os
 import pytest
 from pathlib import Path
 
-from qra.core import MHTMLProcessor
+from qra.core import MHTMLProcessor, _find_files
 
 
 def test_mhtml_processor_initialization():
@@ -89,3 +89,15 @@ def test_search_files(test_mhtml_file, temp_dir):
     
     assert str(test_file) in results
     assert len(results[str(test_file)]) > 0
+
+
+def test_find_files_returns_paths_in_sorted_order(tmp_path):
+    """Test that the parallel walk yields a deterministic file order."""
+    for sub in ('b', 'a', 'c/d'):
+        (tmp_path / sub).mkdir(parents=True)
+        for name in ('2.mhtml', '1.eml'):
+            (tmp_path / sub / name).write_text('x')
+
+    files = _find_files(str(tmp_path), ('.mhtml', '.eml'), 3)
+    assert files == sorted(files)
+    assert len(files) == 6
@@ -0,0 +1,964 @@
+"""Unit tests for the MHTML+JSON search tool (search.py)."""
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+import search  # noqa: E402
+from search import (  # noqa: E402
+    AdaptiveConcurrency,
+    ByteBudget,
+    DirectoryJournal,
+    FileLimitExceeded,
+    IsolatedPool,
+    JSONCodec,
+    MHTMLParser,
+    ParseLimits,
+    PlatformFileScanner,
+    SQLiteIndex,
+    _bounded_map,
+    _parse_file,
+    _prefetch,
+    compile_predicate,
+    flatten_json,
+)
+
+
+def _write_mhtml(path, html, extra_parts=()):
+    """Write a minimal multipart/related MHTML file."""
+    boundary = "----=_NextPart_test"
+    parts = [("text/html", html)] + list(extra_parts)
+    lines = [
+        "MIME-Version: 1.0",
+        f'Content-Type: multipart/related; boundary="{boundary}"',
+        "",
+    ]
+    for content_type, body in parts:
+        lines += [f"--{boundary}", f"Content-Type: {content_type}; charset=utf-8", "", body]
+    lines.append(f"--{boundary}--")
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return path
+
+
+def test_find_json_in_text_handles_deep_nesting():
+    """Objects nested deeper than two levels are decoded whole."""
+    text = 'var x = {"a": {"b": {"c": {"d": 1}}}}; foo({"e": [1, 2]})'
+    objects = MHTMLParser._find_json_in_text(text)
+    assert objects == [{"a": {"b": {"c": {"d": 1}}}}, {"e": [1, 2]}]
+
+
+def test_find_json_in_text_skips_invalid_prefix():
+    """A broken outer literal still yields the valid objects inside it."""
+    text = '{"outer": fn(), "inner": {"ok": true}}'
+    assert MHTMLParser._find_json_in_text(text) == [{"ok": True}]
+
+
+def test_find_json_in_text_after_a_brace_inside_a_string():
+    """A '{' in a string literal of a broken candidate does not hide later objects."""
+    assert MHTMLParser._find_json_in_text('x = "{"; y = {"id": 1};') == [{"id": 1}]
+    assert MHTMLParser._find_json_in_text('var open = "{", cfg = {"debug": true};') == [{"debug": True}]
+
+
+def test_iter_json_spans_returns_raw_offsets():
+    text = 'x = {"id": 7} ;'
+    [(start, end, value)] = list(MHTMLParser.iter_json_spans(text))
+    assert text[start:end] == '{"id": 7}'
+    assert value == {"id": 7}
+
+
+def test_iter_json_spans_stays_within_endpos_and_unterminated_input():
+    text = 'x{"a": 1}y'
+    assert list(MHTMLParser.iter_json_spans(text, 0, 8)) == []
+    assert [value for _, _, value in MHTMLParser.iter_json_spans(text, 0, 9)] == [{"a": 1}]
+
+    # Deep, unterminated nesting neither recurses without bound nor rescans the tail per level
+    assert list(MHTMLParser.iter_json_spans('{"a":' * 5000)) == []
+    text = '{"a":' * 500 + '{"b": 2}, "c": "' + "x" * 100_000
+    assert [value for _, _, value in MHTMLParser.iter_json_spans(text)] == [{"b": 2}]
+
+
+def test_extract_json_from_content_no_duplicates():
+    """Script bodies are not scanned a second time with the whole page."""
+    html = (
+        '<script type="application/ld+json">[{"@type": "Person", "name": "Ann"}]</script>'
+        '<script>window.cfg = {"debug": false};</script>'
+        '<div data-info=\'{"role": "admin"}\'></div>'
+    )
+    objects = MHTMLParser._extract_json_from_content(html)
+    assert objects == [
+        {"@type": "Person", "name": "Ann"},
+        {"debug": False},
+        {"role": "admin"},
+    ]
+
+
+def test_extract_json_from_mhtml_json_part(tmp_path):
+    """application/json parts are decoded as whole documents."""
+    path = _write_mhtml(
+        tmp_path / "page.mhtml",
+        "<html><body>nothing here</body></html>",
+        [("application/json", '[{"id": 1}, {"id": 2}]')],
+    )
+    assert MHTMLParser.extract_json_from_mhtml(str(path)) == [{"id": 1}, {"id": 2}]
+
+
+def test_extract_json_from_bytes_keeps_utf8(tmp_path):
+    """Parsing raw bytes preserves non-ASCII text in 8-bit parts."""
+    path = _write_mhtml(tmp_path / "a.mhtml", '<script>x = {"name": "Zo\u00eb"}</script>')
+    assert MHTMLParser.extract_json_from_bytes(path.read_bytes()) == [{"name": "Zo\u00eb"}]
+
+
+def test_byte_budget_blocks_until_released():
+    budget = ByteBudget(100)
+    budget.acquire(60)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        waiter = executor.submit(budget.acquire, 60)
+        assert not waiter.done() and budget.used == 60
+        budget.release(60)
+        waiter.result(timeout=5)
+    assert budget.used == 60
+    budget.release(60)
+    budget.acquire(500)  # larger than the budget, granted when nothing is held
+    assert budget.used == 500
+
+
+def test_parser_pool_indexes_every_file(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for i in range(20):
+        _write_mhtml(corpus / f"{i}.mhtml", f'<div data-x=\'{{"n": {i}}}\'></div>')
+    _write_mhtml(corpus / "broken.mhtml", "<p>x</p>")
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"), read_budget=1 << 10)
+    tool.parsers = 4
+    extract = tool.parser.extract_json_from_bytes
+
+    def extract_or_fail(data, file_path, *args):
+        if file_path.endswith("broken.mhtml"):
+            raise ValueError("unparsable")
+        return extract(data, file_path, *args)
+
+    tool.parser.extract_json_from_bytes = extract_or_fail
+    tool.index_files([str(corpus)], show_progress=False)
+    assert len(list(tool.where(["n >= 0"]))) == 20
+    assert tool.scanner.stats["errors"] == 1
+    tool.index.close()
+
+
+def test_byte_budget_close_releases_blocked_readers():
+    budget = ByteBudget(100)
+    budget.acquire(100)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        waiter = executor.submit(budget.acquire, 60)
+        budget.close()
+        waiter.result(timeout=5)
+    assert budget.used == 0
+
+
+def test_parse_file_returns_compact_text(tmp_path):
+    """Process workers hand back pre-serialized JSON, not Python objects."""
+    path = _write_mhtml(tmp_path / "a.mhtml", '<script>x = {"name": "Zoe", "n": 1}</script>')
+    assert _parse_file(str(path)) == (['{"name":"Zoe","n":1}'], None)
+
+
+def test_parse_file_enforces_size_and_part_limits(tmp_path):
+    path = _write_mhtml(tmp_path / "a.mhtml", "<p>x</p>", [("application/json", '{"id": 1}')])
+    with pytest.raises(FileLimitExceeded, match="byte limit"):
+        _parse_file(str(path), ParseLimits(max_bytes=10))
+    with pytest.raises(FileLimitExceeded, match="MIME parts"):
+        _parse_file(str(path), ParseLimits(max_parts=2))
+    assert _parse_file(str(path), ParseLimits(max_parts=3)) == (['{"id":1}'], None)
+
+
+def _spin_or_double(x):
+    if x < 0:
+        while True:
+            pass
+    if x == 0:
+        os._exit(3)
+    return x * 2
+
+
+def test_isolated_pool_survives_runaway_and_crashing_items():
+    with IsolatedPool(1, cpu_seconds=0.2) as pool:
+        outcomes = pool.submit(_spin_or_double, [1, -1, 2, 0, 3]).result(timeout=30)
+    assert [(item, status) for item, status, _ in outcomes] == [
+        (1, "ok"), (-1, "limit"), (2, "ok"), (0, "error"), (3, "ok"),
+    ]
+    assert [value for _, status, value in outcomes if status == "ok"] == [2, 4, 6]
+
+
+def test_isolated_pool_interrupt_cancels_queued_batches():
+    start = time.monotonic()
+    with pytest.raises(KeyboardInterrupt):
+        with IsolatedPool(1) as pool:
+            running = pool.submit(time.sleep, [60])
+            queued = pool.submit(time.sleep, [60])
+            while not running.running():
+                time.sleep(0.01)
+            raise KeyboardInterrupt
+    assert time.monotonic() - start < 30
+    assert queued.cancelled()
+    with pytest.raises(RuntimeError):
+        running.result(timeout=0)
+
+
+def test_bounded_map_limits_in_flight_work():
+    """Items are pulled from the producer only as slots free up."""
+    pulled = []
+
+    def produce():
+        for i in range(20):
+            pulled.append(i)
+            yield i
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = []
+        for item, future in _bounded_map(executor, lambda x: x * 2, _prefetch(produce(), 4), 3):
+            results.append(future.result())
+            assert len(pulled) - len(results) <= 3 + 4 + 1
+    assert sorted(results) == [i * 2 for i in range(20)]
+
+
+def test_bounded_map_ordered_keeps_submission_order():
+    def slow_first(x):
+        time.sleep(0.05 if x == 0 else 0)
+        return x
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        items = [item for item, _ in _bounded_map(executor, slow_first, range(8), 4, ordered=True)]
+    assert items == list(range(8))
+
+
+def test_sqlite_index_batches_writes_in_wal_mode(tmp_path):
+    files = [_write_mhtml(tmp_path / f"{i}.mhtml", "<html></html>") for i in range(5)]
+    index = SQLiteIndex(str(tmp_path / "index.db"), batch_size=2, commit_interval=60)
+    for i, path in enumerate(files):
+        index.add_serialized(str(path), [f'{{"n":{i}}}'])
+    index.flush()
+
+    assert index.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert index.conn.execute("SELECT COUNT(*) FROM mhtml_files").fetchone()[0] == 5
+    assert index.conn.execute("SELECT COUNT(*) FROM json_data").fetchone()[0] == 5
+    index.close()
+
+
+def test_search_fts_ranks_and_limits(tmp_path):
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    index.begin_bulk_load()
+    for name, texts in [("a", ['{"name":"alice","city":"paris"}']),
+                        ("b", ['{"name":"bob","note":"paris paris paris"}'])]:
+        index.add_serialized(str(_write_mhtml(tmp_path / f"{name}.mhtml", "")), texts)
+    index.end_bulk_load()
+
+    # Incremental updates are indexed by triggers after the bulk rebuild
+    index.add_serialized(str(_write_mhtml(tmp_path / "c.mhtml", "")), ['{"name":"carol"}'])
+    index.flush()
+
+    results = index.search("paris", limit=1)
+    assert len(results) == 1
+    assert results[0]["file_path"].endswith("b.mhtml")
+    assert "[paris]" in results[0]["snippet"]
+    assert index.search("carol")[0]["file_path"].endswith("c.mhtml")
+    index.close()
+
+
+def test_records_are_compressed_and_stored_once(tmp_path):
+    texts = [json.dumps({"customer": {"name": f"name{i}", "city": "paris"}, "order": i, "note": "x" * 40})
+             for i in range(JSONCodec.TRAIN_RECORDS)]
+    codec = JSONCodec({2: JSONCodec.train(texts)})
+    assert all(codec.decode(codec.encode(text)) == text for text in texts[:10])
+    assert len(codec.encode(texts[0])) < len(JSONCodec().encode(texts[0])) < len(texts[0])
+
+    index = SQLiteIndex(str(tmp_path / "index.db"), compress=True)
+    shared = '{"shared":"the same record in every file"}'
+    for i in range(3):
+        index.add_serialized(str(_write_mhtml(tmp_path / f"{i}.mhtml", "")), [shared, texts[i]])
+    index.add_serialized(str(_write_mhtml(tmp_path / "many.mhtml", "")), texts)
+    index.flush()
+
+    conn = index.conn
+    assert conn.execute("SELECT COUNT(*) FROM json_refs").fetchone()[0] == 6 + len(texts)
+    assert conn.execute("SELECT COUNT(*) FROM json_blobs").fetchone()[0] == 1 + len(texts)
+    assert conn.execute("SELECT COUNT(*) FROM json_dictionaries").fetchone()[0] == 1
+    assert conn.execute("SELECT json_text FROM json_data WHERE json_hash = ?",
+                        (search.bytes_digest(shared.encode()),)).fetchone()[0] == shared
+
+    index.remove_files([str(tmp_path / f"{i}.mhtml") for i in range(3)])
+    index.flush()
+    assert conn.execute("SELECT COUNT(*) FROM json_blobs").fetchone()[0] == len(texts)
+    assert len(index.search_fts("paris", limit=None)) == len(texts)
+    index.close()
+
+
+def test_uncompressed_index_is_readable_without_the_tool(tmp_path):
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    text = json.dumps({"city": "paris", "note": "x" * 200})
+    index.add_serialized(str(_write_mhtml(tmp_path / "a.mhtml", "")), [text])
+    index.flush()
+    index.close()
+
+    conn = search.sqlite3.connect(str(tmp_path / "index.db"))
+    assert conn.execute("SELECT json_text FROM json_data").fetchall() == [(text,)]
+    assert conn.execute("SELECT COUNT(*) FROM json_fts WHERE json_fts MATCH 'paris'").fetchone()[0] == 1
+    conn.close()
+
+
+def test_version_1_index_is_migrated(tmp_path, capsys):
+    db_path = str(tmp_path / "index.db")
+    conn = search.sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE mhtml_files (id INTEGER PRIMARY KEY AUTOINCREMENT, file_path TEXT UNIQUE NOT NULL,
+                                  file_size INTEGER, modified_time REAL, indexed_time REAL, json_count INTEGER);
+        CREATE TABLE json_data (id INTEGER PRIMARY KEY AUTOINCREMENT, file_id INTEGER, json_text TEXT,
+                                json_hash TEXT);
+        CREATE VIRTUAL TABLE json_fts USING fts5(json_content, file_path, content='json_data', content_rowid='id');
+    """)
+    conn.execute("INSERT INTO mhtml_files VALUES (1, '/data/a.mhtml', 10, 1.0, 1.0, 3)")
+    conn.executemany("INSERT INTO json_data (file_id, json_text) VALUES (1, ?)",
+                     [('{"n":1,"word":"plum"}',), ('{"n":2}',), ('{"n":1,"word":"plum"}',)])
+    conn.commit()
+    conn.close()
+
+    index = SQLiteIndex(db_path)
+    # Progress notes stay out of result output
+    out, err = capsys.readouterr()
+    assert out == "" and "Upgrading index" in err
+    assert index.conn.execute("PRAGMA user_version").fetchone()[0] == SQLiteIndex.SCHEMA_VERSION
+    assert index.conn.execute("SELECT COUNT(*) FROM json_refs").fetchone()[0] == 3
+    assert index.conn.execute("SELECT COUNT(*) FROM json_blobs").fetchone()[0] == 2
+    assert [r["json_data"] for r in index.search_fts("plum")] == ['{"n":1,"word":"plum"}'] * 2
+    assert len(index.where(["n = 2"])) == 1
+    index.close()
+
+
+def test_flatten_json_types_and_paths():
+    leaves = list(flatten_json({"a": {"b": 1.5}, "tags": ["x", True], "odd key": None}))
+    assert leaves == [
+        ("$.a.b", None, 1.5, None),
+        ("$.tags[*]", "x", None, None),
+        ("$.tags[*]", None, None, 1),
+    ]
+
+
+def test_compile_predicate_picks_typed_column():
+    assert compile_predicate("age >= 25")[1] == ["$.age", 25.0]
+    assert "value_text = ?" in compile_predicate("address.city = 'Paris'")[0]
+    assert "value_bool" in compile_predicate("$.active == true")[0]
+    with pytest.raises(ValueError):
+        compile_predicate("tags[0] = x")
+
+
+def test_where_intersects_predicates_and_follows_reindex(tmp_path):
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    a = str(_write_mhtml(tmp_path / "a.mhtml", ""))
+    b = str(_write_mhtml(tmp_path / "b.mhtml", ""))
+    index.add_serialized(a, ['{"name":"ann","age":31}', '{"name":"al","age":19}'])
+    index.add_serialized(b, ['{"name":"bo","age":40,"city":"Paris"}'])
+    index.flush()
+
+    assert {r["json_data"] for r in index.where(["age > 25"])} == {
+        '{"name":"ann","age":31}', '{"name":"bo","age":40,"city":"Paris"}'}
+    assert [r["file_path"] for r in index.where(["age > 25", "city = Paris"])] == [b]
+
+    index.add_serialized(b, ['{"name":"bo","age":20}'])
+    index.flush()
+    assert index.where(["city = Paris"]) == []
+    index.close()
+
+
+def test_reindex_updates_in_place_and_purges_missing(tmp_path):
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    kept = str(_write_mhtml(tmp_path / "kept.mhtml", ""))
+    changed = str(_write_mhtml(tmp_path / "changed.mhtml", ""))
+    deleted = str(_write_mhtml(tmp_path / "deleted.mhtml", ""))
+    for path in (kept, changed, deleted):
+        index.add_serialized(path, ['{"v":1}'])
+    index.flush()
+    file_id = index.conn.execute(
+        "SELECT id FROM mhtml_files WHERE file_path = ?", (changed,)).fetchone()[0]
+
+    index.begin_scan()
+    index.mark_unchanged([kept])
+    index.add_serialized(changed, ['{"v":2}'])
+    assert index.end_scan([str(tmp_path)]) == 1
+
+    rows = index.conn.execute(
+        "SELECT f.id, f.file_path, j.json_text FROM mhtml_files f "
+        "JOIN json_data j ON j.file_id = f.id ORDER BY f.file_path").fetchall()
+    assert rows == [(file_id, changed, '{"v":2}'), (rows[1][0], kept, '{"v":1}')]
+    assert index.conn.execute("SELECT COUNT(*) FROM json_data").fetchone()[0] == 2
+    assert index.get_fingerprint(deleted) is None
+    index.close()
+
+
+def test_reindex_keeps_files_under_unreadable_directories(tmp_path, monkeypatch):
+    corpus = tmp_path / "corpus"
+    (corpus / "locked").mkdir(parents=True)
+    _write_mhtml(corpus / "locked" / "a.mhtml", '<div data-x=\'{"n": 1}\'></div>')
+    _write_mhtml(corpus / "b.mhtml", '<div data-x=\'{"n": 2}\'></div>')
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"))
+    tool.index_files([str(corpus)], show_progress=False)
+
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if os.fspath(path).endswith("locked"):
+            raise PermissionError(13, "Permission denied", os.fspath(path))
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", failing_scandir)
+    os.remove(corpus / "b.mhtml")
+    tool.index_files([str(corpus)], show_progress=False)
+    assert [r["file_path"] for r in tool.where(["n >= 0"])] == [str((corpus / "locked" / "a.mhtml").resolve())]
+    tool.index.close()
+
+
+def test_reindex_forgets_quarantined_files_that_were_deleted(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    big = _write_mhtml(corpus / "big.mhtml", '<div data-x=\'{"n": 1}\'></div>' * 50)
+    _write_mhtml(corpus / "small.mhtml", "<p>x</p>")
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"), limits=ParseLimits(max_bytes=1000))
+    tool.index_files([str(corpus)], show_progress=False)
+    assert tool.index.get_quarantined(str(big.resolve())) is not None
+
+    os.remove(big)
+    tool.index_files([str(corpus)], show_progress=False)
+    assert tool.index.get_quarantined(str(big.resolve())) is None
+    tool.index.close()
+
+
+def test_subtree_range_of_the_filesystem_root():
+    root, prefix, upper = search._subtree_range(os.sep)
+    assert prefix == os.sep and prefix <= os.path.join(os.sep, "data") < upper
+    assert search._subtree_range(os.path.join(os.sep, "data"))[1:] == (
+        os.path.join(os.sep, "data") + os.sep, os.path.join(os.sep, "data") + chr(ord(os.sep) + 1))
+
+
+def test_journal_skips_unchanged_directories(tmp_path):
+    root = tmp_path / "archive"
+    for sub in ("a", "b"):
+        (root / sub).mkdir(parents=True)
+        for i in range(2):
+            _write_mhtml(root / sub / f"{i}.mhtml", "")
+    old = 1_000_000_000
+    for directory in (root, root / "a", root / "b"):
+        os.utime(directory, (old, old))
+
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    journal = DirectoryJournal(index)
+    scanner = PlatformFileScanner(max_workers=1)
+    assert len(list(scanner.find_mhtml_files([str(root)], journal))) == 4
+    journal.commit()
+
+    assert list(scanner.find_mhtml_files([str(root)], journal)) == []
+    assert scanner.stats["dirs_skipped"] == 3
+
+    (root / "b" / "0.mhtml").unlink()
+    found = list(scanner.find_mhtml_files([str(root)], journal))
+    assert found == [str(root / "b" / "1.mhtml")]
+    assert scanner.removed_files == [str(root / "b" / "0.mhtml")]
+    index.close()
+
+
+def test_journal_retries_files_that_failed_to_index(tmp_path, monkeypatch):
+    root = tmp_path / "archive"
+    root.mkdir()
+    flaky = _write_mhtml(root / "flaky.mhtml", '<div data-x=\'{"n": 1}\'></div>')
+    _write_mhtml(root / "ok.mhtml", '<div data-x=\'{"n": 2}\'></div>')
+    old = 1_000_000_000
+    os.utime(root, (old, old))
+
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"), journal=True)
+    extract = tool.parser.extract_json_from_bytes
+
+    def failing_extract(data, file_path, *args):
+        if file_path.endswith("flaky.mhtml"):
+            raise OSError(5, "Input/output error")
+        return extract(data, file_path, *args)
+
+    monkeypatch.setattr(tool.parser, "extract_json_from_bytes", failing_extract)
+    tool.index_files([str(root)], show_progress=False)
+    assert [r["file_path"] for r in tool.where(["n >= 0"])] == [str((root / "ok.mhtml").resolve())]
+
+    monkeypatch.setattr(tool.parser, "extract_json_from_bytes", extract)
+    tool.index_files([str(root)], show_progress=False)
+    assert sorted(r["file_path"] for r in tool.where(["n >= 0"])) == [
+        str(flaky.resolve()), str((root / "ok.mhtml").resolve())]
+    tool.index.close()
+
+
+def test_adaptive_concurrency_increases_then_backs_off(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(search.time, "monotonic", lambda: clock[0])
+    controller = AdaptiveConcurrency(4, minimum=2, maximum=8)
+
+    def window(completions, latency):
+        for _ in range(completions):
+            controller.record(latency)
+        clock[0] += 1.0
+        controller.record(latency)
+
+    window(10, 0.1)   # throughput keeps up: additive increase
+    window(10, 0.1)
+    assert controller.limit == 6
+
+    window(10, 0.5)   # same throughput, latency x5: saturated
+    assert controller.limit == 4
+
+
+def test_schedule_reads_orders_by_inode_and_advises(tmp_path, monkeypatch):
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"{i}.mhtml"
+        path.write_text("x")
+        paths.append(str(path))
+    advised = []
+    monkeypatch.setattr(search, "_advise_willneed", advised.append)
+    scanner = PlatformFileScanner(max_workers=1)
+    scanner.READAHEAD = 2
+
+    ordered = list(scanner.schedule_reads(reversed(paths), "inode"))
+
+    assert ordered == sorted(paths, key=lambda p: os.stat(p).st_ino)
+    if hasattr(os, "posix_fadvise"):
+        assert advised == ordered
+
+
+def test_resume_walks_only_the_checkpoint_frontier(tmp_path):
+    root = tmp_path / "root"
+    for name in ("a/0", "a/1", "b/0", "b/c/0"):
+        path = root / f"{name}.mhtml"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_mhtml(path, "<p>x</p>")
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"))
+    checkpoint = search.IndexCheckpoint([str(root)], [str(root / "b")], [str(root / "a" / "1.mhtml")])
+    tool.index.save_checkpoint(checkpoint)
+    tool.index.flush()
+
+    tool.index_files([], show_progress=False, resume=True)
+
+    indexed = {row["file_path"] for row in tool.index.search("SELECT file_path, json_count FROM mhtml_files")}
+    assert indexed == {str(root / name) for name in ("a/1.mhtml", "b/0.mhtml", "b/c/0.mhtml")}
+    assert tool.index.load_checkpoint() is None
+    tool.index.close()
+
+
+def test_checkpoint_keeps_seen_and_removed_files_for_resume(tmp_path):
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    kept, deleted = (str(_write_mhtml(tmp_path / f"{name}.mhtml", "")) for name in ("kept", "deleted"))
+    for path in (kept, deleted):
+        index.add_serialized(path, ['{"v":1}'])
+    index.begin_scan()
+    index.mark_unchanged([kept])
+    index.save_checkpoint(search.IndexCheckpoint([str(tmp_path)], removed=["/gone.mhtml"]))
+    index.flush()
+    index.close()
+
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    assert index.load_checkpoint()[3] == ["/gone.mhtml"]
+    index.begin_scan(resume=True)
+    assert index.end_scan([str(tmp_path)]) == 1
+    assert index.get_fingerprint(kept) is not None and index.get_fingerprint(deleted) is None
+    index.close()
+
+
+def test_reopening_an_index_without_leaves_does_not_flatten_again(tmp_path, monkeypatch):
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    index.add_serialized(str(_write_mhtml(tmp_path / "a.mhtml", "")), ["{}", "[]"])
+    index.flush()
+    index.close()
+
+    flattened = []
+    monkeypatch.setattr(SQLiteIndex, "_insert_values", staticmethod(lambda conn, records: flattened.append(1)))
+    SQLiteIndex(str(tmp_path / "index.db")).close()
+    assert flattened == []
+
+
+def test_generation_counts_content_changes(tmp_path):
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    path = str(_write_mhtml(tmp_path / "a.mhtml", ""))
+    assert index.generation() == 0
+    index.add_serialized(path, ['{"a":1}'])
+    index.flush()
+    first = index.generation()
+    assert first > 0
+
+    index.begin_scan()
+    index.mark_unchanged([path])
+    assert index.end_scan([str(tmp_path)]) == 0
+    assert index.generation() == first
+
+    index.begin_scan()
+    assert index.end_scan([str(tmp_path)]) == 1
+    assert index.generation() > first
+    index.close()
+
+
+def test_parquet_snapshot_in_a_directory_with_a_quote(tmp_path):
+    assert search._sql_string("/data/o'brien") == "'/data/o''brien'"
+    pytest.importorskip("duckdb")
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    index.add_serialized(str(_write_mhtml(tmp_path / "a.mhtml", "")), ['{"age":30}'])
+    index.flush()
+
+    path = search.ParquetSnapshot(index, str(tmp_path / "o'brien")).export()
+    engine = search.DuckDBQueryEngine()
+    engine.attach_snapshot(path)
+    assert engine.query("SELECT count(*) AS n FROM mhtml_data") == [{"n": 1}]
+    index.close()
+
+
+def test_parquet_snapshot_exports_once_per_generation(tmp_path):
+    pytest.importorskip("duckdb")
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    index.add_serialized(str(_write_mhtml(tmp_path / "a.mhtml", "")), ['{"age":30}', '{"age":12}'])
+    index.flush()
+
+    snapshot = search.ParquetSnapshot(index)
+    path = snapshot.export()
+    assert snapshot.current() == path
+    assert snapshot.export() == path
+
+    engine = search.DuckDBQueryEngine()
+    engine.attach_snapshot(path)
+    assert engine.query("SELECT count(*) AS n FROM json_values WHERE value_num > 20") == [{"n": 1}]
+    assert engine.query("SELECT count(*) AS n FROM mhtml_data") == [{"n": 2}]
+    index.close()
+
+
+def test_duckdb_bulk_loader_appends_json_column_in_chunks(monkeypatch):
+    pytest.importorskip("duckdb")
+    monkeypatch.setattr(search.DuckDBBulkLoader, "CHUNK_ROWS", 2)
+    engine = search.DuckDBQueryEngine()
+    results = [
+        search.SearchResult(f"/data/{i}.mhtml", [], 10, 1.5, json_texts=[f'{{"n":{i},"tag":"t{i}"}}'] * 2)
+        for i in range(3)
+    ]
+    engine.create_temp_table(results)
+    assert engine.query("SELECT count(*) AS c FROM mhtml_data") == [{"c": 6}]
+    assert engine.query(
+        "SELECT DISTINCT file_path FROM mhtml_data WHERE CAST(json_data->>'$.n' AS INTEGER) = 2"
+    ) == [{"file_path": "/data/2.mhtml"}]
+
+
+def test_read_pool_serves_concurrent_queries_while_writing(tmp_path):
+    index = SQLiteIndex(str(tmp_path / "index.db"), batch_size=10, max_readers=3)
+    path = str(_write_mhtml(tmp_path / "a.mhtml", ""))
+    index.add_serialized(path, ['{"n":1}'])
+    index.flush()
+
+    def query(_):
+        return index.where(["n = 1"])
+
+    written = [str(_write_mhtml(tmp_path / f"new{i}.mhtml", "")) for i in range(50)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for i, new_path in enumerate(written):
+            index.add_serialized(new_path, [f'{{"n":{i + 2}}}'])
+        results = list(executor.map(query, range(40)))
+
+    assert all(r == [{"file_path": path, "json_data": '{"n":1}'}] for r in results)
+    index.flush()
+    assert [r["file_path"] for r in index.where(["n >= 2"])] == written
+    assert index._idle_readers.qsize() <= 3
+    with index._reader() as conn, pytest.raises(search.sqlite3.OperationalError):
+        conn.execute("DELETE FROM mhtml_files")
+    index.close()
+
+
+def test_search_errors_reach_the_caller(tmp_path, monkeypatch, capsys):
+    index_path = str(tmp_path / "index.db")
+    SQLiteIndex(index_path).close()
+    with pytest.raises(search.sqlite3.OperationalError):
+        list(SQLiteIndex(index_path).iter_search("SELECT missing FROM mhtml_files"))
+
+    monkeypatch.setattr(sys, "argv", ["search.py", "--index-db", index_path, "--sql", "SELECT missing FROM nowhere"])
+    with pytest.raises(SystemExit) as exited:
+        search.main()
+    out, err = capsys.readouterr()
+    assert exited.value.code == 1
+    assert "no such table" in err and "no such table" not in out
+
+
+def test_iter_search_pushes_limit_and_streams_ndjson(tmp_path, capsys):
+    index = SQLiteIndex(str(tmp_path / "index.db"), batch_size=10)
+    for i in range(5):
+        index.add_serialized(str(_write_mhtml(tmp_path / f"f{i}.mhtml", "")), [f'{{"n":{i}}}'])
+    index.flush()
+
+    query = "SELECT file_path, json_text FROM mhtml_files f JOIN json_data j ON j.file_id = f.id ORDER BY j.id"
+    rows = index.iter_search(query, limit=3, offset=1)
+    search.print_results(rows, "ndjson", 2)
+    out, err = capsys.readouterr()
+    assert [json.loads(line)["json_data"] for line in out.splitlines()] == ['{"n":1}', '{"n":2}']
+    assert "more available" in err
+
+    search.print_results(index.iter_search(query, limit=3, offset=3), "ndjson", 2)
+    out, err = capsys.readouterr()
+    assert len(out.splitlines()) == 2 and err == ""
+    index.close()
+
+
+def test_iter_search_accepts_trailing_semicolons_and_comments(tmp_path):
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    index.add_serialized(str(_write_mhtml(tmp_path / "a.mhtml", "")), ['{"n":1}'])
+    index.flush()
+
+    base = "SELECT file_path, json_text FROM mhtml_files f JOIN json_data j ON j.file_id = f.id"
+    for query in (base + ";", base + " -- every record", base + "; -- every record\n", base + " ;; /* done */"):
+        assert len(list(index.iter_search(query, limit=5))) == 1, query
+    index.close()
+
+
+def test_json_records_keep_raw_text_spans():
+    html = '<div data-x=\'{"name": "Ada", "n": 1}\'></div><script type="application/json">[{"k": "v"}]</script>'
+    records = list(MHTMLParser._iter_content_records(html))
+    assert records == [('{"name": "Ada", "n": 1}', {"name": "Ada", "n": 1}), ('{"k":"v"}', {"k": "v"})]
+
+
+def test_iter_quick_scan_filters_per_file_and_stops_at_limit(tmp_path):
+    for i in range(20):
+        _write_mhtml(tmp_path / f"f{i:02}.mhtml", f'<div data-x=\'{{"id": {i}, "tag": "{"hit" if i % 2 else "miss"}"}}\'></div>')
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"))
+    tool.duckdb = None
+
+    matches = list(tool.iter_quick_scan([str(tmp_path)], "HIT"))
+    assert sorted(json.loads(m["json_data"])["id"] for m in matches) == list(range(1, 20, 2))
+
+    assert len(list(tool.iter_quick_scan([str(tmp_path)], "hit", limit=3))) == 3
+    assert len(list(tool.iter_quick_scan([str(tmp_path)], "hit", limit=3, offset=8))) == 2
+    tool.index.close()
+
+
+def test_quick_scan_limit_shuts_the_process_pool_down(tmp_path, monkeypatch):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for i in range(100):
+        _write_mhtml(corpus / f"{i}.mhtml", f'<div data-x=\'{{"word": "plum", "n": {i}}}\'></div>')
+    workers = []
+
+    class RecordingPool(search.ProcessPoolExecutor):
+        def shutdown(self, *args, **kwargs):
+            workers.extend((self._processes or {}).values())
+            super().shutdown(*args, **kwargs)
+
+    monkeypatch.setattr(search, "ProcessPoolExecutor", RecordingPool)
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"), processes=2)
+    assert len(list(tool.iter_quick_scan([str(corpus)], "plum", limit=1))) == 1
+    assert workers and not any(process.is_alive() for process in workers)
+    tool.index.close()
+
+
+def test_quick_scan_matches_the_serialized_text(tmp_path):
+    path = str(_write_mhtml(tmp_path / "a.mhtml", '<div data-x=\'{"name": "Caf\\u00e9", "n": 1}\'></div><div data-y=\'{"k":"v"}\'></div>'))
+
+    def found(query):
+        return [m["json_data"] for m in search._scan_files_matching([path], query)]
+
+    assert found("café") == ['{"name":"Café","n":1}']
+    assert found('"n":1') == ['{"name":"Café","n":1}']
+    assert found("caf") == ['{"name":"Café","n":1}']
+    assert found("v") == ['{"k":"v"}']
+
+
+def test_sharded_index_routes_writes_and_merges_queries(tmp_path):
+    db_path = str(tmp_path / "index.db")
+    index = search.ShardedIndex(db_path, shards=3, batch_size=5)
+    paths = []
+    for i in range(12):
+        path = str(_write_mhtml(tmp_path / f"f{i:02}.mhtml", ""))
+        paths.append(path)
+        index.add_serialized(path, [json.dumps({"n": i, "text": "apple " * (i + 1)})])
+    index.flush()
+
+    assert len({index.shard_for(path) for path in paths}) > 1
+    assert sum(1 for _ in index.iter_search("SELECT file_path, json_text FROM json_data j "
+                                            "JOIN mhtml_files f ON f.id = j.file_id")) == 12
+    assert len(index.where(["n >= 4"], limit=5)) == 5
+    for query in ("SELECT file_path FROM mhtml_files ORDER BY file_size DESC LIMIT 3",
+                  "SELECT count(*) FROM json_data"):
+        with pytest.raises(ValueError):
+            index.iter_search(query)
+
+    ranked = index.search_fts("apple", limit=4)
+    best = index.search_fts("apple")
+    assert [r["score"] for r in ranked] == sorted(r["score"] for r in best)[:4]
+    assert index.get_fingerprint(paths[3]) is not None
+    index.close()
+
+    reopened = search.ShardedIndex(db_path)
+    assert len(reopened.shards) == 3 and reopened.generation() > 0
+    with pytest.raises(ValueError):
+        search.ShardedIndex(db_path, shards=2)
+    reopened.close()
+
+
+def test_partial_indexes_merge_into_one(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for i in range(10):
+        _write_mhtml(corpus / f"f{i}.mhtml", f'<div data-x=\'{{"n": {i}, "word": "pear"}}\'></div>')
+
+    partials = []
+    for part in range(2):
+        tool = search.MHTMLSearchTool(str(tmp_path / f"part{part}.db"), part=(part, 2))
+        tool.index_files([str(corpus)], show_progress=False)
+        tool.index.close()
+        partials.append(str(tmp_path / f"part{part}.db"))
+
+    merged = SQLiteIndex(str(tmp_path / "merged.db"))
+    assert merged.merge(partials) == 10
+    assert merged.merge(partials[:1]) > 0
+    assert sorted(json.loads(r["json_data"])["n"] for r in merged.where(["n >= 0"])) == list(range(10))
+    assert len(merged.search_fts("pear")) == 10
+    merged.close()
+
+
+def test_merge_refuses_non_indexes_and_reports_failed_copies(tmp_path):
+    other = tmp_path / "other.db"
+    conn = search.sqlite3.connect(str(other))
+    conn.execute("CREATE TABLE notes (body TEXT)")
+    conn.commit()
+    conn.close()
+    broken = SQLiteIndex(str(tmp_path / "broken.db"))
+    broken.add_serialized(str(_write_mhtml(tmp_path / "a.mhtml", "")), ['{"n":1}'])
+    broken.flush()
+    broken.close()
+    conn = search.sqlite3.connect(str(tmp_path / "broken.db"))
+    conn.execute("DROP TABLE json_values")
+    conn.commit()
+    conn.close()
+
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    with pytest.raises(ValueError):
+        index.merge([str(other)])
+    conn = search.sqlite3.connect(str(other))
+    assert [name for (name,) in conn.execute("SELECT name FROM sqlite_master")] == ["notes"]
+    conn.close()
+
+    with pytest.raises(search.sqlite3.OperationalError):
+        index.merge([str(tmp_path / "broken.db")])
+    assert index.is_empty()
+    index.close()
+
+
+def test_snapshot_import_relocates_and_reconciles(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    for i in range(4):
+        _write_mhtml(source / f"f{i}.mhtml", f'<div data-x=\'{{"n": {i}}}\'></div>')
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"))
+    tool.index_files([str(source)], show_progress=False)
+    manifest = tool.export_snapshot(str(tmp_path / "snap.tar.gz"))
+    tool.index.close()
+    assert manifest["roots"] == [str(source.resolve())]
+    assert manifest["fingerprints"]["files"] == 4
+
+    moved = tmp_path / "moved"
+    shutil.copytree(source, moved)
+    _write_mhtml(moved / "f0.mhtml", '<div data-x=\'{"n": 100}\'></div>')
+    os.utime(moved / "f0.mhtml", (1, 1))
+
+    bootstrapped = search.MHTMLSearchTool(str(tmp_path / "new.db"))
+    bootstrapped.import_snapshot(str(tmp_path / "snap.tar.gz"), [str(moved)])
+    assert bootstrapped.scanner.stats["files_processed"] == 1
+    assert sorted(json.loads(r["json_data"])["n"] for r in bootstrapped.where(["n >= 0"])) == [1, 2, 3, 100]
+    with pytest.raises(FileExistsError):
+        bootstrapped.import_snapshot(str(tmp_path / "snap.tar.gz"))
+    bootstrapped.index.close()
+
+
+def test_relocate_from_the_filesystem_root(tmp_path):
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    path = _write_mhtml(tmp_path / "a.mhtml", "")
+    index.add_serialized(str(path), ['{"n":1}'])
+    index.flush()
+    index.close()
+
+    moved = os.path.join(os.sep, "mnt", "copy")
+    search.IndexSnapshot._relocate(str(tmp_path / "index.db"), [(os.sep, moved)])
+    index = SQLiteIndex(str(tmp_path / "index.db"))
+    assert index.get_fingerprint(os.path.join(moved, str(path).lstrip(os.sep))) is not None
+    index.close()
+
+
+def test_query_cache_serves_repeats_until_the_index_changes(tmp_path):
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"), cache_size=1 << 20)
+    path = str(_write_mhtml(tmp_path / "a.mhtml", ""))
+    tool.index.add_serialized(path, ['{"n":1,"word":"plum"}'])
+    tool.index.flush()
+
+    first = list(tool.iter_search("plum OR pear", limit=5))
+    assert list(tool.iter_search("plum   OR\n pear ", limit=5)) == first
+    assert list(tool.iter_where(["n  = 1"], limit=5)) == list(tool.iter_where(["n = 1"], limit=5))
+    assert (tool.cache.hits, tool.cache.misses) == (2, 2)
+
+    tool.index.add_serialized(str(_write_mhtml(tmp_path / "b.mhtml", "")), ['{"n":2,"word":"plum"}'])
+    tool.index.flush()
+    assert len(list(tool.iter_search("plum", limit=5))) == 2
+    assert tool.cache.misses == 3
+    tool.index.close()
+
+
+def test_query_cache_bypasses_volatile_sql(tmp_path):
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"), cache_size=1 << 20)
+    tool.index.add_serialized(str(_write_mhtml(tmp_path / "a.mhtml", "")), ['{"n":1}'])
+    tool.index.flush()
+
+    for query in ("SELECT id, random() AS r FROM mhtml_files",
+                  "SELECT id, datetime('now') AS t FROM mhtml_files",
+                  "SELECT id, CURRENT_TIMESTAMP AS t FROM mhtml_files"):
+        list(tool.iter_search(query, limit=5))
+        list(tool.iter_search(query, limit=5))
+    assert tool.cache is None or tool.cache.hits == 0
+    assert search.QueryCache.cacheable("SELECT * FROM json_data WHERE json_text LIKE '%randomly%'")
+    tool.index.close()
+
+
+def test_query_cache_skips_failed_streams_and_unopenable_files(tmp_path, capsys):
+    tool = search.MHTMLSearchTool(str(tmp_path / "index.db"), cache_size=1 << 20)
+
+    def failing():
+        yield {"n": 1}
+        yield {"n": 2}
+        raise sqlite3.OperationalError("interrupted")
+
+    with pytest.raises(sqlite3.OperationalError):
+        list(tool._cached("sqlite", "q", [], failing, None))
+    key = tool.cache.key("sqlite", "q", [], tool.index.generation())
+    assert tool.cache.get(key) is None
+    tool.index.close()
+
+    (tmp_path / "other.db.cache").mkdir()
+    tool = search.MHTMLSearchTool(str(tmp_path / "other.db"), cache_size=1 << 20)
+    assert list(tool._cached("sqlite", "q", [], lambda: iter([{"n": 1}]), None)) == [{"n": 1}]
+    assert tool.cache is None and not tool.cache_size
+    assert "Query cache unavailable" in capsys.readouterr().err
+    tool.index.close()
+
+
+def test_query_cache_evicts_least_recently_used(tmp_path):
+    cache = search.QueryCache(str(tmp_path / "cache.db"), max_bytes=1 << 20, identity="a")
+    rows = [{"blob": os.urandom(600).hex()}]
+    assert cache.put("k1", 1, rows)
+    # Room for exactly four entries
+    cache.max_bytes = 4 * cache.conn.execute("SELECT size FROM query_cache").fetchone()[0]
+    for key in ("k2", "k3", "k4"):
+        assert cache.put(key, 1, rows)
+    assert cache.get("k1") == rows
+    cache.put("k5", 1, rows)
+    assert cache.get("k2") is None
+    assert cache.get("k1") == rows
+
+    cache.put("k6", 2, rows)
+    assert cache.get("k5") is None
+    cache.close()
+    assert search.QueryCache(str(tmp_path / "cache.db"), 1 << 20, identity="b").get("k6") is None
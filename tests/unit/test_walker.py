@@ -0,0 +1,118 @@
+"""Unit tests for the parallel directory walker."""
+import os
+
+import pytest
+
+from qra.walker import ParallelWalker, _bind_mounts
+
+
+def _touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("x")
+    return path
+
+
+def test_walk_finds_matching_files_in_parallel(tmp_path):
+    expected = {
+        str(_touch(tmp_path / f"d{i}" / f"s{j}" / f"{i}-{j}.mhtml"))
+        for i in range(5)
+        for j in range(4)
+    }
+    _touch(tmp_path / "d0" / "notes.txt")
+
+    walker = ParallelWalker((".mhtml",), workers=4)
+    found = {entry.path for entry, _ in walker.walk([str(tmp_path)])}
+
+    assert found == expected
+
+
+def test_walk_honours_max_depth_and_hidden_dirs(tmp_path):
+    top = _touch(tmp_path / "top.MHTML")
+    child = _touch(tmp_path / "a" / "child.mhtml")
+    _touch(tmp_path / "a" / "b" / "deep.mhtml")
+    _touch(tmp_path / ".hidden" / "secret.mhtml")
+
+    walker = ParallelWalker((".mhtml",), max_depth=1, skip_hidden=True)
+    found = {(entry.path, depth) for entry, depth in walker.walk([str(tmp_path)])}
+
+    assert found == {(str(top), 0), (str(child), 1)}
+
+
+def test_walk_dedupes_links_and_skips_symlink_loops(tmp_path):
+    original = _touch(tmp_path / "a" / "page.mhtml")
+    os.link(original, tmp_path / "a" / "copy.mhtml")
+    os.symlink(tmp_path / "a", tmp_path / "a" / "loop")
+
+    aliases = []
+    walker = ParallelWalker(
+        (".mhtml",),
+        follow_symlinks=True,
+        dedupe=True,
+        onalias=lambda alias, first: aliases.append((alias, first)),
+    )
+    found = [entry.path for entry, _ in walker.walk([str(tmp_path)])]
+
+    assert len(found) == 1
+    assert len(aliases) == 1
+    assert set(aliases[0]) | set(found) == {
+        str(original),
+        str(tmp_path / "a" / "copy.mhtml"),
+    }
+    assert walker.loops == 1
+
+
+def test_walk_reraises_callback_errors_without_hanging(tmp_path):
+    _touch(tmp_path / "a" / "page.mhtml")
+    _touch(tmp_path / "b" / "page.mhtml")
+
+    def ondir(path, file_paths, subdirs):
+        if path.endswith("a"):
+            raise RuntimeError("callback failed")
+
+    walker = ParallelWalker((".mhtml",), workers=2, ondir=ondir)
+    with pytest.raises(RuntimeError, match="callback failed"):
+        list(walker.walk([str(tmp_path)]))
+
+
+def test_walk_resolves_links_by_path_and_remembers_only_shared_inodes(tmp_path):
+    root = tmp_path / "root"
+    for i in range(5):
+        _touch(root / "real" / f"{i}.mhtml")
+    os.symlink(root / "real", root / "link")
+    os.symlink(root / "real" / "0.mhtml", root / "single.mhtml")
+    outside = _touch(tmp_path / "outside" / "o.mhtml")
+    os.symlink(outside.parent, root / "out1")
+    os.symlink(outside.parent, root / "out2")
+
+    aliases = {}
+    seen = {}
+    walker = ParallelWalker(
+        (".mhtml",),
+        follow_symlinks=True,
+        dedupe=True,
+        seen=seen,
+        onalias=lambda alias, first: aliases.setdefault(alias, first),
+    )
+    found = sorted(entry.path for entry, _ in walker.walk([str(root)]))
+
+    real = root / "real"
+    assert sorted(p for p in found if "out" not in p) == [
+        str(root / "real" / f"{i}.mhtml") for i in range(5)
+    ]
+    assert len([p for p in found if "out" in p]) == 1
+    assert aliases[str(root / "link" / "3.mhtml")] == str(real / "3.mhtml")
+    assert aliases[str(root / "single.mhtml")] == str(real / "0.mhtml")
+    assert len(aliases) == 7
+    # Only the directory outside the walk, reached twice, is remembered
+    assert len(seen) == 1
+
+
+def test_bind_mounts_map_mount_points_to_their_source(tmp_path):
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text(
+        "20 1 8:1 / / rw - ext4 /dev/sda1 rw\n"
+        "21 20 8:2 / /data rw - ext4 /dev/sda2 rw\n"
+        "22 20 8:2 /archive/2024 /mnt/my\\040docs rw - ext4 /dev/sda2 rw\n"
+        "23 20 0:22 / /proc rw - proc proc rw\n"
+    )
+    assert _bind_mounts(str(mountinfo)) == {"/mnt/my docs": "/data/archive/2024"}